@@ -4,31 +4,135 @@ import sys
 import mypl_lexer
 import mypl_parser
 import mypl_error
-import mypl_ast
+import mypl_util
 import mypl_type_checker
+import mypl_resolver
 import mypl_interpreter
 
-def main(filename):
-    try:
-        file_stream = open(filename, 'r')
+# (the modules behind the options are only imported when the option is used, most
+# runs start a small program and don't need them)
 
+# lex, parse, type check and resolve a program, with flat the AST is kept in arrays
+def front_end(file_stream, jobs=None, flat=False):
+    if jobs is not None:
+        source = file_stream if isinstance(file_stream, (bytes, bytearray)) else file_stream.read()
+        if isinstance(source, bytes):
+            source = source.decode()
+        import mypl_parallel
+        stmt_list = mypl_parallel.parse(source, jobs)
+        if flat:
+            import mypl_flat_ast
+            stmt_list = mypl_flat_ast.flatten(stmt_list).stmt_list()
+    else:
         p = mypl_parser.Parser(mypl_lexer.Lexer(file_stream))
-        stmt_list = p.parse()
+        if flat:
+            import mypl_flat_ast
+            stmt_list = mypl_flat_ast.parse(p).stmt_list()
+        else:
+            stmt_list = p.parse()
+
+    stmt_list.accept(mypl_type_checker.TypeChecker())
+    stmt_list.accept(mypl_resolver.Resolver())
+    return stmt_list
+
+def main(filename, mapped=False, jobs=None, cache=False, cache_dir=None, flat=False,
+         engine='interpreter', dump_python=None, optimize=0, print_ast=False):
+    try:
+        if mapped:
+            file_stream = mypl_util.map_source(filename)
+        else:
+            file_stream = mypl_util.open_source(filename)
+
+        # (stdin has no cache file)
+        if (cache or cache_dir is not None) and filename != '-':
+            import mypl_cache
+            stmt_list = mypl_cache.load(filename, file_stream,
+                                        lambda stream: front_end(stream, jobs, flat), cache_dir)
+        else:
+            stmt_list = front_end(file_stream, jobs, flat)
 
-        stmt_list.accept(mypl_type_checker.TypeChecker())
-        stmt_list.accept(mypl_interpreter.Interpreter())
+        if optimize > 0:
+            import mypl_optimizer
+            if optimize > 1:
+                stmt_list.accept(mypl_optimizer.LoopOptimizer())
+            else:
+                stmt_list.accept(mypl_optimizer.Optimizer())
+            stmt_list.accept(mypl_resolver.Resolver()) # (statements moved)
+
+        if print_ast:
+            import mypl_ast_printer
+            stmt_list.accept(mypl_ast_printer.ASTPrintVisitor(sys.stdout))
+        elif dump_python is not None:
+            import mypl_python
+            source = mypl_python.transpile(stmt_list, filename)
+            if dump_python == '-':
+                sys.stdout.write(source)
+            else:
+                with open(dump_python, 'w') as f:
+                    f.write(source)
+        elif engine == 'closures':
+            import mypl_compiler
+            mypl_compiler.run(stmt_list)
+        elif engine == 'python':
+            import mypl_python
+            mypl_python.run(stmt_list, filename)
+        elif engine == 'vm':
+            import mypl_vm
+            mypl_vm.run(stmt_list)
+        else:
+            stmt_list.accept(mypl_interpreter.Interpreter())
     except IOError as e:
         print("error: unable to open file '"+filename+"'")
         sys.exit(1)
     except mypl_error.Error as e:
         print(e)
         sys.exit(1)
+    except SyntaxError as e: # (from dump_python)
+        print("error: " + e.msg)
+        sys.exit(1)
     except KeyboardInterrupt as e:
         sys.exit(0)
 
+def parse_args(argv):
+    # just a source file is by far the most common, and doesn't need argparse
+    if len(argv) == 1 and (argv[0] == '-' or not argv[0].startswith('-')):
+        return argv[0], {}
+
+    import argparse
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('filename', metavar='source-code-file', help='(or - to read from stdin)')
+    arg_parser.add_argument('--mmap', action='store_true', help='lex the file in place through a memory map')
+    arg_parser.add_argument('-j', '--jobs', type=int, metavar='N',
+                            help='lex and parse in N processes (0 for one per CPU)')
+    arg_parser.add_argument('--cache', action='store_true',
+                            help='keep the checked program in a .myplc file next to the source, '
+                                 'and use it while the source is unchanged')
+    arg_parser.add_argument('--cache-dir', metavar='DIR',
+                            help='like --cache, but keep the .myplc files in DIR')
+    arg_parser.add_argument('--flat', action='store_true',
+                            help='keep the AST in flat arrays instead of objects (for huge programs)')
+    arg_parser.add_argument('--engine', choices=('interpreter', 'closures', 'python', 'vm'),
+                            default='interpreter',
+                            help='run the program by walking the AST (interpreter), or compile it '
+                                 'to Python closures (closures), to Python source (python) or to '
+                                 'bytecode (vm) first, faster for long running programs')
+    arg_parser.add_argument('--dump-python', metavar='FILE',
+                            help='write the Python source the program transpiles to into FILE (- for '
+                                 'stdout) instead of running it, FILE runs with python from this directory')
+    arg_parser.add_argument('-O', '--optimize', type=int, choices=(0, 1, 2), default=0, metavar='LEVEL',
+                            help='optimization level: 0 (the default) runs the program as written, 1 '
+                                 'folds constants and removes branches that never run, 2 also moves '
+                                 'work out of loops and computes repeated expressions once')
+    arg_parser.add_argument('--print-ast', action='store_true',
+                            help='print the AST that would run (optimized, with -O) instead of running it')
+    args = arg_parser.parse_args(argv)
+    if args.optimize > 0 and args.flat:
+        arg_parser.error('-O rewrites the AST, it can\'t be used with --flat')
+    return args.filename, {'mapped': args.mmap, 'jobs': args.jobs, 'cache': args.cache,
+                           'cache_dir': args.cache_dir, 'flat': args.flat, 'engine': args.engine,
+                           'dump_python': args.dump_python, 'optimize': args.optimize,
+                           'print_ast': args.print_ast}
+
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print('usage:', sys.argv[0], 'source-code-file')
-        sys.exit(1)
-    else:
-        main(sys.argv[1])
\ No newline at end of file
+    filename, options = parse_args(sys.argv[1:])
+    main(filename, **options)
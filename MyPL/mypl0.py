@@ -5,10 +5,11 @@ import sys
 import mypl_token
 import mypl_lexer
 import mypl_error
+import mypl_util
 
 def main(filename):
     try:
-        my_stream = open(filename, 'r')
+        my_stream = mypl_util.open_source(filename)
         my_lexer  = mypl_lexer.Lexer(my_stream)
 
         t = my_lexer.next_token()
@@ -31,7 +32,7 @@ def main(filename):
 
 if __name__ == '__main__':
     if len(sys.argv) != 2:
-        print('usage:', sys.argv[0], 'source-code-file')
+        print('usage:', sys.argv[0], 'source-code-file (or - to read from stdin)')
         sys.exit(1)
     else:
         main(sys.argv[1])
\ No newline at end of file
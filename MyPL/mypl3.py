@@ -5,12 +5,13 @@ import sys
 import mypl_lexer
 import mypl_parser
 import mypl_error
+import mypl_util
 import mypl_ast
 import mypl_type_checker
 
 def main(filename):
     try:
-        file_stream = open(filename, 'r')
+        file_stream = mypl_util.open_source(filename)
 
         the_parser = mypl_parser.Parser(mypl_lexer.Lexer(file_stream))
         stmt_list = the_parser.parse()
@@ -26,7 +27,7 @@ def main(filename):
 
 if __name__ == '__main__':
     if len(sys.argv) != 2:
-        print('usage:', sys.argv[0], 'source-code-file')
+        print('usage:', sys.argv[0], 'source-code-file (or - to read from stdin)')
         sys.exit(1)
     else:
         main(sys.argv[1])
\ No newline at end of file
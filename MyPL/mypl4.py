@@ -0,0 +1,33 @@
+#!python3
+# This script compiles the program to bytecode and outputs the instructions
+
+import sys
+import mypl_lexer
+import mypl_parser
+import mypl_error
+import mypl_util
+import mypl_type_checker
+import mypl_vm
+
+def main(filename):
+    try:
+        file_stream = mypl_util.open_source(filename)
+
+        the_parser = mypl_parser.Parser(mypl_lexer.Lexer(file_stream))
+        stmt_list = the_parser.parse()
+        stmt_list.accept(mypl_type_checker.TypeChecker())
+
+        mypl_vm.disassemble(mypl_vm.compile_program(stmt_list))
+    except IOError as e:
+        print("error: unable to open file '"+filename+"'")
+        sys.exit(1)
+    except mypl_error.Error as e:
+        print(e)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage:', sys.argv[0], 'source-code-file (or - to read from stdin)')
+        sys.exit(1)
+    else:
+        main(sys.argv[1])
@@ -1,31 +1,36 @@
 #!python3
-print_visitor = None
 # BASE --------------------------------------------------------------------------------
 
 class ASTNode:
     """The base class for the abstract syntax tree."""
-    def accept(self, visitor): pass
+    __slots__ = ()
+
+    # name of the Visitor function that visits this kind of node
+    visit_name = None
+
+    def accept(self, visitor):
+        return visitor.visit(self)
 
     """Get first token of this node"""
     def first_token(self): pass
 
 class Stmt(ASTNode):
     """The base class for all statement nodes."""
-    def accept(self, visitor): pass
+    __slots__ = ()
 
     """Get first token of this node"""
     def first_token(self): pass
 
 class Expr(ASTNode):
     """The base class for all expression nodes."""
-    def accept(self, visitor): pass
+    __slots__ = ()
 
     """Get first token of this node"""
     def first_token(self): pass
 
 class BoolExpr(ASTNode):
     """The base class for Boolean (expression) nodes."""
-    def accept(self, visitor): pass
+    __slots__ = ()
 
     """Get first token of this node"""
     def first_token(self): pass
@@ -35,11 +40,13 @@ class BoolExpr(ASTNode):
 class StmtList(ASTNode):
     """A statement list consists of a list of statements."""
 
-    def __init__(self):
-        self.stmts = [] # list of Stmt
+    __slots__ = ('stmts', 'size')
 
-    def accept(self, visitor):
-        visitor.visit_stmt_list(self)
+    visit_name = 'visit_stmt_list'
+
+    def __init__(self, stmts=None):
+        self.stmts = [] if stmts is None else stmts # list of Stmt
+        self.size = None # number of variables in its environment, set by the resolver
 
     def first_token(self):
         if len(self.stmts) == 0:
@@ -51,13 +58,14 @@ class StmtList(ASTNode):
 class PrintStmt(Stmt):
     """A print statement consists of a expression to print."""
 
-    def __init__(self):
-        self.expr = None # an Expr node
-        self.which = None # a PRINT or PRINTLN node
-        self.is_println = False
+    __slots__ = ('expr', 'which', 'is_println')
 
-    def accept(self, visitor):
-        visitor.visit_print_stmt(self)
+    visit_name = 'visit_print_stmt'
+
+    def __init__(self, expr=None, which=None, is_println=False):
+        self.expr = expr # an Expr node
+        self.which = which # a PRINT or PRINTLN node
+        self.is_println = is_println
 
     def first_token(self):
         return self.which
@@ -65,13 +73,14 @@ class PrintStmt(Stmt):
 class ReadExpr(Expr):
     """A read expression consists of a message string."""
 
-    def __init__(self):
-        self.expr = None # expr
-        self.which = None # a READINT or READSTR node
-        self.is_read_int = False
+    __slots__ = ('expr', 'which', 'is_read_int')
 
-    def accept(self, visitor):
-        visitor.visit_read_expr(self)
+    visit_name = 'visit_read_expr'
+
+    def __init__(self, expr=None, which=None, is_read_int=False):
+        self.expr = expr # expr
+        self.which = which # a READINT or READSTR node
+        self.is_read_int = is_read_int
 
     def first_token(self):
         return self.which
@@ -81,12 +90,13 @@ class ReadExpr(Expr):
 class LenExpr(Expr):
     """A length expression consists of something with a size"""
 
-    def __init__(self):
-        self.name = None # a LEN node
-        self.expr = None # expr
+    __slots__ = ('name', 'expr')
 
-    def accept(self, visitor):
-        visitor.visit_len_expr(self)
+    visit_name = 'visit_len_expr'
+
+    def __init__(self, name=None, expr=None):
+        self.name = name # a LEN node
+        self.expr = expr # expr
 
     def first_token(self):
         return self.name
@@ -98,13 +108,16 @@ class AssignStmt(Stmt):
     indexed), and an expression.
     """
 
-    def __init__(self):
-        self.lhs = None # Token (ID)
-        self.index_expr = None # Expr node
-        self.rhs = None # Expr node
+    __slots__ = ('lhs', 'index_expr', 'rhs', 'depth', 'slot')
 
-    def accept(self, visitor):
-        visitor.visit_assign_stmt(self)
+    visit_name = 'visit_assign_stmt'
+
+    def __init__(self, lhs=None, index_expr=None, rhs=None):
+        self.lhs = lhs # Token (ID)
+        self.index_expr = index_expr # Expr node
+        self.rhs = rhs # Expr node
+        self.depth = None # environment (0 for the outermost) and slot of the variable,
+        self.slot = None  # set by the resolver
 
     def first_token(self):
         return self.lhs
@@ -114,18 +127,19 @@ class AssignStmt(Stmt):
 class SimpleExpr(Expr):
     """A simple expression consists of a value or identifier."""
 
-    def __init__(self):
-        self.term = None # Token
-        self.negated = False
+    __slots__ = ('term', 'negated', 'depth', 'slot')
 
-    def accept(self, visitor):
-        visitor.visit_simple_expr(self)
+    visit_name = 'visit_simple_expr'
+
+    def __init__(self, term=None, negated=False):
+        self.term = term # Token
+        self.negated = negated
+        self.depth = None # environment and slot of an identifier's variable, set by
+        self.slot = None  # the resolver (None if it's undefined)
 
     def to_bool_expr(self):
-        bool_expr = SimpleBoolExpr()
-        bool_expr.expr = self
-        bool_expr.negated = self.negated
-        bool_expr.expr.negated = False
+        bool_expr = SimpleBoolExpr(self, self.negated)
+        self.negated = False
         return bool_expr
 
     def first_token(self):
@@ -134,19 +148,20 @@ class SimpleExpr(Expr):
 class IndexExpr(Expr):
     """An index expression consists of an identifier and an expression."""
 
-    def __init__(self):
-        self.identifier = None # Token (ID)
-        self.expr = None # Expr node
-        self.negated = False
+    __slots__ = ('identifier', 'expr', 'negated', 'depth', 'slot')
 
-    def accept(self, visitor):
-        visitor.visit_index_expr(self)
+    visit_name = 'visit_index_expr'
+
+    def __init__(self, identifier=None, expr=None, negated=False):
+        self.identifier = identifier # Token (ID)
+        self.expr = expr # Expr node
+        self.negated = negated
+        self.depth = None # environment and slot of the variable, set by the resolver
+        self.slot = None  # (None if it's undefined)
 
     def to_bool_expr(self):
-        bool_expr = SimpleBoolExpr()
-        bool_expr.expr = self
-        bool_expr.negated = self.negated
-        bool_expr.expr.negated = False
+        bool_expr = SimpleBoolExpr(self, self.negated)
+        self.negated = False
         return bool_expr
 
     def first_token(self):
@@ -155,13 +170,13 @@ class IndexExpr(Expr):
 class ListExpr(Expr):
     """A list expression consists of a list of elements (expressions)."""
 
-    def __init__(self):
-        super(ListExpr, self).__init__()
-        self.lbracket = None # reference point
-        self.expressions = [] # list of Expr nodes
+    __slots__ = ('lbracket', 'expressions')
 
-    def accept(self, visitor):
-        visitor.visit_list_expr(self)
+    visit_name = 'visit_list_expr'
+
+    def __init__(self, lbracket=None, expressions=None):
+        self.lbracket = lbracket # reference point
+        self.expressions = [] if expressions is None else expressions # list of Expr nodes
 
     def first_token(self):
         return self.lbracket
@@ -172,51 +187,72 @@ class ComplexExpr(Expr):
     (possibly complex) expression.
     """
 
-    def __init__(self):
-        self.first_operand = None # Expr node
-        self.rel = None # Token (+, -, *, etc.)
-        self.second_operand = None # Expr node
-
-    def accept(self, visitor):
-        visitor.visit_complex_expr(self)
+    __slots__ = ('first_operand', 'rel', 'second_operand', 'type')
 
-    def to_bool_expr(self):
-        self.accept(print_visitor)
+    visit_name = 'visit_complex_expr'
 
-        bool_expr = ComplexBoolExpr()
+    def __init__(self, first_operand=None, rel=None, second_operand=None):
+        self.first_operand = first_operand # Expr node
+        self.rel = rel # Token (+, -, *, etc.)
+        self.second_operand = second_operand # Expr node
+        self.type = None # type of the result, set by the type checker (NA if unknown)
 
-        # [<negated>] <first_expr> <bool_rel> <second_expr> [<bool_connector> <second_operand>]
-
-        bool_expr.negated = self.first_operand.negated
-        bool_expr.first_expr = self.first_operand
-        bool_expr.first_expr.negated = False
-        bool_expr.bool_rel = self.rel
-
-        right = self.second_operand
-
-        if isinstance(right, ComplexExpr):
-            bool_expr.second_expr = right.first_operand
-            bool_expr.has_bool_connector = True
-            bool_expr.bool_connector = right.rel
-            bool_expr.second_operand = right.second_operand.to_bool_expr()
-            if bool_expr.second_operand == False:
+    def to_bool_expr(self):
+        # (a loop along the chain of and/or connectors rather than recursion, the chain
+        # is as long as the condition)
+        result = None
+        previous = None
+        node = self
+        while True:
+            node.accept(_print_visitor())
+
+            bool_expr = ComplexBoolExpr()
+
+            # [<negated>] <first_expr> <bool_rel> <second_expr> [<bool_connector> <second_operand>]
+
+            bool_expr.negated = node.first_operand.negated
+            bool_expr.first_expr = node.first_operand
+            bool_expr.first_expr.negated = False
+            bool_expr.bool_rel = node.rel
+
+            if previous is None:
+                result = bool_expr
+            else:
+                previous.second_operand = bool_expr
+
+            right = node.second_operand
+
+            if isinstance(right, ComplexExpr):
+                bool_expr.second_expr = right.first_operand
+                bool_expr.has_bool_connector = True
+                bool_expr.bool_connector = right.rel
+                if isinstance(right.second_operand, ComplexExpr):
+                    previous = bool_expr
+                    node = right.second_operand
+                    continue
+                bool_expr.second_operand = right.second_operand.to_bool_expr()
+                if bool_expr.second_operand == False:
+                    return False
+            elif isinstance(right, SimpleExpr):
+                bool_expr.second_expr = right
+                bool_expr.has_bool_connector = False
+            elif isinstance(right, IndexExpr):
+                bool_expr.second_expr = right
+                bool_expr.has_bool_connector = False
+            elif isinstance(right, LenExpr):
+                bool_expr.second_expr = right
+                bool_expr.has_bool_connector = False
+            else:
                 return False
-        elif isinstance(right, SimpleExpr):
-            bool_expr.second_expr = right
-            bool_expr.has_bool_connector = False
-        elif isinstance(right, IndexExpr):
-            bool_expr.second_expr = right
-            bool_expr.has_bool_connector = False
-        elif isinstance(right, LenExpr):
-            bool_expr.second_expr = right
-            bool_expr.has_bool_connector = False
-        else:
-            return False
 
-        return bool_expr
+            return result
 
     def first_token(self):
-        return self.first_operand.first_token()
+        # (left operands can nest as deep as an expression is long)
+        node = self.first_operand
+        while isinstance(node, ComplexExpr):
+            node = node.first_operand
+        return node.first_token()
 
 # BOOLEAN EXPRESSIONS
 
@@ -225,12 +261,13 @@ class SimpleBoolExpr(BoolExpr):
     possibly negated.
     """
 
-    def __init__(self):
-        self.expr = None # Expr node
-        self.negated = False
+    __slots__ = ('expr', 'negated')
 
-    def accept(self, visitor):
-        visitor.visit_simple_bool_expr(self)
+    visit_name = 'visit_simple_bool_expr'
+
+    def __init__(self, expr=None, negated=False):
+        self.expr = expr # Expr node
+        self.negated = negated
 
     def first_token(self):
         return self.expr.first_token()
@@ -243,8 +280,12 @@ class ComplexBoolExpr(BoolExpr):
     """
 
     # [<negated>] <first_expr> <bool_rel> <second_expr> [<bool_connector> <second_operand>]
+    __slots__ = ('negated', 'first_expr', 'bool_rel', 'second_expr',
+                 'has_bool_connector', 'bool_connector', 'second_operand')
+
+    visit_name = 'visit_complex_bool_expr'
+
     def __init__(self):
-        super(ComplexBoolExpr, self).__init__()
         self.negated = False
         self.first_expr = None          # Expr node
         self.bool_rel = None            # Token (==, <=, !=, etc.)
@@ -254,13 +295,7 @@ class ComplexBoolExpr(BoolExpr):
         self.second_operand = None      # Expr node
 
     def to_simple(self):
-        simple_bool_expr = SimpleBoolExpr()
-        simple_bool_expr.negated = self.negated
-        simple_bool_expr.expr = self.first_expr
-        return simple_bool_expr
-
-    def accept(self, visitor):
-        visitor.visit_complex_bool_expr(self)
+        return SimpleBoolExpr(self.first_expr, self.negated)
 
     def first_token(self):
         return self.first_expr.first_token()
@@ -272,10 +307,12 @@ class BasicIf:
     statements (the body of the if).
     """
 
-    def __init__(self):
-        self.which = None # token
-        self.bool_expr = None # BoolExpr node
-        self.stmt_list = StmtList()
+    __slots__ = ('which', 'bool_expr', 'stmt_list')
+
+    def __init__(self, which=None, bool_expr=None, stmt_list=None):
+        self.which = which # token
+        self.bool_expr = bool_expr # BoolExpr node
+        self.stmt_list = stmt_list # StmtList node
 
     def first_token(self):
         return self.which
@@ -286,15 +323,16 @@ class IfStmt(Stmt):
     list).
     """
 
-    def __init__(self):
-        self.which = None # token
-        self.if_part = BasicIf()
-        self.elseifs = [] # list of BasicIf
-        self.has_else = False
-        self.else_stmts = StmtList()
+    __slots__ = ('which', 'if_part', 'elseifs', 'has_else', 'else_stmts')
 
-    def accept(self, visitor):
-        visitor.visit_if_stmt(self)
+    visit_name = 'visit_if_stmt'
+
+    def __init__(self, which=None, if_part=None, elseifs=None, has_else=False, else_stmts=None):
+        self.which = which # token
+        self.if_part = if_part # BasicIf
+        self.elseifs = [] if elseifs is None else elseifs # list of BasicIf
+        self.has_else = has_else
+        self.else_stmts = else_stmts # StmtList node
 
     def first_token(self):
         return self.which
@@ -306,13 +344,38 @@ class WhileStmt(Stmt):
     a statement list (the body of the while).
     """
 
-    def __init__(self):
-        self.which = None # token
-        self.bool_expr = None # a BoolExpr node
-        self.stmt_list = StmtList()
+    __slots__ = ('which', 'bool_expr', 'stmt_list')
 
-    def accept(self, visitor):
-        visitor.visit_while_stmt(self)
+    visit_name = 'visit_while_stmt'
+
+    def __init__(self, which=None, bool_expr=None, stmt_list=None):
+        self.which = which # token
+        self.bool_expr = bool_expr # a BoolExpr node
+        self.stmt_list = stmt_list # StmtList node
+
+    def first_token(self):
+        return self.which
+
+class ForStmt(Stmt):
+    """A for statement consists of a variable, the expressions it counts from,
+    to (included) and by (the step, 1 if None), and a statement list (the body of
+    the for).
+    """
+
+    __slots__ = ('which', 'var', 'start_expr', 'end_expr', 'step_expr', 'stmt_list', 'depth', 'slot')
+
+    visit_name = 'visit_for_stmt'
+
+    def __init__(self, which=None, var=None, start_expr=None, end_expr=None, step_expr=None,
+                 stmt_list=None):
+        self.which = which # token
+        self.var = var # Token (ID)
+        self.start_expr = start_expr # Expr node
+        self.end_expr = end_expr # Expr node
+        self.step_expr = step_expr # Expr node (or None)
+        self.stmt_list = stmt_list # StmtList node
+        self.depth = None # environment and slot of the variable, set by the resolver
+        self.slot = None
 
     def first_token(self):
         return self.which
@@ -322,11 +385,15 @@ class WhileStmt(Stmt):
 class Visitor:
     """The base class for AST visitors."""
 
+    def visit(self, node):
+        return getattr(self, node.visit_name)(node)
+
     def visit_stmt_list(self, stmt_list): pass
     def visit_simple_bool_expr(self, simple_bool_expr): pass
     def visit_complex_bool_expr(self, complex_bool_expr): pass
     def visit_if_stmt(self, if_stmt): pass
     def visit_while_stmt(self, while_stmt): pass
+    def visit_for_stmt(self, for_stmt): pass
     def visit_print_stmt(self, print_stmt): pass
     def visit_assign_stmt(self, assign_stmt): pass
     def visit_simple_expr(self, simple_expr): pass
@@ -336,6 +403,82 @@ class Visitor:
     def visit_complex_expr(self, complex_expr): pass
     def visit_len_expr(self, len_expr): pass
 
-import sys
-import mypl_ast_printer
-print_visitor = mypl_ast_printer.ASTPrintVisitor(sys.stdout)
\ No newline at end of file
+# code flag of generator functions (inspect.CO_GENERATOR, inspect is slow to import)
+CO_GENERATOR = 0x20
+
+class StackVisitor(Visitor):
+    """The base class for AST visitors that go through the tree without recursion.
+
+    A visit function visits a child by yielding it, instead of calling
+    child.accept(self), and picks up what the child left in the visitor (e.g. ctype)
+    once it is resumed. The visits in progress are kept on a stack of generators, so
+    the tree can be as deep as memory allows. Visit functions with no children to
+    visit can stay plain functions.
+    """
+
+    # per visitor class: node class -> visit function, for the node classes visited so
+    # far, in _leaves if the function is a plain function, in _generators if not
+    _leaves = {}
+    _generators = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._leaves = {}
+        cls._generators = {}
+
+    @classmethod
+    def _resolve(cls, node_class):
+        visit_name = getattr(node_class, 'visit_name', None)
+        if visit_name is None:
+            # (what a recursive visitor runs into on a missing child)
+            raise AttributeError("'" + node_class.__name__ + "' object has no attribute 'accept'")
+        function = getattr(cls, visit_name)
+        is_generator = bool(function.__code__.co_flags & CO_GENERATOR)
+        (cls._generators if is_generator else cls._leaves)[node_class] = function
+        return function, is_generator
+
+    def visit(self, node):
+        leaves = self._leaves
+        generators = self._generators
+
+        # the visits in progress, innermost last. The innermost one is resumed until it
+        # yields a child with a generator of its own, which is pushed, or is done.
+        stack = [iter((node,))]
+        push = stack.append
+        pop = stack.pop
+        while stack:
+            for node in stack[-1]:
+                function = leaves.get(type(node))
+                if function is not None:
+                    function(self, node)
+                    continue
+                function = generators.get(type(node))
+                if function is None:
+                    function, is_generator = self._resolve(type(node))
+                    if not is_generator:
+                        function(self, node)
+                        continue
+                push(function(self, node))
+                break
+            else:
+                pop()
+
+# PRINT VISITOR --------------------------------------------------------------------------------
+
+# print_visitor, the printer ComplexExpr.to_bool_expr shows conditions with, is only
+# made the first time it is used (e.g. to set its output_stream) rather than when
+# this module is imported
+def __getattr__(name):
+    if name == 'print_visitor':
+        global print_visitor
+        import sys
+        import mypl_ast_printer
+        print_visitor = mypl_ast_printer.ASTPrintVisitor(sys.stdout)
+        return print_visitor
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
+
+def _print_visitor():
+    try:
+        return print_visitor
+    except NameError:
+        return __getattr__('print_visitor')
\ No newline at end of file
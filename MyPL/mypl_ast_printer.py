@@ -1,8 +1,9 @@
 #!python3
 
 import mypl_ast
+from mypl_token import Token
 
-class ASTPrintVisitor(mypl_ast.Visitor):
+class ASTPrintVisitor(mypl_ast.StackVisitor):
     """An AST printer"""
     def __init__(self, output_stream):
         self.indent = 0
@@ -22,7 +23,7 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         self.indent_write("StmtList:\n")
         self.indent += 1
         for stmt in stmt_list.stmts:
-            stmt.accept(self)
+            yield stmt
         self.indent -= 1
 
     def visit_simple_bool_expr(self, simple_bool_expr):
@@ -30,7 +31,7 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         self.indent += 1
         if simple_bool_expr.negated:
             self.indent_write("NOT\n")
-        simple_bool_expr.expr.accept(self)
+        yield simple_bool_expr.expr
         self.write("\n")
         self.indent -= 1
 
@@ -39,14 +40,14 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         self.indent += 1
         if complex_bool_expr.negated:
             self.indent_write("NOT\n")
-        complex_bool_expr.first_expr.accept(self)
-        self.indent_write(complex_bool_expr.bool_rel.type)
+        yield complex_bool_expr.first_expr
+        self.indent_write(Token.NAMES[complex_bool_expr.bool_rel.type])
         self.write("\n")
-        complex_bool_expr.second_expr.accept(self)
+        yield complex_bool_expr.second_expr
         if complex_bool_expr.has_bool_connector:
-            self.indent_write(complex_bool_expr.bool_connector.type)
+            self.indent_write(Token.NAMES[complex_bool_expr.bool_connector.type])
             self.write("\n")
-            complex_bool_expr.second_operand.accept(self)
+            yield complex_bool_expr.second_operand
         self.indent -= 1
 
     def visit_if_stmt(self, if_stmt):
@@ -54,25 +55,25 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         self.indent += 1
         self.indent_write("IF:\n")
         self.indent += 1
-        if_stmt.if_part.bool_expr.accept(self)
+        yield if_stmt.if_part.bool_expr
         self.indent -= 1
         self.indent_write("THEN:\n")
         self.indent += 1
-        if_stmt.if_part.stmt_list.accept(self)
+        yield if_stmt.if_part.stmt_list
         self.indent -= 1
         for elseif in if_stmt.elseifs:
             self.indent_write("ELSEIF:\n")
             self.indent += 1
-            elseif.bool_expr.accept(self)
+            yield elseif.bool_expr
             self.indent -= 1
             self.indent_write("THEN:\n")
             self.indent += 1
-            elseif.stmt_list.accept(self)
+            yield elseif.stmt_list
             self.indent -= 1
         if if_stmt.has_else:
             self.indent_write("ELSE:\n")
             self.indent += 1
-            if_stmt.else_stmts.accept(self)
+            yield if_stmt.else_stmts
             self.indent -= 1
         self.indent -= 1
 
@@ -81,11 +82,35 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         self.indent += 1
         self.indent_write("CONDITION:\n")
         self.indent += 1
-        while_stmt.bool_expr.accept(self)
+        yield while_stmt.bool_expr
         self.indent -= 1
         self.indent_write("BODY:\n")
         self.indent += 1
-        while_stmt.stmt_list.accept(self)
+        yield while_stmt.stmt_list
+        self.indent -= 1
+        self.indent -= 1
+
+    def visit_for_stmt(self, for_stmt):
+        self.indent_write("ForStmt:\n")
+        self.indent += 1
+        self.indent_write("ID: ")
+        self.write(for_stmt.var.lexeme + "\n")
+        self.indent_write("FROM:\n")
+        self.indent += 1
+        yield for_stmt.start_expr
+        self.indent -= 1
+        self.indent_write("TO:\n")
+        self.indent += 1
+        yield for_stmt.end_expr
+        self.indent -= 1
+        if for_stmt.step_expr != None:
+            self.indent_write("STEP:\n")
+            self.indent += 1
+            yield for_stmt.step_expr
+            self.indent -= 1
+        self.indent_write("BODY:\n")
+        self.indent += 1
+        yield for_stmt.stmt_list
         self.indent -= 1
         self.indent -= 1
 
@@ -96,7 +121,7 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         else:
             self.write("PRINT\n")
         self.indent += 1
-        print_stmt.expr.accept(self)
+        yield print_stmt.expr
         self.indent -= 1
 
     def visit_assign_stmt(self, assign_stmt):
@@ -105,16 +130,16 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         if assign_stmt.index_expr != None:
             self.indent_write("INDEXED ID: ")
             self.write(assign_stmt.lhs.lexeme + "\n")
-            assign_stmt.index_expr.accept(self)
+            yield assign_stmt.index_expr
         else:
             self.indent_write("ID: ")
             self.write(assign_stmt.lhs.lexeme + "\n")
-        assign_stmt.rhs.accept(self)
+        yield assign_stmt.rhs
         self.indent -= 1
 
     def visit_simple_expr(self, simple_expr):
         self.indent_write("SimpleExpr: ")
-        tokentype = simple_expr.term.type
+        tokentype = Token.NAMES[simple_expr.term.type]
         lexeme = simple_expr.term.lexeme
         negation = "NEGATED " if simple_expr.negated else ""
 
@@ -128,14 +153,14 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         self.indent_write(negation+"INDEXED ID (")
         self.write(index_expr.identifier.lexeme)
         self.write(")\n")
-        index_expr.expr.accept(self)
+        yield index_expr.expr
         self.indent -= 1
 
     def visit_list_expr(self, list_expr):
         self.indent_write("ListExpr:\n")
         self.indent += 1
         for expr in list_expr.expressions:
-            expr.accept(self)
+            yield expr
         self.indent -= 1
 
     def visit_read_expr(self, read_expr):
@@ -145,20 +170,20 @@ class ASTPrintVisitor(mypl_ast.Visitor):
         else:
             self.write("READSTR\n")
         self.indent += 1
-        read_expr.expr.accept(self)
+        yield read_expr.expr
         self.indent -= 1
 
     def visit_complex_expr(self, complex_expr):
         self.indent_write("ComplexExpr:\n")
         self.indent += 1
-        complex_expr.first_operand.accept(self)
-        self.indent_write(complex_expr.rel.type)
+        yield complex_expr.first_operand
+        self.indent_write(Token.NAMES[complex_expr.rel.type])
         self.write("\n")
-        complex_expr.second_operand.accept(self)
+        yield complex_expr.second_operand
         self.indent -= 1
 
     def visit_len_expr(self, len_expr):
         self.indent_write("LenExpr:\n")
         self.indent += 1
-        len_expr.expr.accept(self)
+        yield len_expr.expr
         self.indent -= 1
\ No newline at end of file
@@ -0,0 +1,462 @@
+#!python3
+# This script times individual stages of the interpreter on generated programs
+
+import io
+import os
+import sys
+import time
+import subprocess
+import mypl_lexer
+import mypl_parser
+import mypl_type_checker
+import mypl_incremental
+import mypl_parallel
+import mypl_cache
+import tempfile
+import tracemalloc
+import pickle
+import mypl_ast as ast
+import mypl_flat_ast
+import mypl_resolver
+import mypl_optimizer
+import mypl_interpreter
+import mypl_compiler
+import mypl_python
+import mypl_vm
+import mypl_ast_printer
+from mypl_token import Token
+
+# Startup budget, in milliseconds: how much longer than `python -c pass` importing
+# what `mypl.py` needs to run a small program may take (see bench_startup). This
+# runs as a subprocess tens of thousands of times an hour, keep it down!
+STARTUP_BUDGET_MS = 20
+
+# HELPER FUNCTIONS
+# ------------------------------------------------------------------------------------------
+
+# run fn a few times and return the best wall-clock time, in seconds
+def best_of(fn, repeat=5):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name, seconds, count, unit):
+    print('%-24s %9.2f ms %12.0f %s/s' % (name, seconds * 1000, count / seconds, unit))
+
+def lex_all(source):
+    lexer = mypl_lexer.Lexer(io.StringIO(source))
+    count = 0
+    while lexer.next_token().type != Token.EOS:
+        count += 1
+    return count
+
+# GENERATED PROGRAMS
+# ------------------------------------------------------------------------------------------
+
+# nested while loops where every line is indented by 4 spaces per level and
+# followed by blank lines and comments
+def indented_source(blocks=400, depth=8):
+    lines = []
+    for b in range(blocks):
+        for d in range(depth):
+            pad = '    ' * d
+            lines.append(pad + '// level ' + str(d))
+            lines.append(pad + 'while x' + str(d) + ' < ' + str(b) + ' {')
+            lines.append('')
+            lines.append('')
+        pad = '    ' * depth
+        lines.append(pad + '/* body of block ' + str(b) + ' */')
+        lines.append(pad + 'x = x + 1;')
+        for d in range(depth - 1, -1, -1):
+            lines.append('    ' * d + '}')
+    return '\n'.join(lines) + '\n'
+
+# straight-line top-level statements, a few variables each assigned many times
+def statements_source(count=20000):
+    lines = ['v' + str(i) + ' = 0;' for i in range(50)]
+    for i in range(count):
+        lines.append('v' + str(i % 50) + ' = ' + str(i) + ' + v' + str((i + 1) % 50) + ';')
+    return '\n'.join(lines) + '\n'
+
+# a single list literal with count elements
+def list_source(count=100000):
+    return 'xs = [' + ', '.join(str(i) for i in range(count)) + '];\n'
+
+# one assignment of a long expression, terms alternate between strings and numbers,
+# operators cycle through ops
+def expression_source(terms=10000, ops=('+',)):
+    parts = ['"A"']
+    for i in range(1, terms):
+        parts.append(ops[i % len(ops)])
+        parts.append(str(i) if i % 2 else '"' + chr(65 + i % 26) + '"')
+    return 'x = ' + ' '.join(parts) + ';\n'
+
+# an assignment of 1 + 1 + ... with depth nested parentheses
+def parens_source(depth):
+    return 'x = ' + '(' * depth + '1' + ' + 1)' * depth + ';\n'
+
+# depth nested ifs
+def ifs_source(depth):
+    return 'x = 1;\n' + 'if x > 0 {\n' * depth + 'x = x + 1;\n' + '}\n' * depth
+
+# count variables assigned at the top level, then read and assigned again in a block
+# nested depth deep, along with variables local to the block
+def variables_source(count, depth):
+    lines = ['v' + str(i) + ' = ' + str(i) + ';' for i in range(count)]
+    lines.extend('while v0 < 0 {' for d in range(depth))
+    for i in range(count):
+        lines.append('v' + str(i) + ' = v' + str((i + 1) % count) + ' + 1;')
+        lines.append('w' + str(i) + ' = v' + str(i) + ';')
+    lines.extend('}' for d in range(depth))
+    return '\n'.join(lines) + '\n'
+
+# a loop running count times over a few arithmetic statements and an if
+def loop_source(count=20000):
+    return ('i = 0;\ns = 0;\nwhile i < ' + str(count) + ' {\n' +
+            '    s = s + i * 2 % 7;\n    if s > 100 {\n        s = s - 100;\n    }\n' +
+            '    i = i + 1;\n}\n')
+
+# the loop of loop_source as a for loop
+def for_loop_source(count=20000):
+    return ('s = 0;\nfor i = 0 to ' + str(count - 1) + ' {\n' +
+            '    s = s + i * 2 % 7;\n    if s > 100 {\n        s = s - 100;\n    }\n}\n')
+
+# a loop going through an array (made by another loop) with len(), indexing the same
+# element twice
+def array_loop_source(count=20000):
+    return ('a = [];\ni = 0;\nwhile i < ' + str(count) + ' {\n    a[] = i % 10;\n    i = i + 1;\n}\n' +
+            'k = 3;\ns = 0;\ni = 0;\nwhile i < len(a) {\n    s = s + a[i] * k + a[i] * k;\n' +
+            '    i = i + 1;\n}\n')
+
+# a program run count times over, in a loop
+def repeated_source(source, count):
+    return 'repeat = 0;\nwhile repeat < ' + str(count) + ' {\n' + source + '\nrepeat = repeat + 1;\n}\n'
+
+# number of nodes in an AST (statement lists and if parts included, tokens not) and
+# the size of the node objects themselves (with their attribute dicts and lists)
+def node_sizes(root):
+    count = 0
+    size = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        size += sys.getsizeof(node)
+        if hasattr(node, '__dict__'):
+            size += sys.getsizeof(node.__dict__)
+            values = list(vars(node).values())
+        else:
+            values = [getattr(node, name) for cls in type(node).__mro__
+                      for name in cls.__dict__.get('__slots__', ())]
+        for value in values:
+            if isinstance(value, list):
+                size += sys.getsizeof(value)
+                stack.extend(item for item in value if isinstance(item, (ast.ASTNode, ast.BasicIf)))
+            elif isinstance(value, (ast.ASTNode, ast.BasicIf)):
+                stack.append(value)
+    return count, size
+
+# BENCHMARKS
+# ------------------------------------------------------------------------------------------
+
+def bench_lexer_indented():
+    source = indented_source()
+    count = lex_all(source)
+    report('lexer (indented)', best_of(lambda: lex_all(source)), count, 'tokens')
+
+def parse_all(source):
+    return mypl_parser.Parser(mypl_lexer.Lexer(io.StringIO(source))).parse()
+
+def check_all(source):
+    stmt_list = parse_all(source)
+    stmt_list.accept(mypl_type_checker.TypeChecker())
+    return stmt_list
+
+# run fn with stdout and the print visitor going nowhere, returns what fn returns
+def quietly(fn):
+    out = ast.print_visitor.output_stream
+    with open(os.devnull, 'w') as devnull:
+        ast.print_visitor.output_stream = sys.stdout = devnull
+        try:
+            return fn()
+        finally:
+            ast.print_visitor.output_stream = out
+            sys.stdout = sys.__stdout__
+
+# change one number in the middle of the program, back and forth
+def bench_incremental_edit():
+    source = statements_source()
+    count = source.count('\n')
+    report('full check', best_of(lambda: check_all(source), 3), count, 'stmts')
+
+    document = mypl_incremental.Document(source)
+    offset = source.index('= 10000 ') + 2
+    def edit():
+        document.edit(offset, 1, '2')
+        document.edit(offset, 1, '1')
+    report('incremental edit', best_of(edit, 5) / 2, count, 'stmts')
+
+def bench_parallel_parse():
+    source = statements_source(100000)
+    count = source.count('\n')
+    report('sequential parse', best_of(lambda: parse_all(source), 1), count, 'stmts')
+    for workers in sorted({2, os.cpu_count() or 1}):
+        report('parallel parse (' + str(workers) + ')',
+               best_of(lambda: mypl_parallel.parse(source, workers), 1), count, 'stmts')
+
+# parse time per statement/element should stay flat as programs get longer
+def bench_parse_length():
+    for count in (10000, 100000, 1000000):
+        source = statements_source(count)
+        report('parse ' + str(count) + ' stmts', best_of(lambda: parse_all(source), 1), count, 'stmts')
+    for count in (1000, 10000, 100000):
+        source = list_source(count)
+        report('parse ' + str(count) + ' elements', best_of(lambda: parse_all(source), 1), count, 'elements')
+
+def bench_parse_expression():
+    for name, ops in (('+', ('+',)), ('mixed', ('+', '*', '-', '/', '<', 'and'))):
+        for terms in (1000, 10000):
+            source = expression_source(terms, ops)
+            report('expr ' + str(terms) + ' terms (' + name + ')',
+                   best_of(lambda: parse_all(source), 3), terms, 'terms')
+
+# a cold start type checks the program and writes its cache file, a warm start
+# only reads the cache file
+def bench_cache():
+    source = statements_source(100000)
+    count = source.count('\n')
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'bench.mypl')
+        with open(filename, 'w') as f:
+            f.write(source)
+        def run():
+            with open(filename) as f:
+                mypl_cache.load(filename, f, lambda stream: check_all(stream.read()))
+        report('no cache', best_of(lambda: check_all(source), 1), count, 'stmts')
+        report('cold cache', best_of(run, 1), count, 'stmts')
+        report('warm cache', best_of(run, 3), count, 'stmts')
+
+# type checking, printing, resolving and optimizing per node visited, interpreting per loop iteration
+def bench_visitors():
+    source = statements_source(50000)
+    stmt_list = parse_all(source)
+    count = node_sizes(stmt_list)[0]
+    report('type check', best_of(lambda: stmt_list.accept(mypl_type_checker.TypeChecker()), 3),
+           count, 'nodes')
+    report('print', best_of(lambda: stmt_list.accept(mypl_ast_printer.ASTPrintVisitor(io.StringIO())), 3),
+           count, 'nodes')
+    report('resolve', best_of(lambda: stmt_list.accept(mypl_resolver.Resolver()), 3), count, 'nodes')
+    report('optimize', best_of(lambda: stmt_list.accept(mypl_optimizer.Optimizer()), 3), count, 'nodes')
+
+    count = 20000
+    stmt_list = quietly(lambda: check_all(loop_source(count)))
+    report('interpret', best_of(lambda: stmt_list.accept(mypl_interpreter.Interpreter()), 3),
+           count, 'iterations')
+
+# parsing, type checking and interpreting programs nested too deep to visit recursively
+def bench_deep_nesting():
+    for depth in (1000, 10000, 100000):
+        source = parens_source(depth)
+        stmt_list = parse_all(source)
+        report('parse ' + str(depth) + ' parens', best_of(lambda: parse_all(source), 1), depth, 'levels')
+        report('check ' + str(depth) + ' parens',
+               best_of(lambda: stmt_list.accept(mypl_type_checker.TypeChecker()), 1), depth, 'levels')
+        report('run ' + str(depth) + ' parens',
+               best_of(lambda: stmt_list.accept(mypl_interpreter.Interpreter()), 1), depth, 'levels')
+    for depth in (1000, 10000, 100000):
+        source = ifs_source(depth)
+        stmt_list = quietly(lambda: parse_all(source))
+        report('parse ' + str(depth) + ' ifs',
+               best_of(lambda: quietly(lambda: parse_all(source)), 1), depth, 'levels')
+        report('check ' + str(depth) + ' ifs',
+               best_of(lambda: stmt_list.accept(mypl_type_checker.TypeChecker()), 1), depth, 'levels')
+        report('run ' + str(depth) + ' ifs',
+               best_of(lambda: quietly(lambda: stmt_list.accept(mypl_interpreter.Interpreter())), 1),
+               depth, 'levels')
+
+# the interpreter against the closure compiler, the transpiler to Python and the
+# bytecode VM per loop iteration, compiling separately
+def bench_engines():
+    count = 20000
+    loop = quietly(lambda: check_all(loop_source(count)))
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'test0.mypl')) as f:
+        test0 = quietly(lambda: check_all(repeated_source(f.read(), 2000)))
+    for name, stmt_list, count in (('loop', loop, count), ('test0', test0, 2000)):
+        report('interpret ' + name,
+               best_of(lambda: quietly(lambda: stmt_list.accept(mypl_interpreter.Interpreter())), 3),
+               count, 'iterations')
+        report('compile ' + name, best_of(lambda: mypl_compiler.compile_program(stmt_list), 3),
+               node_sizes(stmt_list)[0], 'nodes')
+        program = mypl_compiler.compile_program(stmt_list)
+        report('closures ' + name, best_of(lambda: quietly(program), 3), count, 'iterations')
+        report('transpile ' + name, best_of(lambda: mypl_python.compile_program(stmt_list), 3),
+               node_sizes(stmt_list)[0], 'nodes')
+        program = mypl_python.compile_program(stmt_list)
+        report('python ' + name, best_of(lambda: quietly(program), 3), count, 'iterations')
+        report('compile vm ' + name, best_of(lambda: mypl_vm.compile_program(stmt_list), 3),
+               node_sizes(stmt_list)[0], 'nodes')
+        program = mypl_vm.compile_program(stmt_list)
+        report('vm ' + name, best_of(lambda: quietly(lambda: mypl_vm.execute(program)), 3),
+               count, 'iterations')
+
+# running the array loop at each optimization level, and optimizing it
+def bench_optimizer():
+    count = 20000
+    for level, optimizer in ((0, None), (1, mypl_optimizer.Optimizer),
+                             (2, mypl_optimizer.LoopOptimizer)):
+        stmt_list = quietly(lambda: check_all(array_loop_source(count)))
+        if optimizer != None:
+            report('optimize -O ' + str(level), best_of(lambda: stmt_list.accept(optimizer()), 1),
+                   node_sizes(stmt_list)[0], 'nodes')
+        report('interpret -O ' + str(level),
+               best_of(lambda: quietly(lambda: stmt_list.accept(mypl_interpreter.Interpreter())), 3),
+               2 * count, 'iterations')
+        program = mypl_python.compile_program(stmt_list)
+        report('python -O ' + str(level), best_of(lambda: quietly(program), 3), 2 * count, 'iterations')
+
+# the same loop as a while and as a for, on each engine
+def bench_for_loop():
+    count = 20000
+    for name, source in (('while', loop_source(count)), ('for', for_loop_source(count))):
+        stmt_list = quietly(lambda: check_all(source))
+        report('interpret ' + name,
+               best_of(lambda: quietly(lambda: stmt_list.accept(mypl_interpreter.Interpreter())), 3),
+               count, 'iterations')
+        program = mypl_compiler.compile_program(stmt_list)
+        report('closures ' + name, best_of(lambda: quietly(program), 3), count, 'iterations')
+        program = mypl_python.compile_program(stmt_list)
+        report('python ' + name, best_of(lambda: quietly(program), 3), count, 'iterations')
+        program = mypl_vm.compile_program(stmt_list)
+        report('vm ' + name, best_of(lambda: quietly(lambda: mypl_vm.execute(program)), 3),
+               count, 'iterations')
+
+# type checking many variables, used in deeply nested blocks
+def bench_symbol_table():
+    for variables, depth in ((10000, 10), (10000, 1000), (100000, 1000)):
+        source = variables_source(variables, depth)
+        stmt_list = quietly(lambda: parse_all(source))
+        report('check ' + str(variables) + ' vars @' + str(depth),
+               best_of(lambda: stmt_list.accept(mypl_type_checker.TypeChecker()), 1),
+               variables, 'variables')
+
+# memory taken by parse(source) while it is kept, in bytes
+def traced_size(parse, source):
+    # (conditions print themselves while being parsed)
+    out = ast.print_visitor.output_stream
+    with open(os.devnull, 'w') as ast.print_visitor.output_stream:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        result = parse(source)
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    ast.print_visitor.output_stream = out
+    return result, size
+
+def parse_flat(source):
+    return mypl_flat_ast.parse(mypl_parser.Parser(mypl_lexer.Lexer(io.StringIO(source))))
+
+# memory taken by the AST of a program (tokens included), per node
+def bench_ast_memory():
+    source = statements_source(20000) + indented_source(400)
+    stmt_list, size = traced_size(parse_all, source)
+    count, node_size = node_sizes(stmt_list)
+    print('%-24s %9d nodes %9.1f bytes/node %9.1f bytes/source byte' %
+          ('ast memory', count, size / count, size / len(source)))
+    print('%-24s %9d nodes %9.1f bytes/node' % ('  nodes only', count, node_size / count))
+
+# the same program as objects and as a FlatAST: memory, pickling and type checking
+def bench_flat_ast():
+    source = (statements_source(100000) + 'x = 0;\n' +
+              ''.join('x' + str(d) + ' = 0;\n' for d in range(8)) + indented_source(400))
+    stmt_list, size = traced_size(parse_all, source)
+    flat, flat_size = traced_size(parse_flat, source)
+    count = len(flat)
+    print('%-24s %9d nodes %9.1f bytes/node' % ('objects memory', count, size / count))
+    print('%-24s %9d nodes %9.1f bytes/node' % ('flat memory', count, flat_size / count))
+
+    for name, tree in (('objects', stmt_list), ('flat', flat)):
+        data = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+        report(name + ' pickle', best_of(lambda: pickle.dumps(tree, pickle.HIGHEST_PROTOCOL), 1),
+               count, 'nodes')
+        report(name + ' unpickle', best_of(lambda: pickle.loads(data), 1), count, 'nodes')
+        print('%-24s %9.1f bytes/node' % (name + ' pickle size', len(data) / count))
+
+    report('objects check', best_of(lambda: stmt_list.accept(mypl_type_checker.TypeChecker()), 1),
+           count, 'nodes')
+    report('flat check', best_of(lambda: flat.stmt_list().accept(mypl_type_checker.TypeChecker()), 1),
+           count, 'nodes')
+
+# run python with args, returns the import times (in us) from -X importtime of the
+# modules imported at the top level, and the wall-clock time (in s)
+def python_import_times(args, stdin=''):
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None) # (as installed, compiled modules are cached)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, input=stdin,
+                            capture_output=True, text=True, env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    elapsed = time.perf_counter() - start
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '): # (nested imports are indented)
+            times[name.strip()] = int(cumulative_us)
+    return times, elapsed
+
+# import time and wall-clock time of mypl.py on a small program, over those of python
+# doing nothing, against STARTUP_BUDGET_MS
+def bench_startup(repeat=10):
+    program = 'x = 1;\nif x > 0 {\n    println("x is " + x);\n}\n'
+    python_import_times(['mypl.py', '-'], program) # (compiles the modules)
+    best = None
+    for i in range(repeat):
+        base, base_elapsed = python_import_times(['-c', 'pass'])
+        times, elapsed = python_import_times(['mypl.py', '-'], program)
+        extra = {name: us for name, us in times.items() if name not in base}
+        total = sum(extra.values()) / 1000
+        if best is None or total < best[0]:
+            best = (total, extra, elapsed - base_elapsed)
+
+    total, extra, elapsed = best
+    print('%-24s %9.2f ms (budget %d ms)' % ('startup imports', total, STARTUP_BUDGET_MS))
+    for name, us in sorted(extra.items(), key=lambda item: -item[1])[:6]:
+        print('%-24s %9.2f ms' % ('  ' + name, us / 1000))
+    print('%-24s %9.2f ms' % ('startup wall time', elapsed * 1000))
+    if total > STARTUP_BUDGET_MS:
+        sys.exit('startup imports over budget: %.2f ms > %d ms' % (total, STARTUP_BUDGET_MS))
+
+BENCHMARKS = {
+    'lexer-indented': bench_lexer_indented,
+    'incremental-edit': bench_incremental_edit,
+    'parallel-parse': bench_parallel_parse,
+    'parse-length': bench_parse_length,
+    'parse-expression': bench_parse_expression,
+    'cache': bench_cache,
+    'ast-memory': bench_ast_memory,
+    'flat-ast': bench_flat_ast,
+    'visitors': bench_visitors,
+    'deep-nesting': bench_deep_nesting,
+    'symbol-table': bench_symbol_table,
+    'engines': bench_engines,
+    'optimizer': bench_optimizer,
+    'for-loop': bench_for_loop,
+    'startup': bench_startup,
+}
+
+def main(names):
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    for name in sys.argv[1:]:
+        if name not in BENCHMARKS:
+            print('usage:', sys.argv[0], '[' + ' | '.join(BENCHMARKS) + '] ...')
+            sys.exit(1)
+    main(sys.argv[1:])
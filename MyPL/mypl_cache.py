@@ -0,0 +1,141 @@
+#!python3
+# On-disk cache of type checked programs (.myplc files), so a program that is run
+# again unchanged skips lexing, parsing and type checking
+
+import gc
+import io
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+
+import mypl_ast as ast
+
+# Extension of cache files, a cache file is kept next to its source file
+# (prog.mypl -> prog.myplc) unless a cache directory is given
+EXTENSION = '.myplc'
+
+MAGIC = b'MYPLC\n'
+
+# Modules whose code decides what the cached AST looks like and whether it type
+# checks, changing any of them (or the Python version) invalidates every cache file
+FRONT_END_MODULES = ('mypl_token', 'mypl_lexer', 'mypl_parser', 'mypl_ast',
+                     'mypl_type_checker', 'mypl_symbol_table', 'mypl_resolver', 'mypl_error',
+                     'mypl_flat_ast', 'mypl_cache')
+
+_version = None
+
+def version():
+    """ Get the digest identifying this interpreter version in cache files """
+    global _version
+    if _version is None:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(('%d.%d %d' % (sys.version_info[0], sys.version_info[1],
+                                pickle.HIGHEST_PROTOCOL)).encode())
+        for name in FRONT_END_MODULES:
+            with open(sys.modules[name].__file__ if name in sys.modules else
+                      os.path.join(os.path.dirname(__file__), name + '.py'), 'rb') as f:
+                h.update(f.read())
+        _version = h.digest()
+    return _version
+
+def source_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def cache_path(filename, cache_dir=None):
+    """ Get the cache file of a source file, in cache_dir if given """
+    if cache_dir is None:
+        root, ext = os.path.splitext(filename)
+        return (root if ext == '.mypl' else filename) + EXTENSION
+
+    # different sources with the same name get different cache files
+    name = os.path.basename(filename)
+    where = hashlib.blake2b(os.path.abspath(filename).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, name + '-' + where + EXTENSION)
+
+def load(filename, file_stream, build, cache_dir=None):
+    """ Get the type checked AST of the program read from file_stream, from its cache
+    file if that is valid, otherwise by calling build(stream) and caching the result.
+
+    file_stream is either a text stream or the bytes (or memory map) of the source.
+    Anything printed while building the AST is saved with it and printed again when
+    it is loaded.
+    """
+    if isinstance(file_stream, io.TextIOBase):
+        text = file_stream.read()
+        data = text.encode()
+        file_stream = io.StringIO(text)
+    else:
+        data = file_stream
+    key = MAGIC + version() + source_digest(data)
+    path = cache_path(filename, cache_dir)
+
+    cached = _read(path, key)
+    if cached is not None:
+        output, stmt_list = cached
+        if output:
+            ast.print_visitor.output_stream.write(output)
+        return stmt_list
+
+    # (some nodes print themselves while being parsed, keep what they print)
+    out = ast.print_visitor.output_stream
+    capture = io.StringIO()
+    ast.print_visitor.output_stream = capture
+    try:
+        stmt_list = build(file_stream)
+    finally:
+        ast.print_visitor.output_stream = out
+        out.write(capture.getvalue())
+
+    _write(path, key, (capture.getvalue(), stmt_list), filename)
+    return stmt_list
+
+# run fn with the garbage collector off, pickling and unpickling the AST make no
+# cyclic garbage but the collector would keep scanning it (and the pickle memo)
+def _without_gc(fn, *args):
+    if not gc.isenabled():
+        return fn(*args)
+    gc.disable()
+    try:
+        return fn(*args)
+    finally:
+        gc.enable()
+
+def _read(path, key):
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(key)) != key:
+                return None
+            return _without_gc(pickle.load, f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+# Write the cache file under a temporary name and move it into place, so it is
+# either complete or not there at all, even with several runs at once. A cache file
+# that can't be written (read-only directory, an AST too deep to pickle) is skipped.
+# The cache file gets the permissions of the source file.
+def _write(path, key, value, filename):
+    try:
+        payload = _without_gc(pickle.dumps, value, pickle.HIGHEST_PROTOCOL)
+    except RecursionError:
+        return
+
+    directory = os.path.dirname(path) or '.'
+    try:
+        mode = os.stat(filename).st_mode & 0o666
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix='.', suffix=EXTENSION + '.tmp', dir=directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.fchmod(f.fileno(), mode)
+            f.write(key)
+            f.write(payload)
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
@@ -0,0 +1,542 @@
+#!python3
+# Closure compiler: turns a type checked program into a tree of Python closures, one
+# per node with its operator (and the kind of its operands) worked out beforehand,
+# then runs the closures instead of walking the AST like the Interpreter does
+
+import sys
+
+from mypl_util import *
+from mypl_token import *
+import mypl_ast
+import mypl_symbol_table
+
+# Recursion limit while a program runs. Closures call the closures of their children,
+# so a deeply nested program makes deep Python calls. From Python 3.11 on these don't
+# use the C stack, and the depth is only limited by memory and this.
+RECURSION_LIMIT = 1 << 20
+
+# marks an expression that is not a constant, see Compiler.constant
+NOT_CONSTANT = object()
+
+def compile_program(stmt_list):
+    """ Compile a type checked program, returns a function that runs it """
+    compiler = Compiler()
+    stmt_list.accept(compiler)
+    return compiler.code
+
+def run(stmt_list):
+    """ Compile a type checked program and run it """
+    program = compile_program(stmt_list)
+    limit = sys.getrecursionlimit()
+    if sys.version_info >= (3, 11) and limit < RECURSION_LIMIT:
+        sys.setrecursionlimit(RECURSION_LIMIT)
+        try:
+            program()
+        finally:
+            sys.setrecursionlimit(limit)
+    else:
+        program()
+
+# OPERATORS
+# ------------------------------------------------------------------------------------------
+
+# The closures for <left> <op> <right>, left and right being the closures of the
+# operands. A constant right operand is taken as is (the second closure of each pair).
+
+def _add(left, right):
+    def code():
+        return left() + right()
+    return code
+
+def _add_constant(left, right):
+    def code():
+        return left() + right
+    return code
+
+def _subtract(left, right):
+    def code():
+        return left() - right()
+    return code
+
+def _subtract_constant(left, right):
+    def code():
+        return left() - right
+    return code
+
+def _multiply(left, right):
+    def code():
+        return left() * right()
+    return code
+
+def _multiply_constant(left, right):
+    def code():
+        return left() * right
+    return code
+
+def _divide(left, right):
+    def code():
+        return left() / right()
+    return code
+
+def _divide_constant(left, right):
+    def code():
+        return left() / right
+    return code
+
+def _modulus(left, right):
+    def code():
+        return left() % right()
+    return code
+
+def _modulus_constant(left, right):
+    def code():
+        return left() % right
+    return code
+
+def _concat(left, right):
+    def code():
+        return left() + cast_str(right())
+    return code
+
+# a + whose operand types weren't known to the type checker (NA)
+def _plus(left, right):
+    def code():
+        l = left()
+        r = right()
+        if type(l) is str:
+            return l + cast_str(r)
+        return l + r
+    return code
+
+def _equal(left, right):
+    def code():
+        return left() == right()
+    return code
+
+def _equal_constant(left, right):
+    def code():
+        return left() == right
+    return code
+
+def _not_equal(left, right):
+    def code():
+        return left() != right()
+    return code
+
+def _not_equal_constant(left, right):
+    def code():
+        return left() != right
+    return code
+
+def _less_than(left, right):
+    def code():
+        return left() < right()
+    return code
+
+def _less_than_constant(left, right):
+    def code():
+        return left() < right
+    return code
+
+def _greater_than(left, right):
+    def code():
+        return left() > right()
+    return code
+
+def _greater_than_constant(left, right):
+    def code():
+        return left() > right
+    return code
+
+def _less_than_equal(left, right):
+    def code():
+        return left() <= right()
+    return code
+
+def _less_than_equal_constant(left, right):
+    def code():
+        return left() <= right
+    return code
+
+def _greater_than_equal(left, right):
+    def code():
+        return left() >= right()
+    return code
+
+def _greater_than_equal_constant(left, right):
+    def code():
+        return left() >= right
+    return code
+
+# an operator the interpreter doesn't know, the operands are evaluated and then the
+# error is raised, the same as when interpreting
+def _invalid(left, right, rel):
+    def code():
+        left()
+        right()
+        rel.error("unknown or invalid operator")
+    return code
+
+# arithmetic operator -> closures for operands, for a constant right operand
+ARITHMETIC = {
+    Token.PLUS: (_add, _add_constant),
+    Token.MINUS: (_subtract, _subtract_constant),
+    Token.MULTIPLY: (_multiply, _multiply_constant),
+    Token.DIVIDE: (_divide, _divide_constant),
+    Token.MODULUS: (_modulus, _modulus_constant),
+}
+
+# comparison operator -> closures for operands, for a constant right operand
+COMPARISONS = {
+    Token.EQUAL: (_equal, _equal_constant),
+    Token.NOT_EQUAL: (_not_equal, _not_equal_constant),
+    Token.LESS_THAN: (_less_than, _less_than_constant),
+    Token.GREATER_THAN: (_greater_than, _greater_than_constant),
+    Token.LESS_THAN_EQUAL: (_less_than_equal, _less_than_equal_constant),
+    Token.GREATER_THAN_EQUAL: (_greater_than_equal, _greater_than_equal_constant),
+}
+
+class Compiler(mypl_ast.StackVisitor):
+    """Compiles a type checked AST into closures that do what the Interpreter does.
+
+    Visiting a node leaves its closure in code: statements compile to closures that
+    run the statement, expressions to closures that return the expression's value. A
+    literal also leaves its value in constant (NOT_CONSTANT for anything else), so the
+    expression using it can take the value as is.
+
+    Variables are kept in a symbol table the closures share, with the environments
+    the Interpreter would have.
+    """
+
+    def __init__(self):
+        self.sym = mypl_symbol_table.SymbolTable()
+        self.code = None
+        self.constant = NOT_CONSTANT
+
+    def visit_stmt_list(self, stmt_list):
+        stmts = []
+        declares = False
+        for stmt in stmt_list.stmts:
+            yield stmt
+            stmts.append(self.code)
+            declares = declares or isinstance(stmt, (mypl_ast.AssignStmt, mypl_ast.ForStmt))
+        stmts = tuple(stmts)
+
+        # only assignments (and fors) add variables to the statement list's environment, without
+        # any the environment would stay empty
+        if declares:
+            push_environment = self.sym.push_environment
+            pop_environment = self.sym.pop_environment
+            def code():
+                push_environment()
+                for stmt in stmts:
+                    stmt()
+                pop_environment()
+        else:
+            def code():
+                for stmt in stmts:
+                    stmt()
+        self.code = code
+
+    # HELPER FUNCTIONS
+    # ~~~~~~~~~~~~~~~~
+
+    # visit an expression, returns its closure and its constant value
+    def __expr(self, expr):
+        self.constant = NOT_CONSTANT
+        yield expr
+        return self.code, self.constant
+
+    def __set(self, code, constant=NOT_CONSTANT):
+        self.code = code
+        self.constant = constant
+
+    # PRINT/READ STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_print_stmt(self, print_stmt):
+        yield print_stmt.expr
+        expr = self.code
+        if print_stmt.is_println:
+            def code():
+                sys.stdout.write(xstr(expr()) + "\n")
+        else:
+            def code():
+                sys.stdout.write(xstr(expr()))
+        self.__set(code)
+
+    def visit_read_expr(self, read_expr):
+        yield read_expr.expr
+        msg = self.code
+        if read_expr.is_read_int:
+            def code():
+                val = input(msg())
+                try:
+                    return int(val)
+                except ValueError:
+                    return 0
+        else:
+            def code():
+                return input(msg())
+        self.__set(code)
+
+    # LEN EXPR
+    # ~~~~~~~~
+
+    def visit_len_expr(self, len_expr):
+        yield len_expr.expr
+        expr = self.code
+        def code():
+            return length(expr())
+        self.__set(code)
+
+    # ASSIGN STATEMENT
+    # ~~~~~~~~~~~~~~~~
+
+    def visit_assign_stmt(self, assign_stmt):
+        var_name = assign_stmt.lhs.lexeme
+        lookup = self.sym.lookup
+        add_variable = self.sym.add_variable
+
+        index = None
+        if assign_stmt.index_expr != None:
+            yield assign_stmt.index_expr
+            index = self.code
+
+        yield assign_stmt.rhs
+        rhs = self.code
+
+        if index is None:
+            def code():
+                var = lookup(var_name)
+                if var is None:
+                    var = add_variable(var_name)
+                var.value = rhs()
+        else:
+            def code():
+                var = lookup(var_name)
+                if var is None:
+                    var = add_variable(var_name)
+                i = index()
+                value = rhs()
+                if i is None:
+                    var.value.append(value)
+                else:
+                    var.value[i] = value
+        self.__set(code)
+
+    # EXPR/ID/VALUE STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_expr(self, simple_expr):
+        term = simple_expr.term
+        if term.type == Token.ID:
+            variables = self.sym.variables
+            var_name = term.lexeme
+            def code():
+                shadows = variables.get(var_name)
+                if shadows is None:
+                    return None
+                return shadows[-1].value
+            self.__set(code)
+            return
+
+        value = literal_value(term)
+        def code():
+            return value
+        self.__set(code, value)
+
+    def visit_index_expr(self, index_expr):
+        array_name = index_expr.identifier.lexeme
+        lookup = self.sym.lookup
+        token = index_expr.expr.first_token()
+
+        yield index_expr.expr
+        expr = self.code
+
+        def code():
+            index = int(expr())
+            var = lookup(array_name)
+            real_array = None if var is None else var.value
+            length = len(real_array)
+            if index >= length or index < 0:
+                token.error('array index out of bounds! (idx: '+xstr(index)+', len: '+xstr(length)+')')
+            return real_array[index]
+        self.__set(code)
+
+    def visit_list_expr(self, list_expr):
+        items = []
+        for expr in list_expr.expressions:
+            yield expr
+            items.append(self.code)
+        items = tuple(items)
+        def code():
+            return [item() for item in items]
+        self.__set(code)
+
+    def visit_complex_expr(self, complex_expr):
+        left, left_constant = yield from self.__expr(complex_expr.first_operand)
+        right, right_constant = yield from self.__expr(complex_expr.second_operand)
+        rel = complex_expr.rel.type
+
+        # pick the operation by the type the type checker worked out, as the
+        # Interpreter does
+        if rel == Token.PLUS and complex_expr.type == Token.STRING:
+            if right_constant is NOT_CONSTANT:
+                code = _concat(left, right)
+            else:
+                code = _add_constant(left, cast_str(right_constant))
+        elif rel == Token.PLUS and complex_expr.type != Token.INT and \
+                complex_expr.type != Token.ARRAY:
+            code = _plus(left, right)
+        elif rel in ARITHMETIC:
+            if right_constant is NOT_CONSTANT:
+                code = ARITHMETIC[rel][0](left, right)
+            else:
+                code = ARITHMETIC[rel][1](left, right_constant)
+        else:
+            code = _invalid(left, right, complex_expr.rel)
+        self.__set(code)
+
+    # BOOLEAN EXPRESSIONS
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_bool_expr(self, simple_bool_expr):
+        yield simple_bool_expr.expr
+        expr = self.code
+        if simple_bool_expr.negated:
+            def code():
+                return not expr()
+        else:
+            def code():
+                return True if expr() else False
+        self.__set(code)
+
+    def visit_complex_bool_expr(self, complex_bool_expr):
+        left, left_constant = yield from self.__expr(complex_bool_expr.first_expr)
+        right, right_constant = yield from self.__expr(complex_bool_expr.second_expr)
+        rel = complex_bool_expr.bool_rel.type
+
+        if rel in COMPARISONS:
+            if right_constant is NOT_CONSTANT:
+                compare = COMPARISONS[rel][0](left, right)
+            else:
+                compare = COMPARISONS[rel][1](left, right_constant)
+        else:
+            compare = _invalid(left, right, complex_bool_expr.bool_rel)
+
+        if not complex_bool_expr.has_bool_connector:
+            self.__set(compare)
+            return
+
+        # (both sides are always evaluated, the second can read input)
+        yield complex_bool_expr.second_operand
+        second = self.code
+        if complex_bool_expr.bool_connector.type == Token.AND:
+            def code():
+                result = compare()
+                result2 = second()
+                return result and result2
+        else:
+            def code():
+                result = compare()
+                result2 = second()
+                return result or result2
+        self.__set(code)
+
+    # IF STATEMENTS
+    # ~~~~~~~~~~~~~
+
+    def visit_if_stmt(self, if_stmt):
+        # IF
+        yield if_stmt.if_part.bool_expr
+        condition = self.code
+        # THEN
+        yield if_stmt.if_part.stmt_list
+        then = self.code
+
+        elseifs = []
+        for elseif in if_stmt.elseifs:
+            # ELSE IF
+            yield elseif.bool_expr
+            elseif_condition = self.code
+            # THEN
+            yield elseif.stmt_list
+            elseifs.append((elseif_condition, self.code))
+        elseifs = tuple(elseifs)
+
+        # ELSE
+        otherwise = None
+        if if_stmt.has_else:
+            yield if_stmt.else_stmts
+            otherwise = self.code
+
+        if not elseifs and otherwise is None:
+            def code():
+                if condition():
+                    then()
+        elif not elseifs:
+            def code():
+                if condition():
+                    then()
+                else:
+                    otherwise()
+        else:
+            def code():
+                if condition():
+                    then()
+                    return
+                for elseif_condition, elseif_then in elseifs:
+                    if elseif_condition():
+                        elseif_then()
+                        return
+                if otherwise is not None:
+                    otherwise()
+        self.__set(code)
+
+    # LOOP STATEMENTS
+    # ~~~~~~~~~~~~~~~
+
+    def visit_while_stmt(self, while_stmt):
+        # WHILE
+        yield while_stmt.bool_expr
+        condition = self.code
+        # DO
+        yield while_stmt.stmt_list
+        body = self.code
+
+        def code():
+            while condition():
+                body()
+        self.__set(code)
+
+    def visit_for_stmt(self, for_stmt):
+        var_name = for_stmt.var.lexeme
+        lookup = self.sym.lookup
+        add_variable = self.sym.add_variable
+        token = for_stmt.first_token()
+
+        # FROM, TO, STEP
+        yield for_stmt.start_expr
+        start = self.code
+        yield for_stmt.end_expr
+        end = self.code
+        step = None
+        if for_stmt.step_expr != None:
+            yield for_stmt.step_expr
+            step = self.code
+        # DO
+        yield for_stmt.stmt_list
+        body = self.code
+
+        def code():
+            values = counted_range(start(), end(), 1 if step is None else step())
+            if values is None:
+                token.error("for loop step can't be 0")
+            var = lookup(var_name)
+            if var is None:
+                var = add_variable(var_name)
+            var.value = values.start
+            for var.value in values:
+                body()
+        self.__set(code)
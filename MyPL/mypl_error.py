@@ -1,10 +1,11 @@
 #!python3
 
 class Error(Exception):
-    def __init__(self, message, line, column):
+    def __init__(self, message, line, column, token=None):
         self.message = message
         self.line = line
         self.column = column
+        self.token = token # the token the error was reported at, if any
 
     def __str__(self):
         s = ''
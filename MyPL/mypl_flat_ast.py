@@ -0,0 +1,314 @@
+#!python3
+# Flat AST storage: the nodes of a program kept in a few typed arrays instead of one
+# Python object each, for programs with millions of nodes
+
+from array import array
+from collections.abc import Sequence
+
+import mypl_ast as ast
+from mypl_token import Token
+
+# FIELD TYPES
+NODE = 0    # an AST node, stored as its index (-1 for None)
+TOKEN = 1   # a Token, stored as its index in the token arrays (-1 for None)
+FLAG = 2    # a bool, stored as 0 or 1
+CODE = 3    # a token type code or other small int (e.g. a slot), stored as is (-1 for None)
+NODES = 4   # a list of AST nodes, stored as its length followed by their indices
+
+# The fields of each node class, in the order they are stored. A NODES field is
+# always the last one so that the others are at fixed positions.
+FIELDS = {
+    ast.StmtList:           (('size', CODE), ('stmts', NODES)),
+    ast.PrintStmt:          (('expr', NODE), ('which', CODE), ('is_println', FLAG)),
+    ast.ReadExpr:           (('expr', NODE), ('which', CODE), ('is_read_int', FLAG)),
+    ast.LenExpr:            (('name', CODE), ('expr', NODE)),
+    ast.AssignStmt:         (('lhs', TOKEN), ('index_expr', NODE), ('rhs', NODE),
+                             ('depth', CODE), ('slot', CODE)),
+    ast.SimpleExpr:         (('term', TOKEN), ('negated', FLAG), ('depth', CODE), ('slot', CODE)),
+    ast.IndexExpr:          (('identifier', TOKEN), ('expr', NODE), ('negated', FLAG),
+                             ('depth', CODE), ('slot', CODE)),
+    ast.ListExpr:           (('lbracket', TOKEN), ('expressions', NODES)),
+    ast.ComplexExpr:        (('first_operand', NODE), ('rel', TOKEN), ('second_operand', NODE),
+                             ('type', CODE)),
+    ast.SimpleBoolExpr:     (('expr', NODE), ('negated', FLAG)),
+    ast.ComplexBoolExpr:    (('negated', FLAG), ('first_expr', NODE), ('bool_rel', TOKEN),
+                             ('second_expr', NODE), ('has_bool_connector', FLAG),
+                             ('bool_connector', TOKEN), ('second_operand', NODE)),
+    ast.BasicIf:            (('which', TOKEN), ('bool_expr', NODE), ('stmt_list', NODE)),
+    ast.IfStmt:             (('which', TOKEN), ('if_part', NODE), ('has_else', FLAG),
+                             ('else_stmts', NODE), ('elseifs', NODES)),
+    ast.WhileStmt:          (('which', TOKEN), ('bool_expr', NODE), ('stmt_list', NODE)),
+    ast.ForStmt:            (('which', TOKEN), ('var', TOKEN), ('start_expr', NODE),
+                             ('end_expr', NODE), ('step_expr', NODE), ('stmt_list', NODE),
+                             ('depth', CODE), ('slot', CODE)),
+}
+
+# node class of each kind code, and the other way around
+CLASSES = tuple(FIELDS)
+KINDS = {node_class: kind for kind, node_class in enumerate(CLASSES)}
+
+class FlatAST:
+    """An AST stored as arrays.
+
+    Node i is of the class CLASSES[kinds[i]], its fields (see FIELDS) are stored in
+    fields[starts[i]:]. Children are added before their parents, the root (a
+    StmtList) last. Tokens are stored the same way, with each distinct lexeme and
+    SourceMap kept once.
+
+    stmt_list() gives a view of the root that the visitors can go through like the
+    object AST. Pickling a FlatAST (or a view) only pickles the arrays.
+    """
+
+    def __init__(self):
+        self.kinds = array('B')
+        self.starts = array('i')
+        self.fields = array('i')
+        self.token_types = array('B')
+        self.token_offsets = array('q')
+        self.token_lexemes = array('i')     # index in lexemes
+        self.token_sources = array('i')     # index in sources
+        self.lexemes = []                   # distinct lexemes
+        self.sources = []                   # distinct SourceMaps
+        self.root = -1
+        self.__init_indexes()
+
+    def __init_indexes(self):
+        self.__lexeme_index = {lexeme: i for i, lexeme in enumerate(self.lexemes)}
+        self.__source_index = {id(source): i for i, source in enumerate(self.sources)}
+
+    # (the indexes are only needed to add to the AST, they are rebuilt on unpickling)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_FlatAST__lexeme_index']
+        del state['_FlatAST__source_index']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_indexes()
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # PUBLIC FUNCTIONS
+    # ~~~~~~~~~~~~~~~~
+
+    def stmt_list(self):
+        """ Get a view of the root StmtList """
+        return self.node(self.root)
+
+    def node(self, index):
+        """ Get a view of a node by index, or None for -1 """
+        if index < 0:
+            return None
+        return VIEWS[self.kinds[index]](self, index)
+
+    def token(self, index):
+        """ Get a token by index, or None for -1 """
+        if index < 0:
+            return None
+        return Token(self.token_types[index],
+                     self.lexemes[self.token_lexemes[index]],
+                     self.token_offsets[index],
+                     self.sources[self.token_sources[index]])
+
+    def add(self, node):
+        """ Add a (object) AST node and everything under it, returns its index """
+        fields = self.fields
+
+        # Children are added before their parent, without recursion (expressions
+        # can be deeply nested). The indices of added nodes wait on a stack until
+        # their parent is added.
+        stack = [(node, False)]
+        indices = []
+        while stack:
+            node, children_added = stack.pop()
+            if node is None:
+                indices.append(-1)
+                continue
+
+            children = _children(node)
+            if not children_added:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+
+            first = len(indices) - len(children)
+            child_indices = iter(indices[first:])
+            del indices[first:]
+
+            index = len(self.kinds)
+            self.kinds.append(KINDS[type(node)])
+            self.starts.append(len(fields))
+            for name, field_type in FIELDS[type(node)]:
+                if field_type == NODE:
+                    fields.append(next(child_indices))
+                elif field_type == TOKEN:
+                    fields.append(self.add_token(getattr(node, name)))
+                elif field_type == FLAG:
+                    fields.append(1 if getattr(node, name) else 0)
+                elif field_type == CODE:
+                    value = getattr(node, name)
+                    fields.append(-1 if value is None else value)
+                else: # NODES
+                    fields.append(len(getattr(node, name)))
+                    fields.extend(child_indices)
+            indices.append(index)
+
+        return indices[0]
+
+    def add_stmt_list(self, stmts):
+        """ Add a StmtList of already added statements (by index), returns its index """
+        index = len(self.kinds)
+        self.kinds.append(KINDS[ast.StmtList])
+        self.starts.append(len(self.fields))
+        self.fields.append(-1) # (size)
+        self.fields.append(len(stmts))
+        self.fields.extend(stmts)
+        return index
+
+    def add_token(self, token):
+        """ Add a token, returns its index """
+        if token is None:
+            return -1
+
+        lexeme = self.__lexeme_index.get(token.lexeme)
+        if lexeme is None:
+            lexeme = self.__lexeme_index[token.lexeme] = len(self.lexemes)
+            self.lexemes.append(token.lexeme)
+
+        source = self.__source_index.get(id(token.source))
+        if source is None:
+            source = self.__source_index[id(token.source)] = len(self.sources)
+            self.sources.append(token.source)
+
+        index = len(self.token_types)
+        self.token_types.append(token.type)
+        self.token_offsets.append(token.offset)
+        self.token_lexemes.append(lexeme)
+        self.token_sources.append(source)
+        return index
+
+def _children(node):
+    children = []
+    for name, field_type in FIELDS[type(node)]:
+        if field_type == NODE:
+            children.append(getattr(node, name))
+        elif field_type == NODES:
+            children.extend(getattr(node, name))
+    return children
+
+# BUILDING
+# ------------------------------------------------------------------------------------------
+
+def flatten(stmt_list):
+    """ Get the FlatAST of an (object) AST """
+    flat = FlatAST()
+    flat.root = flat.add(stmt_list)
+    return flat
+
+def parse(parser):
+    """ Parse a program into a FlatAST, the same way parser.parse() does.
+
+    Each top-level statement is flattened as soon as it is parsed, so the program is
+    never held as objects all at once.
+    """
+    flat = FlatAST()
+    stmts = array('i')
+
+    parser.next()
+    while True:
+        stmts.append(flat.add(parser.parse_stmt()))
+        if parser.c.type == Token.RBRACE or \
+                parser.c.type == Token.ELSEIF or \
+                parser.c.type == Token.ELSE or \
+                parser.c.type == Token.EOS:
+            break
+    parser.eat(Token.EOS, 'expecting end of file')
+
+    flat.root = flat.add_stmt_list(stmts)
+    return flat
+
+# VIEWS
+# ------------------------------------------------------------------------------------------
+
+class NodeList(Sequence):
+    """A read-only list of the nodes in a NODES field."""
+
+    __slots__ = ('flat', 'position')
+
+    def __init__(self, flat, position):
+        self.flat = flat
+        self.position = position # of the length, the indices follow it
+
+    def __len__(self):
+        return self.flat.fields[self.position]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        length = len(self)
+        if i < 0:
+            i += length
+        if not 0 <= i < length:
+            raise IndexError('node list index out of range')
+        return self.flat.node(self.flat.fields[self.position + 1 + i])
+
+    def __iter__(self):
+        flat = self.flat
+        fields = flat.fields
+        start = self.position + 1
+        for k in range(start, start + fields[self.position]):
+            yield flat.node(fields[k])
+
+def _field(position, field_type):
+    if field_type == NODE:
+        def get(self):
+            flat = self.flat
+            return flat.node(flat.fields[flat.starts[self.index] + position])
+    elif field_type == TOKEN:
+        def get(self):
+            flat = self.flat
+            return flat.token(flat.fields[flat.starts[self.index] + position])
+    elif field_type == FLAG:
+        def get(self):
+            flat = self.flat
+            return flat.fields[flat.starts[self.index] + position] != 0
+    elif field_type == CODE:
+        def get(self):
+            flat = self.flat
+            value = flat.fields[flat.starts[self.index] + position]
+            return None if value < 0 else value
+        # (the type checker and the resolver annotate nodes)
+        def set(self, value):
+            flat = self.flat
+            flat.fields[flat.starts[self.index] + position] = -1 if value is None else value
+        return property(get, set)
+    else: # NODES
+        def get(self):
+            flat = self.flat
+            return NodeList(flat, flat.starts[self.index] + position)
+    return property(get)
+
+def _view_init(self, flat, index):
+    self.flat = flat
+    self.index = index
+
+def _view_reduce(self):
+    return (FlatAST.node, (self.flat, self.index))
+
+# A view of a node is an instance of a subclass of the node's class, with its fields
+# read from the arrays. Views are made on demand, a new one each time, and are
+# read-only apart from their CODE fields.
+def _view_class(node_class):
+    namespace = {
+        '__slots__': ('flat', 'index'),
+        '__init__': _view_init,
+        '__reduce__': _view_reduce,
+    }
+    for position, (name, field_type) in enumerate(FIELDS[node_class]):
+        namespace[name] = _field(position, field_type)
+    return type(node_class.__name__ + 'View', (node_class,), namespace)
+
+# view class of each kind code
+VIEWS = tuple(_view_class(node_class) for node_class in CLASSES)
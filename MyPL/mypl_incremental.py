@@ -0,0 +1,328 @@
+#!python3
+# Keeps a program lexed, parsed and type checked while it is being edited, redoing
+# only the work an edit can affect (e.g. for an editor that checks as you type)
+
+import bisect
+
+import mypl_lexer
+import mypl_parser
+import mypl_type_checker
+import mypl_symbol_table
+import mypl_ast as ast
+from mypl_token import Token
+from mypl_error import Error
+
+# a copy of the top-level variable types is kept about every this many statements,
+# type checking after an edit starts from the closest one
+CHECKPOINT_INTERVAL = 64
+
+# recorded as the type of a variable that did not exist (yet)
+MISSING = object()
+
+class TextReader:
+    """A read-only text stream over text[start:end], without copying it."""
+
+    def __init__(self, text, start=0, end=None):
+        self.text = text
+        self.pos = start
+        self.end = len(text) if end is None else end
+
+    def read(self, size):
+        chunk = self.text[self.pos:min(self.pos + size, self.end)]
+        self.pos += len(chunk)
+        return chunk
+
+class Segment:
+    """A top-level statement of a Document.
+
+    The segment is the source of the statement's tokens (in place of a SourceMap):
+    token offsets are relative to the segment's origin and positions are looked up
+    in the document, so moving the statement only means moving its origin.
+
+    Type checking the statement records the types the top-level variables it looked
+    at had beforehand (inputs) and the types it left them with (effect). As long as
+    the inputs are the same the result is too, without checking it again.
+    """
+
+    __slots__ = ('document', 'origin', 'offset', 'stmt',
+                 'checked', 'inputs', 'effect', 'error', 'checkpoint')
+
+    def __init__(self, document, origin):
+        self.document = document
+        self.origin = origin      # document offset the token offsets are relative to
+        self.offset = 0           # offset of the statement's first token
+        self.stmt = None          # Stmt
+        self.checked = False
+        self.inputs = None        # {var_name: type before the statement}
+        self.effect = None        # {var_name: type after the statement}
+        self.error = None         # Error raised by the type checker
+        self.checkpoint = None    # {var_name: type} before the statement, if kept
+
+    @property
+    def start(self):
+        return self.origin + self.offset
+
+    # the lexer records lines and shifts as it goes, a document works positions
+    # out from its text instead
+    def add_line(self, offset):
+        pass
+
+    def add_shift(self, end, width):
+        pass
+
+    def position(self, offset):
+        return self.document.position(self.origin + offset)
+
+class RecordingSymbolTable(mypl_symbol_table.SymbolTable):
+    """A symbol table that records the type each top-level variable had when the
+    statement being checked first looked it up."""
+
+    def __init__(self):
+        super().__init__()
+        self.inputs = {}
+
+    def __record(self, var_name):
+        if var_name not in self.inputs:
+            var = self.scopes[0].get(var_name)
+            self.inputs[var_name] = MISSING if var is None else var.type
+
+    # (the other functions all look variables up through lookup)
+    def lookup(self, var_name):
+        self.__record(var_name)
+        return super().lookup(var_name)
+
+    def add_variable(self, var_name):
+        self.__record(var_name)
+        return super().add_variable(var_name)
+
+    def set_top_level_type(self, var_name, var_type):
+        """ Set the type of a top-level variable, adding it if need be, without
+        recording anything """
+        var = self.scopes[0].get(var_name)
+        if var is None:
+            var = super().add_variable(var_name)
+        var.type = var_type
+
+def _start(segment):
+    return segment.start
+
+class Document:
+    """A program that is kept lexed, parsed and type checked across edits.
+
+    The program is split into its top-level statements. After an edit, lexing and
+    parsing restart at the statement before it and go on until a new statement
+    starts where an old one (past the edit) did, from there on the old statements
+    are reused. Type checking then starts at the first new statement and stops as
+    soon as the top-level variable types are back to what they were before.
+
+    Reports the same first error as running the parser and type checker over the
+    whole text would.
+    """
+
+    def __init__(self, text=''):
+        self.text = ''
+        self.segments = []          # list of Segment, in source order
+        self.parse_error = None
+        self.broken = None          # index of the first segment not parsed since the last parse error
+        self.type_errors = set()    # segments whose statement failed to type check
+        self.unchecked = 0          # number of segments not type checked yet
+        self.first_unchecked = 0    # index of the first segment to type check again
+        self.edit(0, 0, text)
+
+    # PUBLIC FUNCTIONS
+    # ~~~~~~~~~~~~~~~~
+
+    def edit(self, offset, deleted, inserted):
+        """ Replace `deleted` characters at `offset` with the `inserted` text """
+        self.text = self.text[:offset] + inserted + self.text[offset + deleted:]
+        self.__parse(offset, deleted, len(inserted))
+        if self.parse_error is None:
+            self.__check()
+
+    def error(self):
+        """ Get the first error in the program, or None if there is none """
+        if self.parse_error is not None:
+            return self.parse_error
+        if not self.type_errors:
+            return None
+
+        # the line/column of the error may have moved since it was found
+        error = min(self.type_errors, key=_start).error
+        if error.token is None:
+            return error
+        line, column = error.token.source.position(error.token.offset)
+        return Error(error.message, line, column, error.token)
+
+    def stmt_list(self):
+        """ Get the AST of the program (only complete if there is no parse error) """
+        stmt_list = ast.StmtList()
+        stmt_list.stmts = [segment.stmt for segment in self.segments]
+        return stmt_list
+
+    def position(self, offset):
+        """ Get the (line, column) of an offset in the text, both counted from 1 """
+        line_start = self.text.rfind('\n', 0, offset) + 1
+
+        # Strings and comments earlier on the line shift the column (see SourceMap),
+        # so the line is lexed again from the start of the statement it begins in
+        k = bisect.bisect_right(self.segments, line_start, key=_start) - 1
+        start = self.segments[k].start if k >= 0 else 0
+        lexer = mypl_lexer.Lexer(TextReader(self.text, start, offset))
+        while lexer.next_token().type != Token.EOS:
+            pass
+
+        return self.text.count('\n', 0, offset) + 1, lexer.source.position(offset - start)[1]
+
+    # PARSING
+    # ~~~~~~~
+
+    def __parse(self, offset, deleted, inserted):
+        segments = self.segments
+        end = offset + inserted # end of the edit in the new text
+
+        # Restart at the last statement that starts before the edit -- an edit right
+        # at the start of a statement can still change the one before it (e.g. by
+        # adding an 'else'). If the last parse failed, restart no later than the
+        # statement before the one it failed in.
+        i = max(bisect.bisect_left(segments, offset, key=_start) - 1, 0)
+        if self.broken is not None:
+            i = min(i, max(self.broken - 1, 0))
+        origin = segments[i].start if i > 0 else 0
+
+        # Statements past the edit move along with the text, they are reused as soon
+        # as a new statement starts where one of them does. The ones past a parse
+        # error are only reused once the error has been parsed again.
+        reusable = []
+        for k in range(i, len(segments)):
+            segment = segments[k]
+            if segment.start >= offset + deleted and (self.broken is None or k >= self.broken):
+                segment.origin += inserted - deleted
+                reusable.append(segment)
+            else:
+                self.__discard(segment)
+        del segments[i:]
+        targets = {segment.start: k for k, segment in enumerate(reusable)}
+
+        self.first_unchecked = min(self.first_unchecked, i)
+        self.parse_error = None
+        self.broken = None
+
+        lexer = mypl_lexer.Lexer(TextReader(self.text, origin))
+        parser = mypl_parser.Parser(lexer)
+        segment = Segment(self, origin)
+        lexer.source = segment
+        start = origin
+        try:
+            parser.next()
+            while parser.c.type != Token.EOS or not segments:
+                start = origin + parser.c.offset
+                k = targets.get(start)
+                if k is not None and start >= end:
+                    segments.extend(reusable[k:])
+                    reusable = reusable[:k]
+                    break
+
+                # the first token was read while parsing the previous statement
+                parser.c.source = segment
+                segment.offset = parser.c.offset
+                segment.stmt = parser.parse_stmt()
+                segments.append(segment)
+                self.unchecked += 1
+
+                # only another statement can follow at the top level
+                if parser.c.type == Token.RBRACE or \
+                        parser.c.type == Token.ELSEIF or \
+                        parser.c.type == Token.ELSE:
+                    parser.eat(Token.EOS, 'expecting end of file')
+
+                segment = Segment(self, origin)
+                lexer.source = segment
+        except Error as e:
+            self.parse_error = e
+            self.broken = len(segments)
+            # keep the statements past the error for when it is fixed
+            stale = [segment for segment in reusable if segment.start > start]
+            reusable = [segment for segment in reusable if segment.start <= start]
+            segments.extend(stale)
+
+        for segment in reusable:
+            self.__discard(segment)
+
+    def __discard(self, segment):
+        if not segment.checked:
+            self.unchecked -= 1
+        self.type_errors.discard(segment)
+
+    # TYPE CHECKING
+    # ~~~~~~~~~~~~~
+
+    def __check(self):
+        segments = self.segments
+        first = self.first_unchecked
+        self.first_unchecked = len(segments)
+        if first >= len(segments):
+            return
+
+        sym = RecordingSymbolTable()
+        sym.push_environment()
+        top = sym.scopes[0]
+        checker = mypl_type_checker.TypeChecker()
+        checker.sym = sym
+
+        # start from the closest checkpoint before the first statement to check
+        k = first
+        while k > 0:
+            k -= 1
+            if segments[k].checkpoint is not None:
+                for var_name, var_type in segments[k].checkpoint.items():
+                    sym.set_top_level_type(var_name, var_type)
+                break
+
+        since = 0 # statements since the last checkpoint
+        for index in range(k, len(segments)):
+            segment = segments[index]
+            if index >= first:
+                if segment.checkpoint is not None or since >= CHECKPOINT_INTERVAL:
+                    types = {var_name: var.type for var_name, var in top.items()}
+                    # same types as the last time through, nothing after this changes
+                    if self.unchecked == 0 and segment.checkpoint == types:
+                        return
+                    segment.checkpoint = types
+                    since = 0
+
+                if not segment.checked or not self.__inputs_match(segment, top):
+                    self.__check_segment(segment, checker)
+                    since += 1
+                    continue
+
+            for var_name, var_type in segment.effect.items():
+                sym.set_top_level_type(var_name, var_type)
+            since += 1
+
+    def __inputs_match(self, segment, top):
+        for var_name, var_type in segment.inputs.items():
+            var = top.get(var_name)
+            if (MISSING if var is None else var.type) != var_type:
+                return False
+        return True
+
+    def __check_segment(self, segment, checker):
+        sym = checker.sym
+        sym.inputs = {}
+        try:
+            segment.stmt.accept(checker)
+            segment.error = None
+            self.type_errors.discard(segment)
+        except Error as e:
+            # drop the scopes of any blocks the error happened in
+            while len(sym.scopes) > 1:
+                sym.pop_environment()
+            segment.error = e
+            self.type_errors.add(segment)
+
+        top = sym.scopes[0]
+        segment.inputs = sym.inputs
+        segment.effect = {var_name: top[var_name].type for var_name in sym.inputs if var_name in top}
+        if not segment.checked:
+            segment.checked = True
+            self.unchecked -= 1
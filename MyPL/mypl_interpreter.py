@@ -3,21 +3,31 @@
 from mypl_util import *
 from mypl_token import *
 import mypl_ast
-import mypl_symbol_table
+import mypl_resolver
 import sys
 
-class Interpreter(mypl_ast.Visitor):
+class Interpreter(mypl_ast.StackVisitor):
+    """Runs a type checked AST.
+
+    Variables are found by the depth and slot the Resolver gave them: each
+    environment is a list of the values of its variables, frames[depth].
+    """
 
     def __init__(self):
-        self.sym = mypl_symbol_table.SymbolTable()
+        self.frames = [] # one list of variable values per environment, outermost first
         self.cval = None
         self.ctype = None
 
     def visit_stmt_list(self, stmt_list):
-        self.sym.push_environment()
+        # a program that wasn't resolved yet (e.g. a new root, see
+        # mypl_incremental.Document.stmt_list) is resolved before it runs
+        if len(self.frames) == 0 and stmt_list.size is None:
+            stmt_list.accept(mypl_resolver.Resolver())
+
+        self.frames.append([None] * stmt_list.size)
         for stmt in stmt_list.stmts:
-            stmt.accept(self)
-        self.sym.pop_environment()
+            yield stmt
+        self.frames.pop()
 
     # HELPER FUNCTIONS
     # ~~~~~~~~~~~~~~~~
@@ -42,14 +52,14 @@ class Interpreter(mypl_ast.Visitor):
     # ~~~~~~~~~~~~~~~~~~~~~
 
     def visit_print_stmt(self, print_stmt):
-        print_stmt.expr.accept(self)
+        yield print_stmt.expr
         self.__write(self.cval)
 
         if print_stmt.is_println:
             self.__write("\n")
 
     def visit_read_expr(self, read_expr):
-        read_expr.expr.accept(self)
+        yield read_expr.expr
         val = self.__read(self.cval)
 
         if read_expr.is_read_int:
@@ -66,7 +76,7 @@ class Interpreter(mypl_ast.Visitor):
     # ~~~~~~~~
 
     def visit_len_expr(self, len_expr):
-        len_expr.expr.accept(self)
+        yield len_expr.expr
 
         if type(self.cval) in (tuple, list):
             self.cval = len(self.cval)
@@ -83,23 +93,20 @@ class Interpreter(mypl_ast.Visitor):
     # ~~~~~~~~~~~~~~~~
 
     def visit_assign_stmt(self, assign_stmt):
-        var_name = assign_stmt.lhs.lexeme
+        frame = self.frames[assign_stmt.depth]
         index = None
 
-        if not self.sym.variable_exists(var_name):
-            self.sym.add_variable(assign_stmt.lhs.lexeme)
-
         if assign_stmt.index_expr != None:
-            assign_stmt.index_expr.accept(self)
+            yield assign_stmt.index_expr
             index = self.cval
 
-        assign_stmt.rhs.accept(self)
+        yield assign_stmt.rhs
         var_value = self.cval
 
         if assign_stmt.index_expr is None:
-            self.sym.set_variable_value(var_name, var_value)
+            frame[assign_stmt.slot] = var_value
         else:
-            arr = self.sym.get_variable_value(var_name)
+            arr = frame[assign_stmt.slot]
             if index is None:
                 arr.append(var_value)
             else:
@@ -110,7 +117,10 @@ class Interpreter(mypl_ast.Visitor):
 
     def visit_simple_expr(self, simple_expr):
         if simple_expr.term.type == Token.ID:
-            self.cval = self.sym.get_variable_value(simple_expr.term.lexeme)
+            if simple_expr.depth is None:
+                self.cval = None # (undefined)
+            else:
+                self.cval = self.frames[simple_expr.depth][simple_expr.slot]
             self.ctype = Token.ID
         elif simple_expr.term.type == Token.INT:
             self.cval = int(simple_expr.term.lexeme)
@@ -126,14 +136,15 @@ class Interpreter(mypl_ast.Visitor):
             self.ctype = Token.STRING
 
     def visit_index_expr(self, index_expr):
-        # array
-        array_name = index_expr.identifier.lexeme
-
         # index
-        index_expr.expr.accept(self)
+        yield index_expr.expr
         index = int(self.cval)
 
-        real_array = self.sym.get_variable_value(array_name)
+        # array
+        if index_expr.depth is None:
+            real_array = None # (undefined)
+        else:
+            real_array = self.frames[index_expr.depth][index_expr.slot]
         length = len(real_array)
 
         if index >= length or index < 0:
@@ -141,33 +152,37 @@ class Interpreter(mypl_ast.Visitor):
                 'array index out of bounds! (idx: '+xstr(index)+', len: '+xstr(length)+')')
 
         self.cval = real_array[index]
-        self.ctype = Token.token_from_native(self.cval)
+        self.ctype = Token.NA # (arrays are not typed)
 
     def visit_list_expr(self, list_expr):
         mylist = []
 
         for expr in list_expr.expressions:
-            expr.accept(self)
+            yield expr
             mylist.append(self.cval)
 
         self.cval = mylist
         self.ctype = Token.ARRAY
 
     def visit_complex_expr(self, complex_expr):
-        # accept left operand
-        complex_expr.first_operand.accept(self)
+        # visit left operand
+        yield complex_expr.first_operand
         l = self.cval
-        l_type = self.ctype
 
-        # accept right operand
-        complex_expr.second_operand.accept(self)
+        # visit right operand
+        yield complex_expr.second_operand
         r = self.cval
-        r_type = self.ctype
 
         rel = complex_expr.rel.type
 
+        # the type checker worked out the type of the result ahead of time, only when it
+        # couldn't (NA, e.g. an array element) is it decided by the values
+        ctype = complex_expr.type
+
         if rel == Token.PLUS:
-            if l_type == Token.STRING:
+            if ctype == Token.INT or ctype == Token.ARRAY:
+                self.cval = l + r
+            elif ctype == Token.STRING or type(l) is str:
                 self.cval = l + self.__cast_str(r)
             else:
                 self.cval = l + r
@@ -182,13 +197,13 @@ class Interpreter(mypl_ast.Visitor):
         else:
             complex_expr.rel.error("unknown or invalid operator")
 
-        self.ctype = Token.token_from_native(self.cval)
+        self.ctype = Token.NA if ctype is None else ctype
 
     # BOOLEAN EXPRESSIONS
     # ~~~~~~~~~~~~~~~~~~~
 
     def visit_simple_bool_expr(self, simple_bool_expr):
-        simple_bool_expr.expr.accept(self)
+        yield simple_bool_expr.expr
         if self.cval:
             self.cval = True
         else:
@@ -198,10 +213,10 @@ class Interpreter(mypl_ast.Visitor):
         self.ctype = Token.BOOL
 
     def visit_complex_bool_expr(self, complex_bool_expr):
-        complex_bool_expr.first_expr.accept(self)
+        yield complex_bool_expr.first_expr
         l = self.cval
 
-        complex_bool_expr.second_expr.accept(self)
+        yield complex_bool_expr.second_expr
         r = self.cval
 
         rel = complex_bool_expr.bool_rel.type
@@ -225,10 +240,10 @@ class Interpreter(mypl_ast.Visitor):
         result2 = True
 
         if complex_bool_expr.has_bool_connector:
-            complex_bool_expr.second_operand.accept(self)
+            yield complex_bool_expr.second_operand
             result2 = self.cval
         else:
-            return result
+            return
 
         if complex_bool_expr.bool_connector.type == Token.AND:
             self.cval = (result and result2)
@@ -242,34 +257,58 @@ class Interpreter(mypl_ast.Visitor):
 
     def visit_if_stmt(self, if_stmt):
         # IF
-        if_stmt.if_part.bool_expr.accept(self)
+        yield if_stmt.if_part.bool_expr
         # THEN
         if self.cval:
-            if_stmt.if_part.stmt_list.accept(self)
+            yield if_stmt.if_part.stmt_list
         else:
             any_true = False
             for elseif in if_stmt.elseifs:
                 # ELSE IF
-                elseif.bool_expr.accept(self)
+                yield elseif.bool_expr
                 # THEN
                 if self.cval:
                     any_true = True
-                    elseif.stmt_list.accept(self)
+                    yield elseif.stmt_list
                     break
             # ELSE
             if not any_true and if_stmt.has_else:
-                if_stmt.else_stmts.accept(self)
+                yield if_stmt.else_stmts
 
     # LOOP STATEMENTS
     # ~~~~~~~~~~~~~~~
 
     def visit_while_stmt(self, while_stmt):
         # WHILE
-        while_stmt.bool_expr.accept(self)
+        yield while_stmt.bool_expr
         state = self.cval
         while (state):
             # DO
-            while_stmt.stmt_list.accept(self)
-
-            while_stmt.bool_expr.accept(self)
-            state = self.cval
\ No newline at end of file
+            yield while_stmt.stmt_list
+
+            yield while_stmt.bool_expr
+            state = self.cval
+
+    def visit_for_stmt(self, for_stmt):
+        # FROM, TO, STEP (each evaluated once)
+        yield for_stmt.start_expr
+        start = self.cval
+        yield for_stmt.end_expr
+        end = self.cval
+        step = 1
+        if for_stmt.step_expr != None:
+            yield for_stmt.step_expr
+            step = self.cval
+
+        values = counted_range(start, end, step)
+        if values is None:
+            for_stmt.first_token().error("for loop step can't be 0")
+
+        # the variable starts at start even if the loop doesn't run, then takes each
+        # value in turn (assigning it in the body doesn't change the next one)
+        frame = self.frames[for_stmt.depth]
+        slot = for_stmt.slot
+        frame[slot] = values.start
+        for frame[slot] in values:
+            # DO
+            yield for_stmt.stmt_list
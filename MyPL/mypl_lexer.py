@@ -1,273 +1,409 @@
 #!python3
 
+import re
+import sys
+import mmap
+import codecs
+
 from mypl_token import *
 from mypl_error import *
 
+# Token Tables
+# ~~~~~~~~~~~~
+
+# reserved words, checked after an identifier has been matched
+KEYWORDS = {
+    'while': Token.WHILE,
+    'for': Token.FOR,
+    'else': Token.ELSE,
+    'not': Token.NOT,
+    'and': Token.AND,
+    'if': Token.IF,
+    'or': Token.OR,
+    'true': Token.BOOL,
+    'false': Token.BOOL,
+}
+
+# default functions, only recognized when directly followed by "(" -- e.g. 'println('
+BUILTINS = {
+    'println': Token.PRINTLN,
+    'readstr': Token.READSTR,
+    'readint': Token.READINT,
+    'print': Token.PRINT,
+    'len': Token.LEN,
+}
+
+# operators and syntax characters
+SYMBOLS = {
+    '==': Token.EQUAL,
+    '<=': Token.LESS_THAN_EQUAL,
+    '>=': Token.GREATER_THAN_EQUAL,
+    '!=': Token.NOT_EQUAL,
+    '<': Token.LESS_THAN,
+    '>': Token.GREATER_THAN,
+    '+': Token.PLUS,
+    '-': Token.MINUS,
+    '/': Token.DIVIDE,
+    '*': Token.MULTIPLY,
+    '%': Token.MODULUS,
+    '=': Token.ASSIGN,
+    ',': Token.COMMA,
+    ';': Token.SEMICOLON,
+    '(': Token.LPAREN,
+    ')': Token.RPAREN,
+    '[': Token.LBRACKET,
+    ']': Token.RBRACKET,
+    '{': Token.LBRACE,
+    '}': Token.RBRACE,
+}
+
+# Master pattern, skips leading whitespace and classifies the next token with a
+# single match. The name of the group that matched (m.lastgroup) says what kind of
+# token it is, or is SPACE when nothing but whitespace was found. Alternatives that
+# share a prefix must keep the longer one first ('else if' before identifiers, '//'
+# before '/', '<=' before '<').
+#
+# STRING only matches strings without escapes, anything else starting with a quote
+# falls through to QUOTE and is walked character by character.
+TOKEN_PATTERN = re.compile(r"""
+    (?P<SPACE>\s*)
+    (?:
+          (?P<ELSEIF>else[ ]if(?!\w))
+        | (?P<ID>[^\W\d_]\w*)
+        | (?P<COMMENT>//|/\*)
+        | (?P<SYMBOL>[=<>!]=|[<>+\-*/%=,;()\[\]{}])
+        | (?P<INT>\d+)
+        | (?P<STRING>"[^"\\\n]*"|'[^'\\\n]*')
+        | (?P<QUOTE>["'])
+    )?
+""", re.VERBOSE)
+
+# The same pattern over bytes, for lexing a memory-mapped file in place. Bytes
+# patterns only know ASCII, a match that stops at any other character may have been
+# cut short and is redone over the decoded text (see __match_decoded). \s also
+# covers the four ASCII separator characters in text patterns.
+BYTES_TOKEN_PATTERN = re.compile(TOKEN_PATTERN.pattern.replace(r'(?P<SPACE>\s*)', r'(?P<SPACE>[\s\x1c-\x1f]*)').encode(), re.VERBOSE)
+
+# kinds of match that a following non-ASCII character could still be part of
+DECODED_KINDS = {'SPACE', 'ID', 'INT', 'ELSEIF'}
+
+# Characters the lexer looks for by itself, as text and as bytes
+#            new line, escape, EOL comment, comment end, call
+TEXT_CHARS = ('\n', '\\', '//', '*/', '(')
+BYTE_CHARS = tuple(chars.encode() for chars in TEXT_CHARS)
+
+# Number of characters read from the input stream at a time
+BLOCK_SIZE = 1 << 16
+
+# Number of characters a match may need to see past its own end to be certain it is
+# complete -- 'else if' plus the character that follows it. Remember to update this
+# number if a longer fixed-length token is added!
+LOOKAHEAD = 8
+
+# Pages of a mapped file that have been lexed are handed back to the OS every this
+# many bytes, so only a window of the file is ever resident
+RELEASE_SIZE = 1 << 22
+
 class Lexer:
 
-    def __init__(self, input_stream):
-        self.line   = 1
-        self.column = 1
+    # input_stream - a text stream, or the bytes of a whole (usually memory-mapped)
+    #                UTF-8 source to lex in place
+    def __init__(self, input_stream, block_size=BLOCK_SIZE):
         self.stream = input_stream
+        self.block_size = block_size
+
+        # tokens only carry their offset in the source, the source map is what
+        # turns an offset into a line/column when one is needed
+        self.source = SourceMap()
+
+        # Only a window of the source is kept in memory: the buffer holds the text
+        # from the current token onwards and is refilled from the stream a block at
+        # a time, so any text stream (files, stdin, pipes, sockets) can be lexed
+        # without seeking and in constant memory
+        self.buffer = ''
+        self.cursor = 0
+        self.base   = 0 # source offset of the start of the buffer
+        self.eos    = False
+
+        self.pattern = TOKEN_PATTERN
+        self.mapped = False
+        self.newline, self.escape, self.eol_comment, self.comment_end, self.call = TEXT_CHARS
+        self.release_at = sys.maxsize
+
+        # A mapped file is already all there: it is the buffer, offsets count bytes
+        # and only the lexemes are decoded
+        if isinstance(input_stream, (bytes, bytearray, mmap.mmap)):
+            self.stream = None
+            self.buffer = input_stream
+            self.eos = True
+            self.pattern = BYTES_TOKEN_PATTERN
+            self.mapped = True
+            self.newline, self.escape, self.eol_comment, self.comment_end, self.call = BYTE_CHARS
+            if isinstance(input_stream, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED'):
+                input_stream.madvise(mmap.MADV_SEQUENTIAL)
+                self.release_at = RELEASE_SIZE
 
     # Input Stream Helper Functions
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-    def __peek(self, len=1):
-        pos     = self.stream.tell()
-        symbol  = self.stream.read(len)
 
-        self.stream.seek(pos)
+    # make sure at least n characters past the cursor are buffered, unless the
+    # stream runs out first. Consumed text is dropped from the front of the buffer.
+    def __fill(self, n=1):
+        while not self.eos and len(self.buffer) - self.cursor < n:
+            block = self.stream.read(self.block_size)
+            if not block:
+                self.eos = True
+            self.buffer = self.buffer[self.cursor:] + block
+            self.base += self.cursor
+            self.cursor = 0
+
+    def __peek(self, n=1):
+        self.__fill(n)
+        return self.buffer[self.cursor:self.cursor + n]
+
+    def __read(self, n=1):
+        self.__fill(n)
+        symbol = self.buffer[self.cursor:self.cursor + n]
+        self.cursor += len(symbol)
         return symbol
 
-    def __read(self, len=1):
-        return self.stream.read(len)
-
-    def __back(self, len=1):
-        pos = self.stream.tell()
-        self.stream.seek(pos - len)
-
-    def __pos(self):
-        return self.stream.tell()
-
     def __goto(self, pos):
-        self.stream.seek(pos)
+        self.cursor = pos
 
     # Walk Functions
     # ~~~~~~~~~~~~~~
 
-    # walk through the stream until no more alphanumeric or underscores characters
-    # return the alphanumeric string
-    def __walkthru_id(self):
-        s = ''
-        while self.__peek().isalpha() or self.__peek().isdigit() or self.__peek() == '_':
-            s += self.__read()
-        return s
-
     # walk through string
     # end_char - either `'` or `"`
     def __walkthru_string(self, end_char):
-        s = ''
+        s = self.buffer[0:0]
+        start = self.base + self.cursor - 1 # errors are reported at the opening quote
 
         prev = self.__peek()
         while True:
             ch = self.__read()
 
-            if ch == '':
-                self.__raise('unexpected end of stream')
-            if ch == '\n':
-                self.__raise('encountered new line character in string')
+            if not ch:
+                self.__raise('unexpected end of stream', start)
+            if ch == self.newline:
+                self.__raise('encountered new line character in string', start)
 
             # break if encountered ending " and no leading \
-            if ch == end_char and prev != '\\':
+            if ch == end_char and prev != self.escape:
                 break
             # escape character
-            elif ch == '\\' and prev != '\\':
-                prev = '\\'
+            elif ch == self.escape and prev != self.escape:
+                prev = self.escape
                 continue
             # everything else
             else:
                 prev = ch
                 s += ch
 
-        return s
+        return self.__text(s)
 
+    # walk forward until just before the given terminator, or up to EOS. With count
+    # set, new lines in the skipped text are recorded.
+    # returns False if EOS was reached first
+    def __walkto(self, terminator, count=False):
+        while True:
+            end = self.buffer.find(terminator, self.cursor)
+            if end == -1:
+                # keep the tail in case the terminator is split across two blocks
+                end = len(self.buffer) if self.eos else max(self.cursor, len(self.buffer) - len(terminator) + 1)
+            if count:
+                self.__add_lines(self.cursor, end)
+            self.__goto(end)
+
+            if self.buffer[end:end + len(terminator)] == terminator:
+                return True
+            if self.eos:
+                return False
+            self.__fill(len(self.buffer) - self.cursor + self.block_size)
+
+    # walk past a comment starting at the cursor
     def __walkthru_comment(self):
-        while self.__peek(2) != '*/':
-            self.__read()
+        start = self.base + self.cursor
 
-    # walk through an integer
-    def __walkthru_int(self):
-        s = ''
-        while self.__peek().isdigit():
-            s += self.__read()
-        return s
+        # EOL Comments
+        # walks right up to the new line character but not passing (or otherwise
+        # EOS), the column is not advanced over the comment
+        if self.__peek(2) == self.eol_comment:
+            self.__walkto(self.newline)
+            end = self.base + self.cursor
+            self.source.add_shift(end, end - start)
 
-    # walk up to end of line or EOS, does not pass the actual new line character
-    def __walkto_eol(self):
-        while self.__peek() != '\n' and len(self.__peek()) != 0:
-            self.__read()
+        # Multi-Line Comments
+        else:
+            self.__read(2)
+            if not self.__walkto(self.comment_end, True):
+                self.__raise('unexpected end of stream in multi-line comment', start)
+            self.__read(2)
+            if self.mapped:
+                # columns after the comment count the characters of its last line
+                line_start = max(self.buffer.rfind(self.newline, start, self.cursor) + 1, start)
+                self.__add_decoded_shift(line_start, self.cursor)
+
+    # record the start of each line following a new line in buffer[start:end]
+    def __add_lines(self, start, end):
+        newline = self.buffer.find(self.newline, start, end)
+        while newline != -1:
+            self.source.add_line(self.base + newline + 1)
+            newline = self.buffer.find(self.newline, newline + 1, end)
+
+    # Mapped Files
+    # ~~~~~~~~~~~~
+
+    def __text(self, lexeme):
+        return lexeme.decode() if self.mapped else lexeme
+
+    # offsets in a mapped file count bytes but columns count characters, so any
+    # multi-byte characters in buffer[start:end] shift the columns after them
+    def __add_decoded_shift(self, start, end):
+        raw = self.buffer[start:end]
+        if not raw.isascii():
+            self.source.add_shift(end, len(raw) - len(raw.decode()))
+
+    # Redo a match that stopped at a non-ASCII character over the decoded text, up to
+    # the end of the line. Returns the kind and (encoded) lexeme of the token there,
+    # or (None, None) after skipping non-ASCII whitespace.
+    def __match_decoded(self):
+        size = self.block_size
+        while True:
+            end = self.buffer.find(self.newline, self.cursor, self.cursor + size)
+            if end == -1:
+                end = min(self.cursor + size, len(self.buffer))
+            # (a character cut off at the end of the window is left out)
+            text = codecs.getincrementaldecoder('utf-8')().decode(self.buffer[self.cursor:end])
+            m = TOKEN_PATTERN.match(text)
+            # a match running up to the end of a window that stops short of the line
+            # end may be longer still
+            if m.end() < len(text) or end == len(self.buffer) or self.buffer[end:end + 1] == self.newline:
+                break
+            size *= 2
+
+        space = len(m.group('SPACE').encode())
+        if space:
+            self.__add_decoded_shift(self.cursor, self.cursor + space)
+            self.__goto(self.cursor + space)
+            return None, None
+        if m.lastgroup == 'SPACE':
+            self.__raise('encountered unexpected character: \'' + text[:1] + '\'')
+
+        lexeme = m.group(m.lastgroup).encode()
+        self.__add_decoded_shift(self.cursor, self.cursor + len(lexeme))
+        return m.lastgroup, lexeme
+
+    # hand the pages that have been lexed back to the OS
+    def __release(self):
+        done = self.cursor - self.cursor % mmap.PAGESIZE
+        self.buffer.madvise(mmap.MADV_DONTNEED, 0, done)
+        self.release_at = self.cursor + RELEASE_SIZE
 
     # Next Token
     # ~~~~~~~~~~
 
     def next_token(self):
-        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-        # 8 is the length of the longest reserved keyword                           #
-        # Remember to update this number if a longer keyword is added!!!!!          #
-        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+        while True:
+            if not self.eos and len(self.buffer) - self.cursor < LOOKAHEAD:
+                self.__fill(LOOKAHEAD)
+            if self.cursor >= self.release_at:
+                self.__release()
+            m = self.pattern.match(self.buffer, self.cursor)
+
+            # Whitespace
+            # ~~~~~~~~~~
+            # (record new lines, but ignore as token)
+            start = m.end('SPACE')
+            if start != self.cursor:
+                self.__add_lines(self.cursor, start)
+                self.__goto(start)
+
+            # a match that runs into the last few buffered characters may be cut short,
+            # read another block and try again
+            if not self.eos and m.end() + LOOKAHEAD > len(self.buffer):
+                self.__fill(m.end() - start + LOOKAHEAD + 1)
+                continue
 
-        s = self.__peek(8)
+            kind = m.lastgroup
+            lexeme = m.group(kind)
+            end = m.end()
 
-        # EOS (End of File/Stream)
-        # ~~~~~~~~~~~~~~~~~~~~~~~~
-        if len(s) == 0:
-            return self.__token(Token.EOS, '', 0)
+            # in a mapped file, a non-ASCII character right after the match may still
+            # be part of it
+            if self.mapped and kind in DECODED_KINDS and end < len(self.buffer) and self.buffer[end] >= 0x80:
+                kind, lexeme = self.__match_decoded()
+                if kind is None:
+                    continue
+                end = start + len(lexeme)
 
-        # EOL Comments
-        # ~~~~~~~~~~~~
-        if (s[:2] == '//'):
-            # walks right up to the new line character but not passing (or otherwise
-            # EOS) calling next_token() will invoke the whitespace condition for "\n"
-            # which'll update the line number and reset the column to 0
-            self.__walkto_eol()
-            return self.next_token()
+            if kind != 'COMMENT':
+                break
 
-        # Multi-Line Comments
-        # ~~~~~~~~~~~~~~~~~~~
-        elif (s[:1] == '/*'):
+            # Comments
+            # ~~~~~~~~
             self.__walkthru_comment()
-            return self.next_token()
-
-        # Default functions
-        # ~~~~~~~~~~~~~~~~~
-        elif (s[:8] == 'println('):
-            return self.__token(Token.PRINTLN, 'println', 7)
-        elif (s[:8] == 'readstr('):
-            return self.__token(Token.READSTR, 'readstr', 7)
-        elif (s[:8] == 'readint('):
-            return self.__token(Token.READINT, 'readint', 7)
-        elif (s[:6] == 'print('):
-            return self.__token(Token.PRINT, 'print', 5)
-        elif (s[:4] == 'len('):
-            return self.__token(Token.LEN, 'len', 3)
-
-        # Relational Operators
-        # ~~~~~~~~~~~~~~~~~~~~
-        # (this section must be before 'Math and Other Operators')
-        # Must put longer before shorter, otherwise, '<', for example, could override '<='
-
-        elif (s[:2] == '=='):
-            return self.__token(Token.EQUAL, '==', 2)
-        elif (s[:2] == '<='):
-            return self.__token(Token.LESS_THAN_EQUAL, '<=', 2)
-        elif (s[:2] == '>='):
-            return self.__token(Token.GREATER_THAN_EQUAL, '>=', 2)
-        elif (s[:2] == '!='):
-            return self.__token(Token.NOT_EQUAL, '!=', 2)
-        elif (s[:1] == '<'):
-            return self.__token(Token.LESS_THAN, '<', 1)
-        elif (s[:1] == '>'):
-            return self.__token(Token.GREATER_THAN, '>', 1)
-
-        # Keywords
-        # ~~~~~~~~~
-        elif (s[:7] == 'else if'):
-            return self.__token(Token.ELSEIF, 'elseif', 7)
-        elif (s[:5] == 'while'):
-            return self.__token(Token.WHILE, 'while', 5)
-        elif (s[:4] == 'else'):
-            return self.__token(Token.ELSE, 'else', 4)
-        elif (s[:3] == 'not'):
-            return self.__token(Token.NOT, 'not', 3)
-        elif (s[:3] == 'and'):
-            return self.__token(Token.AND, 'and', 3)
-        elif (s[:2] == 'if'):
-            return self.__token(Token.IF, 'if', 2)
-        elif (s[:2] == 'or'):
-            return self.__token(Token.OR, 'or', 2)
-
-        # Math and Other Operators
+
+        # EOS (End of File/Stream)
         # ~~~~~~~~~~~~~~~~~~~~~~~~
-        elif (s[:1] == '+'):
-            return self.__token(Token.PLUS, '+', 1)
-        elif (s[:1] == '-'):
-            return self.__token(Token.MINUS, '-', 1)
-        elif (s[:1] == '/'):
-            return self.__token(Token.DIVIDE, '/', 1)
-        elif (s[:1] == '*'):
-            return self.__token(Token.MULTIPLY, '*', 1)
-        elif (s[:1] == '%'):
-            return self.__token(Token.MODULUS, '%', 1)
-        elif (s[:1] == '='):
-            return self.__token(Token.ASSIGN, '=', 1)
-
-
-        # Various Syntax
-        # ~~~~~~~~~~~~~~
-        elif (s[:1] == ','):
-            return self.__token(Token.COMMA, ',', 1)
-        elif (s[:1] == ';'):
-            return self.__token(Token.SEMICOLON, ';', 1)
-        elif (s[:1] == '('):
-            return self.__token(Token.LPAREN, '(', 1)
-        elif (s[:1] == ')'):
-            return self.__token(Token.RPAREN, ')', 1)
-        elif (s[:1] == '['):
-            return self.__token(Token.LBRACKET, '[', 1)
-        elif (s[:1] == ']'):
-            return self.__token(Token.RBRACKET, ']', 1)
-        elif (s[:1] == '{'):
-            return self.__token(Token.LBRACE, '{', 1)
-        elif (s[:1] == '}'):
-            return self.__token(Token.RBRACE, '}', 1)
-
-        # Boolean Literals
-        # ~~~~~~~~~~~~~~~~
-        elif (s[:4] == 'true'):
-            return self.__token(Token.BOOL, 'true', 4)
-        elif (s[:5] == 'false'):
-            return self.__token(Token.BOOL, 'false', 5)
+        if kind == 'SPACE':
+            if self.cursor >= len(self.buffer):
+                return Token(Token.EOS, '', self.base + start, self.source)
+            self.__raise('encountered unexpected character: \'' + self.__text(self.__peek()) + '\'')
+
+        self.__goto(end)
+
+        # Identifiers, Keywords and Default functions
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        # (identifier lexemes are interned, so repeated names share one string)
+        if kind == 'ID':
+            lexeme = sys.intern(lexeme.decode() if self.mapped else lexeme)
+            type = KEYWORDS.get(lexeme)
+            if type is None:
+                type = BUILTINS.get(lexeme)
+                if type is None or self.buffer[end:end + 1] != self.call:
+                    type = Token.ID
+            return Token(type, lexeme, self.base + start, self.source)
+
+        # Operators and Various Syntax
+        # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+        elif kind == 'SYMBOL':
+            lexeme = sys.intern(lexeme.decode() if self.mapped else lexeme)
+            return Token(SYMBOLS[lexeme], lexeme, self.base + start, self.source)
 
         # Number Literals
         # ~~~~~~~~~~~~~~~
-        elif (s[:1].isdigit()):
-            i = self.__walkthru_int()
-            return self.__token(Token.INT, i, len(i), False)
+        elif kind == 'INT':
+            return Token(Token.INT, lexeme.decode() if self.mapped else lexeme, self.base + start, self.source)
 
         # String Literals
         # ~~~~~~~~~~~~~~~
-
-        elif (s[:1] == '"' or s[:1] == "'"):
-            self.__read(1) # skip the first " character
-            s = self.__walkthru_string(s[:1]) # walks until ending "/' character (or errors on EOS or EOL)
-            return self.__token(Token.STRING, s, len(s), False)
-
-        # Identifiers
-        # ~~~~~~~~~~~
-
-        elif (s[:1].isalpha()):
-            id = self.__walkthru_id()
-            return self.__token(Token.ID, id, len(id), False)
-
-        # Whitespace
-        # ~~~~~~~~~~
-        # (update column/line, but ignore as token)
-        elif (s[:1].isspace()):
-            if (s[:1] == '\n'):
-                self.line += 1
-                self.column = 1
-            else:
-                self.column += 1
-
-            self.__read()
-            return self.next_token()
-
-        # Unknown Tokens
-        # ~~~~~~~~~~~~~~
+        # columns after a string are counted from the length of its contents
+        elif kind == 'STRING':
+            s = self.__text(lexeme[1:-1])
+            self.source.add_shift(self.base + end, end - start - len(s))
+            return Token(Token.STRING, s, self.base + start, self.source)
+        elif kind == 'QUOTE':
+            offset = self.base + start
+            s = self.__walkthru_string(lexeme) # walks until ending "/' character (or errors on EOS or EOL)
+            end = self.base + self.cursor
+            self.source.add_shift(end, end - offset - len(s))
+            return Token(Token.STRING, s, offset, self.source)
+
+        # 'else if'
+        # ~~~~~~~~~
         else:
-            self.__raise('encountered unexpected character: \'' + s[:1] + '\'')
+            return Token(Token.ELSEIF, 'elseif', self.base + start, self.source)
 
     # Create a DNE token - represents a token of length 0 (a token that Does Not Exist)
     # Used represent that the space between two directly adjacent tokens has some significance
     def DNE_token(self):
-        return self.__token(Token.DNE, '', 0, False)
-
-    # Token object creation helper
-    # params:
-    #   type    - the token type
-    #   lexeme  - the token lexeme
-    #   inc     - the length of the lexeme, in otherwords, the number to INCrement the column/read by
-    #   do_read - option to not do __read since the '__walk*' functions do __read on their own
-    def __token(self, type, lexeme, inc, do_read = True):
-        t = Token(type, lexeme, self.line, self.column)
-
-        if do_read:
-            self.__read(inc)
-
-        self.column += inc
-        return t
+        return Token(Token.DNE, '', self.base + self.cursor, self.source)
 
     # Raise an error -- a helper function because this is shorter to type
-    def __raise(self, message):
-        raise Error(message, self.line, self.column)
-
+    # offset - where the error is reported, defaults to the cursor
+    def __raise(self, message, offset=None):
+        if offset is None:
+            offset = self.base + self.cursor
+        line, column = self.source.position(offset)
+        raise Error(message, line, column)
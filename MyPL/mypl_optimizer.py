@@ -0,0 +1,808 @@
+#!python3
+# AST optimizations, run on a type checked program before it runs. Each rewrites the
+# AST in place into one that gives exactly the same output.
+
+from mypl_util import *
+from mypl_token import *
+import mypl_ast
+
+# a literal SimpleExpr of a value, at a token's place in the source (so errors reported
+# at the expression are reported at the same place)
+def literal(value, token):
+    if type(value) is bool:
+        term = Token(Token.BOOL, "true" if value else "false", token.offset, token.source)
+    elif type(value) is int:
+        term = Token(Token.INT, str(value), token.offset, token.source)
+    else:
+        term = Token(Token.STRING, value, token.offset, token.source)
+    return mypl_ast.SimpleExpr(term)
+
+# the value of a boolean expression that is constant, or None
+def bool_constant(bool_expr):
+    if type(bool_expr) is mypl_ast.SimpleBoolExpr and is_literal(bool_expr.expr):
+        value = True if literal_value(bool_expr.expr.term) else False
+        return (not value) if bool_expr.negated else value
+    return None
+
+class Optimizer(mypl_ast.StackVisitor):
+    """Folds constants and removes code that can't run (-O 1).
+
+    - arithmetic on INT literals (+, - and *, and % by anything but 0) and STRING
+      concatenation of literals is worked out ahead of time (/ is left alone, it gives
+      floats and there are no float literals)
+    - comparisons of literals and and/or of constants become true or false
+    - branches of an if whose condition is false are removed, and so are those after
+      one whose condition is true (which becomes the else). An if left with just an
+      else is replaced by the else's statements, a while whose condition is false is
+      removed
+    - x * 1, 1 * x and x - 0 become x (only those, x can be a float after a /, and
+      0 + x or x * 0 would turn a -0.0 into a 0.0 or a 0.0 into a 0)
+
+    Visiting an expression leaves its replacement (possibly itself) in node, visiting
+    a statement leaves the statements that replace it in stmts. The replaced
+    statements of a branch join the enclosing statement list. This changes no
+    program's output: every variable is assigned before it's read, so which
+    environment it lives in doesn't show.
+    """
+
+    def __init__(self):
+        self.node = None
+        self.stmts = None
+
+    def visit_stmt_list(self, stmt_list):
+        stmts = []
+        for stmt in stmt_list.stmts:
+            yield stmt
+            stmts.extend(self.stmts)
+        stmt_list.stmts = stmts
+        self.node = stmt_list
+
+    # PRINT/READ STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_print_stmt(self, print_stmt):
+        yield print_stmt.expr
+        print_stmt.expr = self.node
+        self.stmts = [print_stmt]
+
+    def visit_read_expr(self, read_expr):
+        yield read_expr.expr
+        read_expr.expr = self.node
+        self.node = read_expr
+
+    # LEN EXPR
+    # ~~~~~~~~
+
+    def visit_len_expr(self, len_expr):
+        yield len_expr.expr
+        len_expr.expr = self.node
+        self.node = len_expr
+
+    # ASSIGN STATEMENT
+    # ~~~~~~~~~~~~~~~~
+
+    def visit_assign_stmt(self, assign_stmt):
+        if assign_stmt.index_expr != None:
+            yield assign_stmt.index_expr
+            assign_stmt.index_expr = self.node
+        yield assign_stmt.rhs
+        assign_stmt.rhs = self.node
+        self.stmts = [assign_stmt]
+
+    # EXPR/ID/VALUE STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_expr(self, simple_expr):
+        self.node = simple_expr
+
+    def visit_index_expr(self, index_expr):
+        yield index_expr.expr
+        index_expr.expr = self.node
+        self.node = index_expr
+
+    def visit_list_expr(self, list_expr):
+        expressions = []
+        for expr in list_expr.expressions:
+            yield expr
+            expressions.append(self.node)
+        list_expr.expressions = expressions
+        self.node = list_expr
+
+    def visit_complex_expr(self, complex_expr):
+        yield complex_expr.first_operand
+        first = complex_expr.first_operand = self.node
+        yield complex_expr.second_operand
+        second = complex_expr.second_operand = self.node
+        rel = complex_expr.rel.type
+        self.node = complex_expr
+
+        # (only where the type checker knows the Interpreter's operation)
+        if complex_expr.type == Token.STRING and rel == Token.PLUS:
+            if is_literal(first) and is_literal(second):
+                value = literal_value(first.term) + cast_str(literal_value(second.term))
+                self.node = literal(value, first.term)
+        elif complex_expr.type == Token.INT:
+            if is_literal(first) and is_literal(second):
+                l = literal_value(first.term)
+                r = literal_value(second.term)
+                if rel == Token.PLUS:
+                    self.node = literal(l + r, first.term)
+                elif rel == Token.MINUS:
+                    self.node = literal(l - r, first.term)
+                elif rel == Token.MULTIPLY:
+                    self.node = literal(l * r, first.term)
+                elif rel == Token.MODULUS and r != 0:
+                    self.node = literal(l % r, first.term)
+            elif rel == Token.MULTIPLY and is_literal(second) and literal_value(second.term) == 1:
+                self.node = first
+            elif rel == Token.MULTIPLY and is_literal(first) and literal_value(first.term) == 1:
+                self.node = second
+            elif rel == Token.MINUS and is_literal(second) and literal_value(second.term) == 0:
+                self.node = first
+
+    # BOOLEAN EXPRESSIONS
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_bool_expr(self, simple_bool_expr):
+        yield simple_bool_expr.expr
+        simple_bool_expr.expr = self.node
+        self.node = simple_bool_expr
+
+    def visit_complex_bool_expr(self, complex_bool_expr):
+        yield complex_bool_expr.first_expr
+        first = complex_bool_expr.first_expr = self.node
+        yield complex_bool_expr.second_expr
+        second = complex_bool_expr.second_expr = self.node
+
+        if complex_bool_expr.has_bool_connector:
+            yield complex_bool_expr.second_operand
+            complex_bool_expr.second_operand = self.node
+        self.node = complex_bool_expr
+
+        if not is_literal(first) or not is_literal(second):
+            return
+        l = literal_value(first.term)
+        r = literal_value(second.term)
+        rel = complex_bool_expr.bool_rel.type
+        if rel == Token.EQUAL:
+            result = (l == r)
+        elif rel == Token.NOT_EQUAL:
+            result = (l != r)
+        elif rel == Token.LESS_THAN:
+            result = (l < r)
+        elif rel == Token.GREATER_THAN:
+            result = (l > r)
+        elif rel == Token.LESS_THAN_EQUAL:
+            result = (l <= r)
+        elif rel == Token.GREATER_THAN_EQUAL:
+            result = (l >= r)
+        else:
+            return # (fails when run)
+
+        if complex_bool_expr.has_bool_connector:
+            result2 = bool_constant(complex_bool_expr.second_operand)
+            if result2 is None:
+                return
+            if complex_bool_expr.bool_connector.type == Token.AND:
+                result = (result and result2)
+            else:
+                result = (result or result2)
+
+        self.node = mypl_ast.SimpleBoolExpr(literal(result, first.term))
+
+    # IF STATEMENTS
+    # ~~~~~~~~~~~~~
+
+    def visit_if_stmt(self, if_stmt):
+        parts = [if_stmt.if_part] + if_stmt.elseifs
+        for part in parts:
+            yield part.bool_expr
+            part.bool_expr = self.node
+            yield part.stmt_list
+        if if_stmt.has_else:
+            yield if_stmt.else_stmts
+
+        # the parts that can run, up to one that always does
+        kept = []
+        else_stmts = if_stmt.else_stmts if if_stmt.has_else else None
+        for part in parts:
+            value = bool_constant(part.bool_expr)
+            if value is None:
+                kept.append(part)
+            elif value:
+                else_stmts = part.stmt_list
+                break
+
+        if len(kept) == 0:
+            self.stmts = [] if else_stmts is None else else_stmts.stmts
+            return
+
+        if_stmt.if_part = kept[0]
+        if_stmt.elseifs = kept[1:]
+        if_stmt.has_else = else_stmts is not None
+        if_stmt.else_stmts = else_stmts
+        self.stmts = [if_stmt]
+
+    # LOOP STATEMENTS
+    # ~~~~~~~~~~~~~~~
+
+    def visit_while_stmt(self, while_stmt):
+        yield while_stmt.bool_expr
+        while_stmt.bool_expr = self.node
+        yield while_stmt.stmt_list
+
+        if bool_constant(while_stmt.bool_expr) == False:
+            self.stmts = []
+        else:
+            self.stmts = [while_stmt]
+
+    # the expressions of a for loop's range (evaluated once, before the loop)
+    def fold_range(self, for_stmt):
+        yield for_stmt.start_expr
+        for_stmt.start_expr = self.node
+        yield for_stmt.end_expr
+        for_stmt.end_expr = self.node
+        if for_stmt.step_expr != None:
+            yield for_stmt.step_expr
+            for_stmt.step_expr = self.node
+
+    def visit_for_stmt(self, for_stmt):
+        yield from self.fold_range(for_stmt)
+        yield for_stmt.stmt_list
+        self.stmts = [for_stmt]
+
+# LOOP OPTIMIZATIONS (-O 2)
+# ------------------------------------------------------------------------------------------
+
+# the expressions an expression is made of, in the order they're evaluated
+def operands(expr):
+    expr_type = type(expr)
+    if expr_type is mypl_ast.SimpleExpr:
+        return []
+    elif expr_type is mypl_ast.ComplexExpr:
+        return [expr.first_operand, expr.second_operand]
+    elif expr_type is mypl_ast.ListExpr:
+        return list(expr.expressions)
+    elif expr_type is mypl_ast.ComplexBoolExpr:
+        if expr.has_bool_connector:
+            return [expr.first_expr, expr.second_expr, expr.second_operand]
+        return [expr.first_expr, expr.second_expr]
+    else: # index, len, read and simple bool expressions
+        return [expr.expr]
+
+def set_operand(expr, index, operand):
+    expr_type = type(expr)
+    if expr_type is mypl_ast.ComplexExpr:
+        if index == 0:
+            expr.first_operand = operand
+        else:
+            expr.second_operand = operand
+    elif expr_type is mypl_ast.ListExpr:
+        expr.expressions[index] = operand
+    elif expr_type is mypl_ast.ComplexBoolExpr:
+        if index == 0:
+            expr.first_expr = operand
+        elif index == 1:
+            expr.second_expr = operand
+        else:
+            expr.second_operand = operand
+    else:
+        expr.expr = operand
+
+# the expressions of a tree in the order they're evaluated, each after its operands
+# (without recursion, expressions can be nested deeper than Python can recurse)
+def evaluation_order(expr):
+    stack = [(expr, iter(operands(expr)))]
+    while stack:
+        node, rest = stack[-1]
+        for operand in rest:
+            stack.append((operand, iter(operands(operand))))
+            break
+        else:
+            stack.pop()
+            yield node
+
+# if an expression's value is surely of the type the type checker gave it, its operands'
+# being recorded in typed (by id()). Not so for an array element (NA), arithmetic on
+# one, a / (a float, typed INT), or a variable in untyped (see untyped_variables())
+def is_typed(expr, typed, untyped):
+    expr_type = type(expr)
+    if expr_type is mypl_ast.SimpleExpr:
+        return expr.term.type != Token.ID or expr.term.lexeme not in untyped
+    elif expr_type is mypl_ast.ComplexExpr:
+        return expr.type != Token.NA and expr.rel.type != Token.DIVIDE and \
+            typed[id(expr.first_operand)] and typed[id(expr.second_operand)]
+    return expr_type is not mypl_ast.IndexExpr
+
+# the names of the variables whose values may not be of the types the type checker gave
+# them, from the (name, expression) assignments of a program. It types a variable by the
+# assignments to it in the order they're written, not in the order they run: once one
+# that isn't is_typed() is written, the type it gives the variable can be wrong anywhere,
+# as can the types of the variables assigned expressions of it
+def untyped_variables(assignments):
+    untyped = set()
+    readers = {} # name -> the names of the variables assigned expressions of it
+    for name, expr in assignments:
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            node_type = type(node)
+            if node_type is mypl_ast.SimpleExpr:
+                if node.term.type == Token.ID:
+                    readers.setdefault(node.term.lexeme, []).append(name)
+            elif node_type is mypl_ast.IndexExpr or (node_type is mypl_ast.ComplexExpr and \
+                    (node.type == Token.NA or node.rel.type == Token.DIVIDE)):
+                untyped.add(name)
+            elif node_type is mypl_ast.ComplexExpr:
+                stack.append(node.first_operand)
+                stack.append(node.second_operand)
+            # (len(), reads and lists are of their types, whatever they're of)
+    names = list(untyped)
+    while names:
+        for name in readers.get(names.pop(), []):
+            if name not in untyped:
+                untyped.add(name)
+                names.append(name)
+    return untyped
+
+# if evaluating an expression (once its operands are, typed as is_typed()) can raise an
+# error or read input: arithmetic other than +, - and * of INTs and concatenating a STRING
+# to a STRING (/ and % by 0, an INT too long to write out), arithmetic on a value that
+# may not be of its type, indexing (out of bounds), ordering comparisons (of an INT and a
+# STRING) and reads
+def may_fail(expr, typed):
+    expr_type = type(expr)
+    if expr_type is mypl_ast.ComplexExpr:
+        if not typed[id(expr.first_operand)] or not typed[id(expr.second_operand)]:
+            return True
+        rel = expr.rel.type
+        if expr.type == Token.INT:
+            return rel != Token.PLUS and rel != Token.MINUS and rel != Token.MULTIPLY
+        return expr.type != Token.STRING or rel != Token.PLUS or \
+            not concatenates(expr.second_operand)
+    elif expr_type is mypl_ast.ComplexBoolExpr:
+        return expr.bool_rel.type != Token.EQUAL and expr.bool_rel.type != Token.NOT_EQUAL
+    return expr_type is mypl_ast.IndexExpr or expr_type is mypl_ast.ReadExpr
+
+# if an expression (typed as is_typed()) can be concatenated to a STRING without failing:
+# it isn't an INT (one may be too long to write out), or it's a len(). A variable may be
+# an INT
+def concatenates(expr):
+    expr_type = type(expr)
+    if expr_type is mypl_ast.SimpleExpr:
+        return expr.term.type != Token.ID and expr.term.type != Token.INT
+    elif expr_type is mypl_ast.ComplexExpr:
+        return expr.type == Token.STRING
+    elif expr_type is mypl_ast.ReadExpr:
+        return not expr.is_read_int
+    return expr_type is mypl_ast.LenExpr
+
+# a key equal for expressions of literals, variables, arithmetic and len() written the
+# same way (so, worked out at the same place, of the same value)
+def shape(expr):
+    keys = {}
+    for node in evaluation_order(expr):
+        node_type = type(node)
+        if node_type is mypl_ast.SimpleExpr:
+            keys[id(node)] = ('s', node.term.type, node.term.lexeme)
+        elif node_type is mypl_ast.ComplexExpr:
+            keys[id(node)] = ('c', node.rel.type, node.type, keys[id(node.first_operand)],
+                              keys[id(node.second_operand)])
+        else: # len
+            keys[id(node)] = ('l', keys[id(node.expr)])
+    return keys[id(expr)]
+
+# the token to report an expression at: the first one of it
+def position(expr):
+    while True:
+        if type(expr) is mypl_ast.LenExpr:
+            expr = expr.expr
+        elif type(expr) is mypl_ast.ComplexExpr:
+            expr = expr.first_operand
+        else:
+            return expr.first_token()
+
+# the kinds of expressions worth working out ahead of time
+HOISTED = (mypl_ast.ComplexExpr, mypl_ast.IndexExpr, mypl_ast.LenExpr)
+
+class Loop(object):
+    """What the body of a loop changes, and what is hoisted out of it"""
+
+    def __init__(self):
+        self.assigned = set() # names of the variables it assigns
+        self.stores = False   # if it assigns an element of an array
+        self.appends = False  # if it appends to an array
+        self.hoisted = []     # assignments to run before the loop instead
+        self.shared = {}      # the names of the variables of hoisted expressions, by shape()
+
+class LoopEffects(mypl_ast.StackVisitor):
+    """Finds what the body of each loop changes, nested loops included: loops is
+    {id(while_stmt or for_stmt): Loop}. A for loop changes its variable. Arrays are
+    shared, so assigning an element of one (or appending to it) is taken to change
+    them all. Also lists the (name, expression) assignments to variables, loops or
+    not, in assignments.
+    """
+
+    def __init__(self):
+        self.loops = {}
+        self.open = [] # the loops being visited, innermost last
+        self.assignments = []
+
+    def visit_stmt_list(self, stmt_list):
+        for stmt in stmt_list.stmts:
+            yield stmt
+
+    def visit_print_stmt(self, print_stmt):
+        pass
+
+    def visit_assign_stmt(self, assign_stmt):
+        if assign_stmt.index_expr == None:
+            self.assignments.append((assign_stmt.lhs.lexeme, assign_stmt.rhs))
+        if len(self.open) == 0:
+            return
+        loop = self.open[-1]
+        loop.assigned.add(assign_stmt.lhs.lexeme)
+        if assign_stmt.index_expr != None:
+            loop.stores = True
+            if type(assign_stmt.index_expr) is mypl_ast.SimpleExpr and \
+                    assign_stmt.index_expr.term.type == Token.DNE:
+                loop.appends = True
+
+    def visit_if_stmt(self, if_stmt):
+        yield if_stmt.if_part.stmt_list
+        for elseif in if_stmt.elseifs:
+            yield elseif.stmt_list
+        if if_stmt.has_else:
+            yield if_stmt.else_stmts
+
+    def visit_while_stmt(self, while_stmt):
+        yield from self.__loop(while_stmt, Loop())
+
+    def visit_for_stmt(self, for_stmt):
+        loop = Loop()
+        loop.assigned.add(for_stmt.var.lexeme)
+        yield from self.__loop(for_stmt, loop)
+
+    def __loop(self, stmt, loop):
+        self.loops[id(stmt)] = loop
+        self.open.append(loop)
+        yield stmt.stmt_list
+        self.open.pop()
+        if len(self.open) > 0:
+            outer = self.open[-1]
+            outer.assigned |= loop.assigned
+            outer.stores = outer.stores or loop.stores
+            outer.appends = outer.appends or loop.appends
+
+class LoopOptimizer(Optimizer):
+    """Optimizer, and moves work out of while and for loops (-O 2).
+
+    - len() of a variable (or literal) is worked out once, before the outermost loop
+      around it that doesn't assign the variable or append to any array (a for loop's
+      range is outside the loop, it's only evaluated once)
+    - the largest expressions in a loop body that can't fail (len(), and +, - and * of
+      INTs and concatenation to a STRING, of literals and variables, see may_fail()) are
+      worked out once, before the outermost loop around them that doesn't assign their
+      variables, e.g.
+      `while i < 100 { s = s + k * 7; i = i + 1; }` becomes
+      `_t0 = k * 7; while i < 100 { s = s + _t0; i = i + 1; }`
+    - the largest expressions in a while condition that don't change in the loop are
+      worked out once, before the loop, if nothing evaluated before them in the
+      condition can fail or read input
+    - an expression a statement evaluates more than once is worked out once, before the
+      statement, if nothing evaluated before its first time can fail or read input,
+      and where it saves visiting nodes: (times - 1) * (nodes - 1) > 2
+
+    Each is worked out into a new variable (_t0, _t1, ..., which can't be MyPL
+    names) that replaces it. This changes no program's output:
+    - none of these read input, so working one out earlier or fewer times only matters
+      if its value changes, if it fails, or if it makes an array that is then kept
+      more than once (which a condition never does, and a statement is checked for)
+    - its value can't change: the variables it reads keep their values through the loop
+      (or statement), and so do the arrays it indexes or takes the len() of
+    - working out len() or an expression hoisted out of a body before a loop that
+      doesn't run it changes nothing: len() takes any value, and the expression only
+      reads variables the type checker surely typed right (see untyped_variables()), so
+      its operands are of the types it was checked for and it raises no error on them.
+      A condition (or statement) is always evaluated up to the expression once the loop
+      (or statement) is reached, so where the expression fails it fails all the same,
+      with the same error
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.effects = None # {id(while_stmt or for_stmt): Loop}, found on the first visit
+        self.untyped = None # untyped_variables(), found then too (and the temps of them)
+        self.loops = []     # the Loops being visited, innermost last
+        self.temps = 0
+
+    # HELPER FUNCTIONS
+    # ~~~~~~~~~~~~~~~~
+
+    # an assignment of expr to a new variable, and the variable's name (a Token)
+    def __temp(self, expr):
+        token = position(expr)
+        name = Token(Token.ID, '_t' + str(self.temps), token.offset, token.source)
+        self.temps += 1
+        typed = {}
+        for node in evaluation_order(expr):
+            typed[id(node)] = is_typed(node, typed, self.untyped)
+        if not typed[id(expr)]:
+            self.untyped.add(name.lexeme)
+        return mypl_ast.AssignStmt(name, None, expr), name
+
+    # work expr out before the loop self.loops[k], returns what replaces it
+    def __hoist(self, expr, k):
+        assign_stmt, name = self.__temp(expr)
+        self.loops[k].hoisted.append(assign_stmt)
+        for loop in self.loops[:k]:
+            loop.assigned.add(name.lexeme)
+        return mypl_ast.SimpleExpr(name)
+
+    # the same for an expression of literals, variables, arithmetic and len(), once for
+    # all those written the same way
+    def __hoist_shared(self, expr, k):
+        key = shape(expr)
+        name = self.loops[k].shared.get(key)
+        if name is None:
+            read = self.__hoist(expr, k)
+            self.loops[k].shared[key] = read.term
+            return read
+        return mypl_ast.SimpleExpr(name)
+
+    # if an expression (not its operands) reads nothing a loop changes
+    def __invariant(self, expr, loop):
+        expr_type = type(expr)
+        if expr_type is mypl_ast.SimpleExpr:
+            return expr.term.type != Token.ID or expr.term.lexeme not in loop.assigned
+        elif expr_type is mypl_ast.IndexExpr:
+            return not loop.stores and expr.identifier.lexeme not in loop.assigned
+        elif expr_type is mypl_ast.LenExpr:
+            return not loop.appends
+        return expr_type is mypl_ast.ComplexExpr
+
+    # the index in loops of the outermost loop an expression (not its operands) can be
+    # worked out before, the loops inside it not changing what it reads. len(loops) if
+    # there's none, or if it can fail, reads input or makes an array
+    def __level(self, expr, typed):
+        expr_type = type(expr)
+        if expr_type is mypl_ast.ComplexExpr:
+            if may_fail(expr, typed) or (expr.type != Token.INT and expr.type != Token.STRING):
+                return len(self.loops)
+        elif expr_type is not mypl_ast.SimpleExpr and expr_type is not mypl_ast.LenExpr:
+            return len(self.loops)
+        k = len(self.loops)
+        while k > 0 and self.__invariant(expr, self.loops[k - 1]):
+            k -= 1
+        return k
+
+    # hoist the largest expressions of a statement in a loop body (its roots, None for
+    # none) that can't fail and don't change, each out of the outermost loop it can
+    def __hoist_invariants(self, roots):
+        if len(self.loops) == 0:
+            return
+        level = {}
+        typed = {}
+        for root in roots:
+            if root is None:
+                continue
+            for node in evaluation_order(root):
+                typed[id(node)] = is_typed(node, typed, self.untyped)
+                k = self.__level(node, typed)
+                for operand in operands(node):
+                    k = max(k, level[id(operand)])
+                level[id(node)] = k
+
+        def hoists(expr):
+            return level[id(expr)] < len(self.loops) and \
+                (type(expr) is mypl_ast.ComplexExpr or type(expr) is mypl_ast.LenExpr)
+
+        for i, root in enumerate(roots):
+            if root is None:
+                continue
+            if hoists(root):
+                roots[i] = self.__hoist_shared(root, level[id(root)])
+                continue
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                for index, operand in enumerate(operands(node)):
+                    if hoists(operand):
+                        set_operand(node, index, self.__hoist_shared(operand, level[id(operand)]))
+                    else:
+                        stack.append(operand)
+
+    # hoist the largest invariant expressions out of the innermost loop's condition, up
+    # to the first thing evaluated that can fail
+    def __hoist_condition(self, bool_expr):
+        k = len(self.loops) - 1
+        invariant = {}
+        typed = {}
+        for node in evaluation_order(bool_expr):
+            typed[id(node)] = is_typed(node, typed, self.untyped)
+            invariant[id(node)] = self.__invariant(node, self.loops[k]) and \
+                all(invariant[id(operand)] for operand in operands(node))
+
+        stack = [(bool_expr, 0)] # (expression, index of the operand to visit next)
+        while stack:
+            node, index = stack.pop()
+            nodes = operands(node)
+            if index == len(nodes):
+                if may_fail(node, typed):
+                    return
+                continue
+            stack.append((node, index + 1))
+            operand = nodes[index]
+            if invariant[id(operand)] and type(operand) in HOISTED:
+                set_operand(node, index, self.__hoist(operand, k))
+            else:
+                stack.append((operand, 0))
+
+    # work the expressions evaluated more than once in a statement's roots (its
+    # expressions, in the order they're evaluated, None for none) out before it, kept
+    # being the one whose value the statement keeps. Returns the assignments that do so
+    def __eliminate(self, roots, kept):
+        temps = []
+        while True:
+            # number the expressions evaluated (the same number, the same value), in
+            # the order they are: the temps, then the statement
+            numbers = {} # key -> number
+            number = {}  # id(node) -> number
+            size = {}    # id(node) -> number of nodes
+            pure = {}    # id(node) -> if it reads no input and makes no array
+            typed = {}   # id(node) -> is_typed()
+            count = {}   # number -> times evaluated
+            stored = {}  # number -> times its value is kept (in a variable or an array)
+            first = {}   # number -> (root, node, if nothing evaluated before can fail)
+            failed = []  # [i] -> if something evaluated before the i-th node can fail
+            can_fail = False
+            for root in [assign_stmt.rhs for assign_stmt in temps] + roots:
+                if root is None:
+                    continue
+                for node in evaluation_order(root):
+                    nodes = operands(node)
+                    key = self.__key(node, [number[id(operand)] for operand in nodes])
+                    n = number[id(node)] = numbers.setdefault(key, len(numbers))
+                    size[id(node)] = 1 + sum(size[id(operand)] for operand in nodes)
+                    pure[id(node)] = key[0] != 'x' and all(pure[id(operand)] for operand in nodes)
+                    count[n] = count.get(n, 0) + 1
+                    if node is kept:
+                        stored[n] = stored.get(n, 0) + 1
+                    if type(node) is mypl_ast.ListExpr:
+                        for operand in nodes:
+                            m = number[id(operand)]
+                            stored[m] = stored.get(m, 0) + 1
+                    typed[id(node)] = is_typed(node, typed, self.untyped)
+                    failed.append(can_fail)
+                    if n not in first:
+                        first[n] = (root, node, not failed[len(failed) - size[id(node)]])
+                    if may_fail(node, typed):
+                        can_fail = True
+
+            # the largest one worth it
+            best = None
+            for n, (root, node, safe) in first.items():
+                if not safe or not pure[id(node)] or type(node) not in HOISTED:
+                    continue
+                if (count[n] - 1) * (size[id(node)] - 1) <= 2:
+                    continue
+                # (a ComplexExpr can make an array, kept twice it'd be one array kept twice)
+                if type(node) is mypl_ast.ComplexExpr and stored.get(n, 0) > 1:
+                    continue
+                if best is None or size[id(node)] > size[id(best[1])]:
+                    best = (n, node, root)
+            if best is None:
+                return temps
+            n, node, root = best
+
+            # the new temp goes before the temp (or statement) it's first evaluated in
+            assign_stmt, name = self.__temp(node)
+            for loop in self.loops:
+                loop.assigned.add(name.lexeme)
+            at = len(temps)
+            for i, temp in enumerate(temps):
+                if temp.rhs is root:
+                    at = i
+                    break
+            for temp in temps:
+                self.__replace(temp.rhs, n, number, name)
+            for i, expr in enumerate(roots):
+                if expr is not None and number[id(expr)] == n:
+                    roots[i] = mypl_ast.SimpleExpr(name)
+                elif expr is not None:
+                    self.__replace(expr, n, number, name)
+            temps.insert(at, assign_stmt)
+
+    # a key equal for expressions evaluated the same way from the same values (their
+    # operands' numbers), starting with 'x' for ones that read input or make an array
+    def __key(self, node, numbers):
+        node_type = type(node)
+        if node_type is mypl_ast.SimpleExpr:
+            return ('s', node.term.type, node.term.lexeme)
+        elif node_type is mypl_ast.ComplexExpr:
+            return ('c', node.rel.type, node.type) + tuple(numbers)
+        elif node_type is mypl_ast.IndexExpr:
+            return ('i', node.identifier.lexeme) + tuple(numbers)
+        elif node_type is mypl_ast.LenExpr:
+            return ('l',) + tuple(numbers)
+        return ('x', id(node))
+
+    # replace the expressions numbered n in a tree (the tree itself aside) with reads
+    # of the variable name
+    def __replace(self, expr, n, number, name):
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            for index, operand in enumerate(operands(node)):
+                if number[id(operand)] == n:
+                    set_operand(node, index, mypl_ast.SimpleExpr(name))
+                else:
+                    stack.append(operand)
+
+    # STATEMENTS
+    # ~~~~~~~~~~
+
+    def visit_stmt_list(self, stmt_list):
+        if self.effects is None:
+            effects = LoopEffects()
+            stmt_list.accept(effects)
+            self.effects = effects.loops
+            self.untyped = untyped_variables(effects.assignments)
+        yield from super().visit_stmt_list(stmt_list)
+
+    def visit_print_stmt(self, print_stmt):
+        yield from super().visit_print_stmt(print_stmt)
+        roots = [print_stmt.expr]
+        self.__hoist_invariants(roots)
+        temps = self.__eliminate(roots, None)
+        print_stmt.expr = roots[0]
+        self.stmts = temps + self.stmts
+
+    def visit_assign_stmt(self, assign_stmt):
+        yield from super().visit_assign_stmt(assign_stmt)
+        roots = [assign_stmt.index_expr, assign_stmt.rhs]
+        self.__hoist_invariants(roots)
+        temps = self.__eliminate(roots, roots[1])
+        assign_stmt.index_expr, assign_stmt.rhs = roots
+        self.stmts = temps + self.stmts
+
+    def visit_len_expr(self, len_expr):
+        yield from super().visit_len_expr(len_expr)
+        if type(len_expr.expr) is not mypl_ast.SimpleExpr:
+            return
+
+        # out of the loops around it that don't change it, innermost first
+        k = None
+        for i in range(len(self.loops) - 1, -1, -1):
+            if not self.__invariant(len_expr.expr, self.loops[i]) or \
+                    not self.__invariant(len_expr, self.loops[i]):
+                break
+            k = i
+        if k != None:
+            self.node = self.__hoist_shared(len_expr, k)
+
+    def visit_if_stmt(self, if_stmt):
+        yield from super().visit_if_stmt(if_stmt)
+        if if_stmt in self.stmts: # (not replaced by a branch)
+            for part in [if_stmt.if_part] + if_stmt.elseifs:
+                self.__hoist_invariants([part.bool_expr])
+
+    def visit_while_stmt(self, while_stmt):
+        loop = self.effects[id(while_stmt)]
+        self.loops.append(loop)
+        yield from super().visit_while_stmt(while_stmt)
+        if len(self.stmts) > 0: # (not removed)
+            self.__hoist_condition(while_stmt.bool_expr)
+            self.stmts = loop.hoisted + self.stmts
+        self.loops.pop()
+
+    def visit_for_stmt(self, for_stmt):
+        loop = self.effects[id(for_stmt)]
+        yield from self.fold_range(for_stmt)
+        roots = [for_stmt.start_expr, for_stmt.end_expr, for_stmt.step_expr]
+        self.__hoist_invariants(roots)
+        for_stmt.start_expr, for_stmt.end_expr, for_stmt.step_expr = roots
+        self.loops.append(loop)
+        yield for_stmt.stmt_list
+        self.loops.pop()
+        self.stmts = loop.hoisted + [for_stmt]
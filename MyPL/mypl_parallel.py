@@ -0,0 +1,131 @@
+#!python3
+# Parallel front end: splits a program between top-level statements and lexes and
+# parses the pieces in a pool of processes
+
+import gc
+import io
+import os
+import re
+import concurrent.futures
+
+import mypl_lexer
+import mypl_parser
+import mypl_ast as ast
+from mypl_token import Token, SourceMap
+
+# Number of pieces per worker process, more pieces even out the load
+PIECES_PER_WORKER = 4
+
+# Programs smaller than this (in characters) are not worth splitting
+MIN_PIECE_SIZE = 1 << 16
+
+# Pre-scan pattern, finds everything that decides where a top-level statement can end:
+# braces and semicolons, outside of strings and comments. Strings end at the first
+# quote not directly after a backslash, as they do in the lexer. A '}' followed by
+# an 'else' continues the same statement (CLOSE_ELSE).
+SCAN_PATTERN = re.compile(r"""
+      "(?:[^"\n]|(?<=\\)")*"
+    | '(?:[^'\n]|(?<=\\)')*'
+    | //[^\n]*
+    | /\*.*?(?:\*/|\Z)
+    | (?P<CLOSE_ELSE>\}(?=(?:\s|//[^\n]*|/\*.*?\*/)*else(?!\w)))
+    | (?P<OPEN>\{)
+    | (?P<CLOSE>\})
+    | (?P<END>;)
+""", re.VERBOSE | re.DOTALL)
+
+def split_points(text, size):
+    """ Get offsets in the text between top-level statements, about size characters apart """
+    points = []
+    depth = 0
+    next_point = size
+    for m in SCAN_PATTERN.finditer(text):
+        kind = m.lastgroup
+        if kind == 'OPEN':
+            depth += 1
+        elif kind == 'CLOSE_ELSE':
+            depth -= 1
+        elif kind == 'CLOSE' or kind == 'END':
+            if kind == 'CLOSE':
+                depth -= 1
+            if depth == 0 and m.end() >= next_point:
+                points.append(m.end())
+                next_point = m.end() + size
+    return points
+
+# Lex and parse text, a piece of a program starting at offset start, on the line
+# numbered line which starts at line_start. Runs in a worker process.
+# returns the list of statements, the source map and anything printed while parsing
+def parse_piece(text, start, line_start, line):
+    gc.disable() # (parsing makes no cyclic garbage, see _parse_pieces)
+
+    lexer = mypl_lexer.Lexer(io.StringIO(text))
+    lexer.base = start
+    lexer.source = SourceMap(line_start, line)
+
+    # (some nodes print themselves while being parsed, keep that in order)
+    output = io.StringIO()
+    ast.print_visitor.output_stream = output
+
+    parser = mypl_parser.Parser(lexer)
+    stmts = []
+    parser.next()
+    while parser.c.type != Token.EOS:
+        stmts.append(parser.parse_stmt())
+        if parser.c.type == Token.RBRACE or \
+                parser.c.type == Token.ELSEIF or \
+                parser.c.type == Token.ELSE:
+            parser.eat(Token.EOS, 'expecting end of file')
+    return stmts, lexer.source, output.getvalue()
+
+def parse(text, workers=None):
+    """ Parse a whole program, the same way Parser.parse() does but in parallel.
+
+    The pieces are parsed independently, so if any of them fails (or the program is
+    too small to split) the program is parsed again in one go, which reports the
+    same first error a sequential parse would.
+    """
+    workers = workers or os.cpu_count() or 1
+    size = max(len(text) // (workers * PIECES_PER_WORKER), MIN_PIECE_SIZE)
+    points = split_points(text, size)
+    if workers > 1 and points:
+        try:
+            return _parse_pieces(text, [0] + points + [len(text)], workers)
+        except Exception:
+            pass # (whatever went wrong, the sequential parse below runs into it too)
+    return mypl_parser.Parser(mypl_lexer.Lexer(io.StringIO(text))).parse()
+
+def _parse_pieces(text, points, workers):
+    # The results are unpickled as they come in, building the whole AST in one go. The
+    # garbage collector would keep scanning it as it grows, without finding anything.
+    if gc.isenabled():
+        gc.disable()
+        try:
+            return _parse_pieces(text, points, workers)
+        finally:
+            gc.enable()
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = []
+        line = 1
+        for i in range(len(points) - 1):
+            start, end = points[i], points[i + 1]
+            if i > 0:
+                line += text.count('\n', points[i - 1], start)
+            line_start = text.rfind('\n', 0, start) + 1
+            futures.append(pool.submit(parse_piece, text[start:end], start, line_start, line))
+        results = [future.result() for future in futures]
+
+    stmt_list = ast.StmtList()
+    previous = None
+    for i, (stmts, source, output) in enumerate(results):
+        # a piece starting part way into a line takes over the column shifts of the
+        # strings and comments before it on that line
+        if previous is not None and source.line_starts[0] < points[i]:
+            source.first_shift = previous.shift(source.line_starts[0], points[i])
+        previous = source
+
+        stmt_list.stmts.extend(stmts)
+        if output:
+            ast.print_visitor.output_stream.write(output)
+    return stmt_list
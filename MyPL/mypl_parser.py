@@ -5,9 +5,32 @@ from mypl_token import *
 import mypl_error
 import mypl_ast as ast
 
-import sys
-import mypl_ast_printer
-print_visitor = mypl_ast_printer.ASTPrintVisitor(sys.stdout)
+# Binary operators (<math_rel> and <bool_rel>) and their weights, see Token.weight()
+OPERATORS = {tokentype: Token.WEIGHTS[tokentype] for tokentype in (
+    Token.PLUS, Token.MINUS, Token.DIVIDE, Token.MULTIPLY, Token.MODULUS,
+    Token.EQUAL, Token.LESS_THAN, Token.GREATER_THAN, Token.LESS_THAN_EQUAL,
+    Token.GREATER_THAN_EQUAL, Token.NOT_EQUAL, Token.AND, Token.OR)}
+
+# Run a parsing function to the end and return what it parsed.
+#
+# Parsing functions are generators: for a nested construct (a block, an expression in
+# parentheses, ...) they yield the parsing function for it and are sent back its
+# result. Nesting is kept on the stack here rather than on the Python call stack, so
+# how deeply a program can nest is only limited by memory.
+def run(parsing):
+    stack = [parsing]
+    result = None
+    while True:
+        try:
+            nested = stack[-1].send(result)
+        except StopIteration as stop:
+            stack.pop()
+            result = stop.value
+            if not stack:
+                return result
+        else:
+            stack.append(nested)
+            result = None
 
 class Parser:
 
@@ -16,7 +39,7 @@ class Parser:
         self.c = None # c - cursor/current token
         self.pc = None # previous current token
 
-    # PRIMARY FUNCTION
+    # PRIMARY FUNCTIONS
     # ------------------------------------------------------------------------------------------
 
     def parse(self):
@@ -26,11 +49,15 @@ class Parser:
         root_node = ast.StmtList()
 
         self.next()
-        self.stmts(root_node)
+        run(self.stmts(root_node))
         self.eat(Token.EOS, 'expecting end of file')
 
         return root_node
 
+    # parse a single statement starting at the current token (e.g. the next top-level one)
+    def parse_stmt(self):
+        return run(self.stmt())
+
     # HELPER FUNCTIONS
     # ------------------------------------------------------------------------------------------
 
@@ -43,7 +70,7 @@ class Parser:
     # If tokentype is True, then always succeeds
     # If tokentype is False, then always fails
     def eat(self, tokentype, error_msg=None):
-        if self.c.type == tokentype or tokentype == True:
+        if self.c.type == tokentype or tokentype is True:
             self.next()
             return tokentype
         else:
@@ -53,7 +80,7 @@ class Parser:
     # eat only if matches the given tokentype and return true,
     # otherwise do nothing and return false
     def optional(self, tokentype):
-        if self.c.type == tokentype or tokentype == True:
+        if self.c.type == tokentype or tokentype is True:
             self.eat(tokentype, None)
             return True
         return False
@@ -64,7 +91,7 @@ class Parser:
     # returns the matching token or throws error if no match
     def require(self, error_msg, *args):
         for tokentype in args:
-            if self.c.type == tokentype or tokentype == True:
+            if self.c.type == tokentype or tokentype is True:
                 self.next()
                 return self.c
             if self.pc.type == tokentype:
@@ -77,7 +104,7 @@ class Parser:
     # If success, returns the first token that was the match
     def any(self, error_msg, *args):
         for tokentype in args:
-            if self.c.type == tokentype or tokentype == True:
+            if self.c.type == tokentype or tokentype is True:
                 token = self.c
                 self.next()
                 return token
@@ -86,7 +113,7 @@ class Parser:
 
     def any_optional(self, *args):
         for tokentype in args:
-            if self.c.type == tokentype or tokentype == True:
+            if self.c.type == tokentype or tokentype is True:
                 token = self.c
                 self.next()
                 return token
@@ -95,7 +122,7 @@ class Parser:
     def error(self, error_msg):
         if error_msg == None:
             error_msg = 'unknown error'
-        error_msg = error_msg + ' instead got ' + self.c.type + '(\'' + self.c.lexeme + '\')'
+        error_msg = error_msg + ' instead got ' + Token.NAMES[self.c.type] + '(\'' + self.c.lexeme + '\')'
         self.c.error(error_msg)
         return
 
@@ -106,44 +133,51 @@ class Parser:
         if stmt_list_node is None:
             stmt_list_node = ast.StmtList()
 
+        while True:
+            ret = yield self.stmt()
+
+            if ret is not None:
+                stmt_list_node.stmts.append(ret)
+
+            # BLOCK EXIT
+            if self.c.type == Token.RBRACE or \
+                    self.c.type == Token.ELSEIF or \
+                    self.c.type == Token.ELSE:
+                return stmt_list_node
+            # END OF STREAM
+            if self.c.type == Token.EOS:
+                return stmt_list_node
+            # Continue...
+
+    # parse a single statement starting at the current token
+    def stmt(self):
         # <output>
         ret = None
         if self.c.type == Token.PRINT:
             self.next()
-            ret = self.output()
+            ret = yield self.output()
         # <output>
         elif self.c.type == Token.PRINTLN:
             self.next()
-            ret = self.output()
+            ret = yield self.output()
         # <assign>
         elif self.c.type == Token.ID:
             self.next()
-            ret = self.assign()
+            ret = yield self.assign()
         # <conditional>
         elif self.c.type == Token.IF:
-            ret = self.cond()
+            ret = yield self.cond()
         # <loop>
         elif self.c.type == Token.WHILE:
-            ret = self.loop()
+            ret = yield self.loop()
+        # <forloop>
+        elif self.c.type == Token.FOR:
+            ret = yield self.forloop()
         # anything else
         else:
-            self.c.error("unexpected token: " + self.c.type + '(\'' + self.c.lexeme + '\')')
+            self.c.error("unexpected token: " + Token.NAMES[self.c.type] + '(\'' + self.c.lexeme + '\')')
 
-        if ret is not None:
-            stmt_list_node.stmts.append(ret)
-
-        # BLOCK EXIT
-        if self.c.type == Token.RBRACE or \
-                self.c.type == Token.ELSEIF or \
-                self.c.type == Token.ELSE:
-            return stmt_list_node
-        # END OF STREAM
-        if self.c.type == Token.EOS:
-            return stmt_list_node
-        # Continue...
-        else:
-            self.stmts(stmt_list_node)
-            return stmt_list_node
+        return ret
 
 
     # PRINT/READ STATEMENTS
@@ -151,136 +185,91 @@ class Parser:
 
     # <input>
     def input(self):
-        read_node = ast.ReadExpr()
-
         which = self.require('expected "readint" or "readstr"', Token.READINT, Token.READSTR).type
-        read_node.which = which
-        read_node.is_read_int = (which == Token.READINT)
 
         self.eat(Token.LPAREN, 'expected "("')
-        read_node.expr = self.expr()
+        expr = yield self.expr()
         self.require('expected ")"', Token.RPAREN)
 
-        return read_node
+        return ast.ReadExpr(expr, which, which == Token.READINT)
 
     # <output>
     def output(self):
-        print_node = ast.PrintStmt()
-
         which = self.require('expected "print" or "println"', Token.PRINT, Token.PRINTLN).type
-        print_node.which = which
-        print_node.is_println = (which == Token.PRINTLN)
 
         self.eat(Token.LPAREN, 'expected "("')
-        print_node.expr = self.expr()
+        expr = yield self.expr()
         self.require('expected ")"', Token.RPAREN)
         self.semicolon()
 
-        return print_node
+        return ast.PrintStmt(expr, which, which == Token.PRINTLN)
 
     # LEN EXPR
     # ------------------------------------------------------------------------------------------
 
     def lenexpr(self):
-        len_node = ast.LenExpr()
-
-        len_node.name = self.require('expected "LEN"', Token.LEN).type
+        name = self.require('expected "LEN"', Token.LEN).type
 
         self.eat(Token.LPAREN, 'expected "("')
-        len_node.expr = self.expr()
+        expr = yield self.expr()
         self.require('expected ")"', Token.RPAREN)
 
-        return len_node
+        return ast.LenExpr(name, expr)
 
     # ASSIGN STATEMENT
     # ------------------------------------------------------------------------------------------
 
     # <assign>
     def assign(self):
-        assign_node = ast.AssignStmt()
-
         # <id>
-        assign_node.lhs = self.require("expected an identifier", Token.ID)
+        lhs = self.require("expected an identifier", Token.ID)
 
         # check for either "[" or "="
         which = self.any('expected "[#]" or "=" after id', Token.LBRACKET, Token.ASSIGN).type
 
         # <listindex> if was "["
+        index_expr = None
         if which == Token.LBRACKET:
-            assign_node.index_expr = self.listindex()
+            index_expr = yield self.listindex()
             self.eat(Token.ASSIGN, 'expected "="')
 
         # <expr>
-        assign_node.rhs = self.expr()
+        rhs = yield self.expr()
         self.semicolon()
 
-        return assign_node
+        return ast.AssignStmt(lhs, index_expr, rhs)
 
     # EXPR/ID/VALUE STATEMENTS
     # ------------------------------------------------------------------------------------------
 
     # <expr>
     def expr(self):
-        items = []
-
-        while True:
-            items.append( self.value() ) # returns an instance of ast.Expr
-
-            op_token = None
-
-            if op_token == None:
-                op_token = self.math_rel_opt() # <math_rel> <expr> -- returns None if not found
-
-            if op_token == None:
-                op_token = self.bool_rel_opt() # <bool_rel> <expr> -- returns None if not found
-
-            if op_token: # If an operator was found, op_token is a Token object
-                items.append(op_token)
-                continue
-
-            break
-
-        return self.exprcompile(items)
-
-    # compile expr items
-    def exprcompile(self, items):
-        if len(items) == 1:
-            return items[0]
-
-        # we have a bunch of operands and operators in a single list, we have to compile them into
-        # groups based on operator priority. Should be left-associative.
-
-        op_weight_idx = None
-        op_weight = None
-
-        for idx, item in enumerate(items):
-            if isinstance(item, Token) and item.weight() > 0:
-                item_weight = item.weight()
-
-                # If there are multiple of the lowest weight, then we use the one to the very right
-                # in order to maintain left-associativity
-                if not op_weight or item_weight <= op_weight:
-                    op_weight = item_weight
-                    op_weight_idx = idx
+        left = yield self.value()
+        return (yield self.exprclimb(left, 1))
+
+    # Apply the operators following the operand `left`, by precedence climbing. Only
+    # operators of at least min_weight are applied, a higher weight binds tighter and
+    # operators of the same weight are left-associative.
+    # e.g. 1 + 2 * 3 - 4 => (1 + (2 * 3)) - 4
+    def exprclimb(self, left, min_weight):
+        weight = OPERATORS.get(self.c.type, 0)
+
+        while weight >= min_weight:
+            op_token = self.c
+            self.next()
+            right = yield self.value()
 
-        # If we didn't find an operator, then that means there's only one item. But the if statement
-        # at the top of this method should've taken care of that. Meaning this if statement should
-        # never be true, if it does evaluate to true then something went very very wrong
-        if not op_weight_idx:
-            items[0].first_token().error('exprcompile - expected a following operator') # This should never happen
+            # operators that bind tighter take the right operand first
+            next_weight = OPERATORS.get(self.c.type, 0)
+            while next_weight > weight:
+                right = yield self.exprclimb(right, weight + 1)
+                next_weight = OPERATORS.get(self.c.type, 0)
 
-        # Split items into two lists with the index of the last lowested weighted operator
-        # We want to perform the lowest-weight operations first and leave the highest-weight for last
-        left_side_items = items[:op_weight_idx]
-        right_side_items = items[op_weight_idx+1:]
-        operator = items[op_weight_idx]
+            left = ast.ComplexExpr(left, op_token, right)
 
-        node = ast.ComplexExpr()
-        node.first_operand = self.exprcompile(left_side_items)
-        node.second_operand = self.exprcompile(right_side_items)
-        node.rel = operator
+            weight = next_weight
 
-        return node
+        return left
 
     # <value>
     def value(self):
@@ -304,22 +293,18 @@ class Parser:
                 self.next()
 
                 # IndexExpr
-                index_node = ast.IndexExpr()
-                index_node.identifier = which
-                index_node.negated = has_not
-                index_node.expr = self.listindex()
-                return index_node
+                return ast.IndexExpr(which, (yield self.listindex()), has_not)
         # ReadStmt
         elif which.type == Token.READINT:
-            return self.input()
+            return (yield self.input())
         elif which.type == Token.READSTR:
-            return self.input()
+            return (yield self.input())
         # LenExpr
         elif which.type == Token.LEN:
-            return self.lenexpr()
+            return (yield self.lenexpr())
         # LPAREN <expr> RPAREN
         elif which.type == Token.LPAREN:
-            nested_expr = self.expr()
+            nested_expr = yield self.expr()
             self.eat(Token.RPAREN, 'expected ")"')
             return nested_expr
         # LBRACKET <exprlist> RBRACKET
@@ -327,47 +312,34 @@ class Parser:
             if has_not:
                 not_token.error('unexpected "not" before list')
 
-            list_node = ast.ListExpr()
-            list_node.lbracket = which
-
             if self.optional(Token.RBRACKET): # empty list
-                return list_node
+                return ast.ListExpr(which, [])
 
-            list_node.expressions = self.exprlist()
+            expressions = yield self.exprlist()
             self.eat(Token.RBRACKET, 'expected "]"')
 
-            return list_node
+            return ast.ListExpr(which, expressions)
 
         # Non-SimpleExpr nodes should be handled in the if-elif block above
         # If not already returned, assume a SimpleExpr using which
 
-        simple_expr_node = ast.SimpleExpr()
-        simple_expr_node.term = which
-        simple_expr_node.negated = has_not
-        return simple_expr_node
+        return ast.SimpleExpr(which, has_not)
 
     # <exprlist>
-    def exprlist(self, list=[]):
+    def exprlist(self):
+        expressions = []
         # empty
         if self.c.is_end():
-            return list
+            return expressions
         # <expr> <exprlisttail>
-        else:
-            list.append(self.expr())
-            list = self.exprlisttail(list)
-            return list
+        expressions.append((yield self.expr()))
 
-    # <exprlisttail>
-    def exprlisttail(self, list):
-        # empty
-        if self.c.type == Token.RBRACKET:
-            return list
-        # COMMA <expr> <exprlisttail>
-        else:
+        # <exprlisttail>
+        # COMMA <expr> <exprlisttail>, until the closing bracket
+        while self.c.type != Token.RBRACKET:
             self.eat(Token.COMMA, 'expected ","')
-            list.append(self.expr())
-            list = self.exprlisttail(list)
-        return list
+            expressions.append((yield self.expr()))
+        return expressions
 
     # <math_rel>
     def math_rel(self):
@@ -384,10 +356,8 @@ class Parser:
         if self.c.is_end():
             return None
         if self.optional(Token.RBRACKET):
-            expr_node = ast.SimpleExpr()
-            expr_node.term = self.lexer.DNE_token()
-            return expr_node
-        expr_node = self.expr()
+            return ast.SimpleExpr(self.lexer.DNE_token())
+        expr_node = yield self.expr()
         self.eat(Token.RBRACKET, 'expected "]"')
         return expr_node
 
@@ -405,7 +375,7 @@ class Parser:
     def bexpr(self):
         token_before_expr = self.c # for errors
 
-        expr = self.expr() # get complex expr
+        expr = yield self.expr() # get complex expr
 
         # ComplexExpr, IndexExpr, SimpleExpr have 'to_bool_expr'
         # ListExpr is not compatible
@@ -438,47 +408,47 @@ class Parser:
     # ------------------------------------------------------------------------------------------
 
     def cond(self):
-        if_stmt = ast.IfStmt()
-
-        if_stmt.which = self.require('expected "if"', Token.IF)
-        if_stmt.if_part.bool_expr = self.bexpr()
+        which = self.require('expected "if"', Token.IF)
+        bool_expr = yield self.bexpr()
         self.eat(Token.LBRACE, 'expected "{" after IF statement condition')
-        if_stmt.if_part.stmt_list = self.stmts()
+        if_part = ast.BasicIf(None, bool_expr, (yield self.stmts()))
 
-        if_stmt = self.condt(if_stmt)
+        if_stmt = yield self.condt(ast.IfStmt(which, if_part))
         return if_stmt
 
     def condt(self, if_stmt):
-        self.require('expected "}" following conditional block', Token.RBRACE)
+        while True:
+            self.require('expected "}" following conditional block', Token.RBRACE)
 
-        which = self.any_optional( # 'expected "else if", "else" or "}"', \
-            Token.ELSEIF, Token.ELSE)
+            which = self.any_optional( # 'expected "else if", "else" or "}"', \
+                Token.ELSEIF, Token.ELSE)
 
-        if which is None:
-            pass
-        elif which.type == Token.ELSEIF:
-            if_stmt.has_else = True
+            if which is None:
+                break
+            elif which.type == Token.ELSEIF:
+                if_stmt.has_else = True
 
-            basic_if_stmt = ast.BasicIf()
-            basic_if_stmt.which = which
+                bool_expr = yield self.bexpr()
+                self.eat(Token.LBRACE, 'expected "{" after ELSEIF statement condition')
 
-            basic_if_stmt.bool_expr = self.bexpr()
-            self.eat(Token.LBRACE, 'expected "{" after ELSEIF statement condition')
-            basic_if_stmt.stmt_list = self.stmts()
+                if_stmt.elseifs.append(ast.BasicIf(which, bool_expr, (yield self.stmts())))
 
-            if_stmt.elseifs.append(basic_if_stmt)
+                continue # check for more ELSEIFs or ELSE
+            elif which.type == Token.ELSE:
+                if_stmt.has_else = True
 
-            if_stmt = self.condt(if_stmt) # recursive call to check for more ELSEIFs or ELSE
-        elif which.type == Token.ELSE:
-            if_stmt.has_else = True
+                self.require('expected "else"', Token.ELSE)
 
-            self.require('expected "else"', Token.ELSE)
+                self.eat(Token.LBRACE, 'expected "{" after ELSE statement')
 
-            self.eat(Token.LBRACE, 'expected "{" after ELSE statement')
+                if_stmt.else_stmts = yield self.stmts()
 
-            if_stmt.else_stmts = self.stmts()
+                self.eat(Token.RBRACE, 'expected "}" following conditional block')
+                break
 
-            self.eat(Token.RBRACE, 'expected "}" following conditional block')
+        # an ELSEIF also sets has_else, the visitors then go through an empty else part
+        if if_stmt.has_else and if_stmt.else_stmts is None:
+            if_stmt.else_stmts = ast.StmtList()
 
         return if_stmt
 
@@ -487,15 +457,37 @@ class Parser:
 
     # <loop>
     def loop(self):
-        while_stmt_node = ast.WhileStmt()
-
-        while_stmt_node.which = self.require('expected "while"', Token.WHILE)
-        while_stmt_node.bool_expr = self.bexpr()
+        which = self.require('expected "while"', Token.WHILE)
+        bool_expr = yield self.bexpr()
         self.eat(Token.LBRACE, 'expected "{" after WHILE statement condition')
-        while_stmt_node.stmt_list = self.stmts()
+        stmt_list = yield self.stmts()
         self.eat(Token.RBRACE, 'expected "}" following conditional repeating block')
 
-        return while_stmt_node
+        return ast.WhileStmt(which, bool_expr, stmt_list)
+
+    # <forloop>
+    # ("to" and "step" aren't keywords, so they can still be variable names)
+    def forloop(self):
+        which = self.any('expected "for"', Token.FOR)
+        var = self.any('expected an identifier after "for"', Token.ID)
+        self.eat(Token.ASSIGN, 'expected "=" after FOR statement variable')
+        start_expr = yield self.expr()
+
+        if self.c.type != Token.ID or self.c.lexeme != 'to':
+            self.error('expected "to" after FOR statement start')
+        self.next()
+        end_expr = yield self.expr()
+
+        step_expr = None
+        if self.c.type == Token.ID and self.c.lexeme == 'step':
+            self.next()
+            step_expr = yield self.expr()
+
+        self.eat(Token.LBRACE, 'expected "{" after FOR statement range')
+        stmt_list = yield self.stmts()
+        self.eat(Token.RBRACE, 'expected "}" following counted repeating block')
+
+        return ast.ForStmt(which, var, start_expr, end_expr, step_expr, stmt_list)
 
 
 
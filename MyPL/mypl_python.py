@@ -0,0 +1,404 @@
+#!python3
+# MyPL to Python transpiler: turns a type checked program into the source of a Python
+# module, which is compiled with compile() and run by CPython itself. The module
+# imports the functions below (and xstr, cast_str and length from mypl_util) for what
+# Python doesn't do the MyPL way.
+
+import sys
+
+from mypl_util import *
+from mypl_token import *
+import mypl_ast
+import mypl_error
+
+# How deep Python source may nest: the tokenizer allows 200 open parentheses and 100
+# levels of indentation (the module's main() takes one). Deeper programs can't be
+# compiled by Python, see run()
+MAX_PARENS = 200
+MAX_INDENT = 98
+
+def transpile(stmt_list, filename='<mypl>'):
+    """ Get the Python module source for a type checked program. Raises SyntaxError if
+    it's nested too deep for Python """
+    transpiler = Transpiler()
+    stmt_list.accept(transpiler)
+    return ''.join(["# MyPL program " + filename + ", transpiled to Python\n",
+                    "from mypl_python import *\n\n",
+                    "def main():\n"] + transpiler.out +
+                   ["\nif __name__ == '__main__':\n",
+                    "    main()\n"])
+
+def compile_program(stmt_list, filename='<mypl>'):
+    """ Transpile and compile a type checked program, returns a function that runs it """
+    namespace = {'__name__': 'mypl_program'}
+    exec(compile(transpile(stmt_list, filename), filename, 'exec'), namespace)
+    return namespace['main']
+
+def run(stmt_list, filename='<mypl>'):
+    """ Transpile, compile and run a type checked program. A program nested too deep for
+    Python is run by the closure compiler instead """
+    try:
+        program = compile_program(stmt_list, filename)
+    except (SyntaxError, RecursionError, MemoryError):
+        import mypl_compiler
+        mypl_compiler.run(stmt_list)
+        return
+    program()
+
+# RUN TIME
+# ------------------------------------------------------------------------------------------
+
+def write(s):
+    sys.stdout.write(s)
+
+def readint(msg):
+    val = input(msg)
+    try:
+        return int(val)
+    except ValueError:
+        return 0
+
+def readstr(msg):
+    return input(msg)
+
+# array[index], index being at line and column of the program
+def at(array, index, line, column):
+    index = int(index)
+    length = len(array)
+    if index >= length or index < 0:
+        raise mypl_error.Error('array index out of bounds! (idx: '+xstr(index)+', len: '+xstr(length)+')',
+                               line, column)
+    return array[index]
+
+# array[index] = value (array[] = value if index is None)
+def store(array, index, value):
+    if index is None:
+        array.append(value)
+    else:
+        array[index] = value
+
+# a + whose operand types weren't known to the type checker (NA)
+def plus(l, r):
+    if type(l) is str:
+        return l + cast_str(r)
+    return l + r
+
+# the values of a for loop counting from start to end by step, the for being at line
+# and column of the program
+def counted(start, end, step, line, column):
+    values = counted_range(start, end, step)
+    if values is None:
+        raise mypl_error.Error("for loop step can't be 0", line, column)
+    return values
+
+# an operator the interpreter doesn't know, at line and column of the program
+def invalid(l, r, line, column):
+    raise mypl_error.Error("unknown or invalid operator", line, column)
+
+# TRANSPILER
+# ------------------------------------------------------------------------------------------
+
+# Python operator for each MyPL arithmetic operator
+ARITHMETIC = {
+    Token.PLUS: ' + ',
+    Token.MINUS: ' - ',
+    Token.MULTIPLY: ' * ',
+    Token.DIVIDE: ' / ',
+    Token.MODULUS: ' % ',
+}
+
+# Python operator for each MyPL comparison
+COMPARISONS = {
+    Token.EQUAL: ' == ',
+    Token.NOT_EQUAL: ' != ',
+    Token.LESS_THAN: ' < ',
+    Token.GREATER_THAN: ' > ',
+    Token.LESS_THAN_EQUAL: ' <= ',
+    Token.GREATER_THAN_EQUAL: ' >= ',
+}
+
+# the Python name of a MyPL variable (prefixed, so it can't be a Python keyword, builtin
+# or one of the functions above)
+def variable(name):
+    if name.isascii():
+        return 'v_' + name
+    return 'u_' + name.encode('utf-8').hex()
+
+class Transpiler(mypl_ast.StackVisitor):
+    """Writes the Python for a type checked AST, as the body of a function.
+
+    The source is written in order into out, a list of strings, statements one per line
+    (or more, for ifs and whiles) and expressions fully parenthesized, so Python groups
+    them as the AST does.
+
+    MyPL variables become local variables of the function. Variables never shadow each
+    other (an assignment to a name in scope assigns that variable), and the type
+    checker rejects reading one outside its environment, so the environments don't
+    need to be kept at run time. A for loop is a Python for over the range of its
+    values.
+    """
+
+    def __init__(self):
+        self.out = []
+        self.indent = 1
+        self.parens = 0
+        self.ranges = 0 # for loops so far, each keeps its range in r_<number>
+
+    # HELPER FUNCTIONS
+    # ~~~~~~~~~~~~~~~~
+
+    def __line(self):
+        self.out.append('    ' * self.indent)
+
+    def __open(self, s='('):
+        self.parens += s.count('(') + s.count('[')
+        if self.parens > MAX_PARENS:
+            raise SyntaxError('too many nested parentheses for Python')
+        self.out.append(s)
+
+    def __close(self, s=')'):
+        self.parens -= s.count(')') + s.count(']')
+        self.out.append(s)
+
+    # visit a statement list indented by one more level
+    def __block(self, stmt_list):
+        self.indent += 1
+        if self.indent > MAX_INDENT:
+            raise SyntaxError('too many levels of indentation for Python')
+        yield stmt_list
+        self.indent -= 1
+
+    # the line and column of a token, as arguments
+    def __position(self, token):
+        line, column = token.source.position(token.offset)
+        return ', ' + str(line) + ', ' + str(column)
+
+    def visit_stmt_list(self, stmt_list):
+        if len(stmt_list.stmts) == 0:
+            self.__line()
+            self.out.append('pass\n')
+        for stmt in stmt_list.stmts:
+            yield stmt
+
+    # PRINT/READ STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_print_stmt(self, print_stmt):
+        self.__line()
+        if is_literal(print_stmt.expr):
+            text = xstr(literal_value(print_stmt.expr.term))
+            if print_stmt.is_println:
+                text += "\n"
+            self.out.append('write(' + repr(text) + ')\n')
+            return
+        self.__open('write(xstr(')
+        yield print_stmt.expr
+        if print_stmt.is_println:
+            self.__close(') + "\\n")\n')
+        else:
+            self.__close('))\n')
+
+    def visit_read_expr(self, read_expr):
+        self.__open('readint(' if read_expr.is_read_int else 'readstr(')
+        yield read_expr.expr
+        self.__close()
+
+    # LEN EXPR
+    # ~~~~~~~~
+
+    def visit_len_expr(self, len_expr):
+        self.__open('length(')
+        yield len_expr.expr
+        self.__close()
+
+    # ASSIGN STATEMENT
+    # ~~~~~~~~~~~~~~~~
+
+    def visit_assign_stmt(self, assign_stmt):
+        name = variable(assign_stmt.lhs.lexeme)
+        self.__line()
+        index_expr = assign_stmt.index_expr
+
+        if index_expr is None:
+            self.out.append(name + ' = ')
+            yield assign_stmt.rhs
+            self.out.append('\n')
+        elif isinstance(index_expr, mypl_ast.SimpleExpr) and index_expr.term.type == Token.DNE:
+            # name[] = rhs
+            self.__open(name + '.append(')
+            yield assign_stmt.rhs
+            self.__close(')\n')
+        else:
+            # (the index is evaluated before the rhs, unlike in name[index] = rhs)
+            self.__open('store(' + name + ', ')
+            yield index_expr
+            self.out.append(', ')
+            yield assign_stmt.rhs
+            self.__close(')\n')
+
+    # EXPR/ID/VALUE STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_expr(self, simple_expr):
+        if simple_expr.term.type == Token.ID:
+            self.out.append(variable(simple_expr.term.lexeme))
+        else:
+            self.out.append(repr(literal_value(simple_expr.term)))
+
+    def visit_index_expr(self, index_expr):
+        self.__open('at(' + variable(index_expr.identifier.lexeme) + ', ')
+        yield index_expr.expr
+        # (a read or len()'s first_token() is the READ*/LEN code, not a token: the
+        # position is that of what it reads or takes the len() of)
+        expr = index_expr.expr
+        while not isinstance(expr.first_token(), Token):
+            while type(expr) is mypl_ast.ComplexExpr:
+                expr = expr.first_operand
+            expr = expr.expr
+        self.__close(self.__position(expr.first_token()) + ')')
+
+    def visit_list_expr(self, list_expr):
+        self.__open('[')
+        for i, expr in enumerate(list_expr.expressions):
+            if i > 0:
+                self.out.append(', ')
+            yield expr
+        self.__close(']')
+
+    def visit_complex_expr(self, complex_expr):
+        rel = complex_expr.rel.type
+        first = complex_expr.first_operand
+        second = complex_expr.second_operand
+
+        # pick the operation by the type the type checker worked out, as the
+        # Interpreter does
+        if rel == Token.PLUS and complex_expr.type == Token.STRING:
+            self.__open()
+            yield first
+            if is_literal(second):
+                self.out.append(' + ' + repr(cast_str(literal_value(second.term))))
+                self.__close()
+            else:
+                self.__open(' + cast_str(')
+                yield second
+                self.__close()
+                self.__close()
+        elif rel == Token.PLUS and complex_expr.type != Token.INT and \
+                complex_expr.type != Token.ARRAY:
+            self.__open('plus(')
+            yield first
+            self.out.append(', ')
+            yield second
+            self.__close()
+        elif rel in ARITHMETIC:
+            self.__open()
+            yield first
+            self.out.append(ARITHMETIC[rel])
+            yield second
+            self.__close()
+        else:
+            self.__open('invalid(')
+            yield first
+            self.out.append(', ')
+            yield second
+            self.__close(self.__position(complex_expr.rel) + ')')
+
+    # BOOLEAN EXPRESSIONS
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_bool_expr(self, simple_bool_expr):
+        self.__open('(not ' if simple_bool_expr.negated else '(not not ')
+        yield simple_bool_expr.expr
+        self.__close()
+
+    def visit_complex_bool_expr(self, complex_bool_expr):
+        rel = complex_bool_expr.bool_rel.type
+
+        # (both sides of a connector are always evaluated, the second can read input,
+        # so they're joined with & and |, their values are always bools)
+        if complex_bool_expr.has_bool_connector:
+            self.__open()
+
+        if rel in COMPARISONS:
+            self.__open()
+            yield complex_bool_expr.first_expr
+            self.out.append(COMPARISONS[rel])
+            yield complex_bool_expr.second_expr
+            self.__close()
+        else:
+            self.__open('invalid(')
+            yield complex_bool_expr.first_expr
+            self.out.append(', ')
+            yield complex_bool_expr.second_expr
+            self.__close(self.__position(complex_bool_expr.bool_rel) + ')')
+
+        if complex_bool_expr.has_bool_connector:
+            if complex_bool_expr.bool_connector.type == Token.AND:
+                self.out.append(' & ')
+            else:
+                self.out.append(' | ')
+            yield complex_bool_expr.second_operand
+            self.__close()
+
+    # IF STATEMENTS
+    # ~~~~~~~~~~~~~
+
+    def visit_if_stmt(self, if_stmt):
+        # IF
+        self.__line()
+        self.out.append('if ')
+        yield if_stmt.if_part.bool_expr
+        self.out.append(':\n')
+        # THEN
+        yield from self.__block(if_stmt.if_part.stmt_list)
+        for elseif in if_stmt.elseifs:
+            # ELSE IF
+            self.__line()
+            self.out.append('elif ')
+            yield elseif.bool_expr
+            self.out.append(':\n')
+            # THEN
+            yield from self.__block(elseif.stmt_list)
+        if if_stmt.has_else:
+            # ELSE
+            self.__line()
+            self.out.append('else:\n')
+            yield from self.__block(if_stmt.else_stmts)
+
+    # LOOP STATEMENTS
+    # ~~~~~~~~~~~~~~~
+
+    def visit_while_stmt(self, while_stmt):
+        # WHILE
+        self.__line()
+        self.out.append('while ')
+        yield while_stmt.bool_expr
+        self.out.append(':\n')
+        # DO
+        yield from self.__block(while_stmt.stmt_list)
+
+    def visit_for_stmt(self, for_stmt):
+        name = variable(for_stmt.var.lexeme)
+        values = 'r_' + str(self.ranges)
+        self.ranges += 1
+
+        # FROM, TO, STEP
+        self.__line()
+        self.__open(values + ' = counted(')
+        yield for_stmt.start_expr
+        self.out.append(', ')
+        yield for_stmt.end_expr
+        self.out.append(', ')
+        if for_stmt.step_expr != None:
+            yield for_stmt.step_expr
+        else:
+            self.out.append('1')
+        self.__close(self.__position(for_stmt.first_token()) + ')\n')
+
+        # FOR
+        self.__line()
+        self.out.append(name + ' = ' + values + '.start\n')
+        self.__line()
+        self.out.append('for ' + name + ' in ' + values + ':\n')
+        # DO
+        yield from self.__block(for_stmt.stmt_list)
@@ -0,0 +1,127 @@
+#!python3
+
+from mypl_token import *
+import mypl_ast
+
+class Resolver(mypl_ast.StackVisitor):
+    """Works out where each variable lives, for the Interpreter.
+
+    Every statement list has an environment, numbered by depth (0 for the outermost),
+    whose variables are numbered by slot in the order they're added. Each variable
+    reference (AssignStmt, and SimpleExpr/IndexExpr of an ID) is annotated with the
+    depth and slot of its variable, and each StmtList with the number of variables in
+    its environment, so the Interpreter can keep an environment as a list.
+
+    Variables are added the way the Interpreter adds them: an assignment to a name
+    that isn't in any enclosing environment adds it to the innermost one. So a name
+    has at most one variable at a time, and nothing shadows.
+    """
+
+    def __init__(self):
+        self.scopes = [] # list of {var_name:slot}
+        self.variables = {} # {var_name:(depth, slot)}
+
+    def visit_stmt_list(self, stmt_list):
+        scope = {}
+        self.scopes.append(scope)
+        for stmt in stmt_list.stmts:
+            yield stmt
+        stmt_list.size = len(scope)
+        self.scopes.pop()
+        for var_name in scope:
+            del self.variables[var_name]
+
+    # PRINT/READ STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_print_stmt(self, print_stmt):
+        yield print_stmt.expr
+
+    def visit_read_expr(self, read_expr):
+        yield read_expr.expr
+
+    # LEN EXPR
+    # ~~~~~~~~
+
+    def visit_len_expr(self, len_expr):
+        yield len_expr.expr
+
+    # ASSIGN STATEMENT
+    # ~~~~~~~~~~~~~~~~
+
+    # the (depth, slot) of the variable an assignment to var_name assigns, added to the
+    # innermost environment if it isn't in any
+    def __variable(self, var_name):
+        variable = self.variables.get(var_name)
+        if variable is None:
+            scope = self.scopes[-1]
+            variable = self.variables[var_name] = (len(self.scopes) - 1, len(scope))
+            scope[var_name] = variable[1]
+        return variable
+
+    def visit_assign_stmt(self, assign_stmt):
+        # (the variable is added before the index and rhs are visited, as the
+        # Interpreter does)
+        assign_stmt.depth, assign_stmt.slot = self.__variable(assign_stmt.lhs.lexeme)
+
+        if assign_stmt.index_expr != None:
+            yield assign_stmt.index_expr
+        yield assign_stmt.rhs
+
+    # EXPR/ID/VALUE STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_expr(self, simple_expr):
+        if simple_expr.term.type == Token.ID:
+            simple_expr.depth, simple_expr.slot = self.variables.get(simple_expr.term.lexeme, (None, None))
+
+    def visit_index_expr(self, index_expr):
+        index_expr.depth, index_expr.slot = self.variables.get(index_expr.identifier.lexeme, (None, None))
+        yield index_expr.expr
+
+    def visit_list_expr(self, list_expr):
+        for expr in list_expr.expressions:
+            yield expr
+
+    def visit_complex_expr(self, complex_expr):
+        yield complex_expr.first_operand
+        yield complex_expr.second_operand
+
+    # BOOLEAN EXPRESSIONS
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_bool_expr(self, simple_bool_expr):
+        yield simple_bool_expr.expr
+
+    def visit_complex_bool_expr(self, complex_bool_expr):
+        yield complex_bool_expr.first_expr
+        yield complex_bool_expr.second_expr
+        if complex_bool_expr.has_bool_connector:
+            yield complex_bool_expr.second_operand
+
+    # IF STATEMENTS
+    # ~~~~~~~~~~~~~
+
+    def visit_if_stmt(self, if_stmt):
+        yield if_stmt.if_part.bool_expr
+        yield if_stmt.if_part.stmt_list
+        for elseif in if_stmt.elseifs:
+            yield elseif.bool_expr
+            yield elseif.stmt_list
+        if if_stmt.has_else:
+            yield if_stmt.else_stmts
+
+    # LOOP STATEMENTS
+    # ~~~~~~~~~~~~~~~
+
+    def visit_while_stmt(self, while_stmt):
+        yield while_stmt.bool_expr
+        yield while_stmt.stmt_list
+
+    def visit_for_stmt(self, for_stmt):
+        yield for_stmt.start_expr
+        yield for_stmt.end_expr
+        if for_stmt.step_expr != None:
+            yield for_stmt.step_expr
+        for_stmt.depth, for_stmt.slot = self.__variable(for_stmt.var.lexeme)
+        yield for_stmt.stmt_list
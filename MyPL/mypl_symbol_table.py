@@ -1,59 +1,93 @@
 #!python3
 
+class Variable:
+    """A variable's type and value. Looking a variable up gives the Variable itself,
+    so it can be checked and then read or written without looking it up again.
+    """
+
+    __slots__ = ('type', 'value')
+
+    def __init__(self):
+        self.type = None
+        self.value = None
+
+    def __repr__(self):
+        return str({'type':self.type, 'value':self.value})
+
 class SymbolTable:
     """A symbol table consists of a stack of environments, where each
     environment maps a variable name to the variable's type and value.
+
+    Each name also has a stack of the variables of that name (one per environment
+    that has it, most recent last), so a lookup takes the same time however many
+    environments there are. The environments double as undo logs: popping one pops
+    the variables it added off their names' stacks.
     """
 
     def __init__(self):
-        self.scopes = [] # list of {var_name:{'type':t, 'value':v}}
+        self.scopes = [] # list of {var_name:Variable}
+        self.variables = {} # {var_name:[Variable, ...]}, for names in any environment
 
-    def __environment(self, var_name):
-        # search from last (most recent) to first environment
-        for i in range(len(self.scopes)-1, -1, -1):
-            if var_name in self.scopes[i]:
-                return self.scopes[i]
-        return None
+    def lookup(self, var_name):
+        """ Get the most recent variable named var_name, or None """
+        shadows = self.variables.get(var_name)
+        if shadows is None:
+            return None
+        return shadows[-1]
 
     def variable_exists(self, var_name):
-        return self.__environment(var_name) != None
+        return self.lookup(var_name) != None
 
     def add_variable(self, var_name):
+        """ Add a variable to the most recent environment, returns the Variable (None
+        if there are no environments) """
         # can't add if no environments
         if len(self.scopes) == 0:
-            return False
+            return None
         # add to the most recently added environemt
-        self.scopes[-1][var_name] = {'type':None, 'value':None}
-        return True
+        var = Variable()
+        scope = self.scopes[-1]
+        if var_name in scope:
+            self.variables[var_name][-1] = var
+        else:
+            self.variables.setdefault(var_name, []).append(var)
+        scope[var_name] = var
+        return var
 
     def get_variable_type(self, var_name):
-        env = self.__environment(var_name)
-        if env != None:
-            return env[var_name]['type']
+        var = self.lookup(var_name)
+        if var != None:
+            return var.type
         return None
 
     def set_variable_type(self, var_name, var_type):
-        env = self.__environment(var_name)
-        if env != None:
-            env[var_name]['type'] = var_type
+        var = self.lookup(var_name)
+        if var != None:
+            var.type = var_type
 
     def get_variable_value(self, var_name):
-        env = self.__environment(var_name)
-        if env != None:
-            return env[var_name]['value']
+        var = self.lookup(var_name)
+        if var != None:
+            return var.value
         return None
 
     def set_variable_value(self, var_name, var_value):
-        env = self.__environment(var_name)
-        if env != None:
-            env[var_name]['value'] = var_value
+        var = self.lookup(var_name)
+        if var != None:
+            var.value = var_value
 
     def push_environment(self):
         self.scopes.append({})
 
     def pop_environment(self):
         if len(self.scopes) > 0:
-            self.scopes.pop()
+            variables = self.variables
+            for var_name in self.scopes.pop():
+                shadows = variables[var_name]
+                if len(shadows) == 1:
+                    del variables[var_name]
+                else:
+                    shadows.pop()
 
     def __str__(self):
-        return str(self.scopes)
\ No newline at end of file
+        return str(self.scopes)
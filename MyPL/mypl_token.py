@@ -1,149 +1,210 @@
 #!python3
 
+import bisect
+from array import array
 import mypl_error
 
+class SourceMap:
+    """Maps character offsets in a source to line/column positions. The lexer
+    records where each line starts as it goes, positions are only worked out when
+    something asks for them (e.g. when an error is reported).
+
+    Columns have always been counted as if a string literal were only as wide as
+    its contents and an EOL comment had no width at all. Each of those records a
+    shift, which is taken off the columns of anything after it on the same line.
+    """
+
+    __slots__ = ('line_starts', 'shift_ends', 'shift_totals', 'first_line', 'first_shift')
+
+    # A map can cover just part of a source (see mypl_parallel), starting on the line
+    # numbered first_line, which starts at offset line_start
+    def __init__(self, line_start=0, first_line=1):
+        # (arrays of machine integers, these grow with the size of the source)
+        self.line_starts = array('q', [line_start]) # offset of the first character of each line
+        self.shift_ends = array('q')        # offset just past each shifted literal/comment
+        self.shift_totals = array('q', [0]) # running total of the shifts, before each one
+        self.first_line = first_line
+        self.first_shift = 0                # shift on the first line, from before the mapped part
+
+    def add_line(self, offset):
+        self.line_starts.append(offset)
+
+    def add_shift(self, end, width):
+        self.shift_ends.append(end)
+        self.shift_totals.append(self.shift_totals[-1] + width)
+
+    def shift(self, line_start, offset):
+        """ Get the total shift of the columns at an offset, on the line starting at line_start """
+        first = bisect.bisect_left(self.shift_ends, line_start)
+        last = bisect.bisect_right(self.shift_ends, offset)
+        shift = self.shift_totals[last] - self.shift_totals[first]
+        if line_start == self.line_starts[0]:
+            shift += self.first_shift
+        return shift
+
+    def position(self, offset):
+        """ Get the (line, column) of an offset, both counted from 1. """
+        line = bisect.bisect_right(self.line_starts, offset)
+        line_start = self.line_starts[line - 1]
+        return line + self.first_line - 1, offset - line_start + 1 - self.shift(line_start, offset)
+
 class Token:
+    """A token is a type code, a lexeme and the offset of the lexeme in the source.
+    Type codes are small integers, Token.NAMES gives the symbolic name of each one.
+    The line and column are looked up from the source's SourceMap when needed.
+    """
+
+    __slots__ = ('type', 'lexeme', 'offset', 'source')
+
     # LANGUAGE-CONSTRUCT FUNCTIONS
-    PRINT = 'PRINT'
-    PRINTLN = 'PRINTLN'
-    READINT = 'READINT'
-    READSTR = 'READSTR'
-    LEN = 'LEN'
+    PRINT = 0
+    PRINTLN = 1
+    READINT = 2
+    READSTR = 3
+    LEN = 4
 
     # LANGUAGE-CONSTRUCT BLOCKS
-    IF = 'IF'
-    THEN = 'THEN'
-    ELSEIF = 'ELSEIF'
-    ELSE = 'ELSE'
-    END = 'END'
-    WHILE = 'WHILE'
-    DO = 'DO'
+    IF = 5
+    THEN = 6
+    ELSEIF = 7
+    ELSE = 8
+    END = 9
+    WHILE = 10
+    DO = 11
 
     # SYNTAX
-    LPAREN = 'LPAREN'
-    RPAREN = 'RPAREN'
-    SEMICOLON = 'SEMICOLON'
-    LBRACKET = 'LBRACKET'
-    RBRACKET = 'RBRACKET'
-    LBRACE = 'LBRACE'
-    RBRACE = 'RBRACE'
-    COMMA = 'COMMA'
+    LPAREN = 12
+    RPAREN = 13
+    SEMICOLON = 14
+    LBRACKET = 15
+    RBRACKET = 16
+    LBRACE = 17
+    RBRACE = 18
+    COMMA = 19
 
-    ID = 'ID'
+    ID = 20
 
     # OPERATORS
-    PLUS = 'PLUS'
-    MINUS = 'MINUS'
-    DIVIDE = 'DIVIDE'
-    MULTIPLY = 'MULTIPLY'
-    MODULUS = 'MODULUS'
+    PLUS = 21
+    MINUS = 22
+    DIVIDE = 23
+    MULTIPLY = 24
+    MODULUS = 25
 
     # BOOLEAN OPERATORS
-    NOT = 'NOT'
-    AND = 'AND'
-    OR = 'OR'
-    EQUAL = 'EQUAL'
-    NOT_EQUAL = 'NOT_EQUAL'
-    LESS_THAN = 'LESS_THAN'
-    GREATER_THAN = 'GREATER_THAN'
-    LESS_THAN_EQUAL = 'LESS_THAN_EQUAL'
-    GREATER_THAN_EQUAL = 'GREATER_THAN_EQUAL'
+    NOT = 26
+    AND = 27
+    OR = 28
+    EQUAL = 29
+    NOT_EQUAL = 30
+    LESS_THAN = 31
+    GREATER_THAN = 32
+    LESS_THAN_EQUAL = 33
+    GREATER_THAN_EQUAL = 34
 
     # LITERALS
-    STRING = 'STRING'
-    INT = 'INT'
-    BOOL = 'BOOL'
-    ASSIGN = 'ASSIGN'
-    ARRAY = 'ARRAY'
+    STRING = 35
+    INT = 36
+    BOOL = 37
+    ASSIGN = 38
+    ARRAY = 39
 
     # NULL-LIKE TYPES
-    NA = 'NA' # Not Available (there is a non-null type, but we're not sure what it is until runtime)
+    NA = 40 # Not Available (there is a non-null type, but we're not sure what it is until runtime)
 
     # SPECIAL
-    EOS = 'EOS'
-    DNE = 'DNE'
+    EOS = 41
+    DNE = 42
+
+    # LANGUAGE-CONSTRUCT BLOCKS (added later, numbered after the rest so the codes
+    # above keep their values)
+    FOR = 43
 
-    def __init__(self, type, lexeme, line, column):
+    def __init__(self, type, lexeme, offset, source):
         self.type   = type
         self.lexeme = lexeme
-        self.line   = line
-        self.column = column
+        self.offset = offset
+        self.source = source # SourceMap
+
+    @property
+    def line(self):
+        return self.source.position(self.offset)[0]
+
+    @property
+    def column(self):
+        return self.source.position(self.offset)[1]
 
     def __str__(self):
+        line, column = self.source.position(self.offset)
         s = ''
-        s += str(self.type)
+        s += Token.NAMES[self.type]
         s += ' '
         s += "'"+str(self.lexeme)+"'"
         s += ' '
-        s += str(self.line)+':'+str(self.column)
+        s += str(line)+':'+str(column)
         return s
 
     def error(self, error_msg):
-        raise mypl_error.Error(error_msg, self.line, self.column)
+        line, column = self.source.position(self.offset)
+        raise mypl_error.Error(error_msg, line, column, self)
+
+    # pickled as a plain constructor call (e.g. sending parsed pieces of a program back
+    # from the worker processes of mypl_parallel)
+    def __reduce__(self):
+        return (Token, (self.type, self.lexeme, self.offset, self.source))
 
     def is_end(self):
         return self.type == Token.EOS or self.type == Token.SEMICOLON
 
     def weight(self):
         """ Get operator weight, non-operators have a weight of 0. A higher weight means more priority. """
+        return Token.WEIGHTS[self.type]
 
-        # Math operators
-
-        if self.type == Token.PLUS:
-            return 100
-        elif self.type == Token.MINUS:
-            return 100
-        elif self.type == Token.DIVIDE:
-            return 200
-        elif self.type == Token.MULTIPLY:
-            return 200
-        elif self.type == Token.MODULUS:
-            return 200
-
-        # Boolean operators
-
-        elif self.type == Token.AND:
-            return 400
-        elif self.type == Token.OR:
-            return 400
-
-        # Comparison operators
-
-        elif self.type == Token.NOT:
-            return 300
-        elif self.type == Token.EQUAL:
-            return 300
-        elif self.type == Token.NOT_EQUAL:
-            return 300
-        elif self.type == Token.LESS_THAN:
-            return 300
-        elif self.type == Token.GREATER_THAN:
-            return 300
-        elif self.type == Token.LESS_THAN_EQUAL:
-            return 300
-        elif self.type == Token.GREATER_THAN_EQUAL:
-            return 300
-
-        # Non-operators
-
-        else:
-            return 0
+    @staticmethod
+    def type_name(type):
+        """ Get the symbolic name of a token type code, for error messages and printing. """
+        if type is None:
+            return None
+        return Token.NAMES[type]
 
     @staticmethod
     def token_from_native(value):
-        x = type(value).__name__
-
-        if x == 'str':
-            return Token.STRING
-        elif x == 'int':
-            return Token.INT
-        elif x == 'float':
-            pass
-        elif x == 'list':
-            return Token.ARRAY
-        elif x == 'tuple':
-            return Token.ARRAY
-        elif x == 'bool':
-            return Token.BOOL
-
-        return Token.NA
\ No newline at end of file
+        return Token.NATIVE_TYPES.get(type(value), Token.NA)
+
+# Symbolic names, indexed by type code
+Token.NAMES = tuple(sorted((name for name, value in vars(Token).items() if type(value) is int),
+                           key=lambda name: getattr(Token, name)))
+
+# Token types of native values, see token_from_native()
+Token.NATIVE_TYPES = {
+    str: Token.STRING,
+    int: Token.INT,
+    list: Token.ARRAY,
+    tuple: Token.ARRAY,
+    bool: Token.BOOL,
+}
+
+# Operator weights, indexed by type code
+Token.WEIGHTS = tuple({
+    # Math operators
+    Token.PLUS: 100,
+    Token.MINUS: 100,
+    Token.DIVIDE: 200,
+    Token.MULTIPLY: 200,
+    Token.MODULUS: 200,
+
+    # Boolean operators
+    Token.AND: 400,
+    Token.OR: 400,
+
+    # Comparison operators
+    Token.NOT: 300,
+    Token.EQUAL: 300,
+    Token.NOT_EQUAL: 300,
+    Token.LESS_THAN: 300,
+    Token.GREATER_THAN: 300,
+    Token.LESS_THAN_EQUAL: 300,
+    Token.GREATER_THAN_EQUAL: 300,
+
+    # Non-operators have a weight of 0
+}.get(code, 0) for code in range(len(Token.NAMES)))
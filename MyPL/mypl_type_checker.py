@@ -10,7 +10,7 @@ import mypl_symbol_table
 #import mypl_ast_printer
 #print_visitor = mypl_ast_printer.ASTPrintVisitor(sys.stdout)
 
-class TypeChecker(mypl_ast.Visitor):
+class TypeChecker(mypl_ast.StackVisitor):
 
     def __init__(self):
         self.sym = mypl_symbol_table.SymbolTable()
@@ -19,15 +19,16 @@ class TypeChecker(mypl_ast.Visitor):
     def visit_stmt_list(self, stmt_list):
         self.sym.push_environment()
         for stmt in stmt_list.stmts:
-            stmt.accept(self)
+            yield stmt
         self.sym.pop_environment()
 
     # HELPER FUNCTIONS
     # ~~~~~~~~~~~~~~~~
 
     def __gettype_or_fail(self, identifier):
-        if self.sym.variable_exists(identifier.lexeme):
-            return self.sym.get_variable_type(identifier.lexeme)
+        var = self.sym.lookup(identifier.lexeme)
+        if var != None:
+            return var.type
         else:
             identifier.error("undefined variable '"+xstr(identifier.lexeme)+"'")
             return None
@@ -51,10 +52,10 @@ class TypeChecker(mypl_ast.Visitor):
     # ~~~~~~~~~~~~~~~~~~~~~
 
     def visit_print_stmt(self, print_stmt):
-        print_stmt.expr.accept(self)
+        yield print_stmt.expr
 
     def visit_read_expr(self, read_expr):
-        read_expr.expr.accept(self)
+        yield read_expr.expr
         if read_expr.is_read_int:
             self.ctype = Token.INT
         else:
@@ -64,7 +65,8 @@ class TypeChecker(mypl_ast.Visitor):
     # ~~~~~~~~
 
     def visit_len_expr(self, len_expr):
-        len_expr.expr.accept(self)
+        yield len_expr.expr
+        self.ctype = Token.INT
 
     # ASSIGN STATEMENT
     # ~~~~~~~~~~~~~~~~
@@ -74,37 +76,37 @@ class TypeChecker(mypl_ast.Visitor):
         var_name = assign_stmt.lhs.lexeme
         is_index = False
 
-        # accept indexed ID (modifing element of variable instead of variable)
+        # visit indexed ID (modifing element of variable instead of variable)
         if assign_stmt.index_expr != None:
-            assign_stmt.index_expr.accept(self)
+            yield assign_stmt.index_expr
             is_index = True
 
-        # accept rhs
-        assign_stmt.rhs.accept(self)
+        # visit rhs
+        yield assign_stmt.rhs
 
         # get type of variable, or add it if it doesn't exist
-        if self.sym.variable_exists(var_name):
-            var_type = self.sym.get_variable_type(var_name)
+        var = self.sym.lookup(var_name)
+        if var != None:
+            var_type = var.type
 
             if is_index:
                 if var_type == Token.ARRAY or var_type == Token.STRING:
                     return
                 else:
-                    assign_stmt.first_token().error("cannot access index on the type " + xstr(var_type))
+                    assign_stmt.first_token().error("cannot access index on the type " + xstr(Token.type_name(var_type)))
                     return
 
             # check if match
             if self.ctype != var_type and var_type != Token.NA and self.ctype != Token.NA:
-                assign_stmt.first_token().error("expected " + xstr(var_type) + " for '" + \
-                    xstr(var_name) + "', got " + xstr(self.ctype))
+                assign_stmt.first_token().error("expected " + xstr(Token.type_name(var_type)) + " for '" + \
+                    xstr(var_name) + "', got " + xstr(Token.type_name(self.ctype)))
             else:
-                self.sym.set_variable_type(var_name, self.ctype)
+                var.type = self.ctype
         else:
             if is_index:
                 assign_stmt.first_token().error("cannot access index on nonexistent variable, " + xstr(var_name))
 
-            self.sym.add_variable(var_name)
-            self.sym.set_variable_type(var_name, self.ctype)
+            self.sym.add_variable(var_name).type = self.ctype
 
 
     # EXPR/ID/VALUE STATEMENTS
@@ -130,14 +132,14 @@ class TypeChecker(mypl_ast.Visitor):
         array_type = self.__gettype_or_fail(index_expr.identifier)
 
         if array_type != Token.ARRAY and array_type != Token.STRING:
-            index_expr.identifier.error("expected an array or string type for index access on '" + xstr(array_name) + "', got " + xstr(array_type))
+            index_expr.identifier.error("expected an array or string type for index access on '" + xstr(array_name) + "', got " + xstr(Token.type_name(array_type)))
 
-        # accept index expressions
-        index_expr.expr.accept(self)
+        # visit index expressions
+        yield index_expr.expr
 
         # indices should be ints
         if self.ctype != Token.INT and self.ctype != Token.NA:
-            index_expr.first_token().error('expected INT, got ' + xstr(self.ctype))
+            index_expr.first_token().error('expected INT, got ' + xstr(Token.type_name(self.ctype)))
 
         # set current type
         self.ctype = Token.NA
@@ -149,25 +151,25 @@ class TypeChecker(mypl_ast.Visitor):
 
         # Make sure everything in the array has the same type
         for expr in list_expr.expressions:
-            expr.accept(self)
+            yield expr
             item_type = self.ctype
 
             if common_type == None:
                 common_type = item_type
             elif item_type != common_type:
-                expr.first_token().error("expected " + xstr(common_type) + ", got " + xstr(item_type))
+                expr.first_token().error("expected " + xstr(Token.type_name(common_type)) + ", got " + xstr(Token.type_name(item_type)))
 
         # Set to curren type to array type of common_type
         self.ctype = Token.ARRAY
 
     def visit_complex_expr(self, complex_expr):
-        # accept left operand
-        complex_expr.first_operand.accept(self)
+        # visit left operand
+        yield complex_expr.first_operand
         left_type = self.ctype
         rel = complex_expr.rel
 
-        # accept right operand
-        complex_expr.second_operand.accept(self)
+        # visit right operand
+        yield complex_expr.second_operand
         right_type = self.ctype
 
         # Both operands must be of same type
@@ -179,7 +181,7 @@ class TypeChecker(mypl_ast.Visitor):
                 # If either operand is NA, then ctype should become name
                 self.ctype = Token.NA
             else:
-                complex_expr.second_operand.first_token().error("expected " + xstr(left_type) + ", got " + xstr(right_type))
+                complex_expr.second_operand.first_token().error("expected " + xstr(Token.type_name(left_type)) + ", got " + xstr(Token.type_name(right_type)))
         else:
             # ctype should right now be set to right_type
             # left_type and right_type are the same, so no need to change anything
@@ -187,53 +189,56 @@ class TypeChecker(mypl_ast.Visitor):
 
         if left_type == Token.ARRAY:
             if rel != Token.PLUS:
-                rel.error("cannot perform " + rel.type + " on ARRAY type")
+                rel.error("cannot perform " + Token.NAMES[rel.type] + " on ARRAY type")
         elif left_type == Token.INT:
             if self.__checkrel_int(rel) == False:
-                rel.error("cannot perform " + rel.type + " on INT type")
+                rel.error("cannot perform " + Token.NAMES[rel.type] + " on INT type")
         elif left_type == Token.STRING:
             if self.__checkrel_string(rel) == False:
-                rel.error("cannot perform " + rel.type + " on STRING type")
+                rel.error("cannot perform " + Token.NAMES[rel.type] + " on STRING type")
         elif left_type == Token.BOOL:
             if self.__checkrel_bool(rel) == False:
-                rel.error("cannot perform " + rel.type + " on BOOL type")
+                rel.error("cannot perform " + Token.NAMES[rel.type] + " on BOOL type")
+
+        # keep the type for the interpreter, which picks the operation by it
+        complex_expr.type = self.ctype
 
     # BOOLEAN EXPRESSIONS
     # ~~~~~~~~~~~~~~~~~~~
 
     def visit_simple_bool_expr(self, simple_bool_expr):
-        simple_bool_expr.expr.accept(self)
+        yield simple_bool_expr.expr
 
         if self.ctype != Token.BOOL and self.ctype != Token.NA:
-            simple_bool_expr.expr.first_token().error('condition must be of BOOL type, instead got ' + xstr(self.ctype))
+            simple_bool_expr.expr.first_token().error('condition must be of BOOL type, instead got ' + xstr(Token.type_name(self.ctype)))
 
     def visit_complex_bool_expr(self, complex_bool_expr):
-        complex_bool_expr.first_expr.accept(self)
+        yield complex_bool_expr.first_expr
         first_type = self.ctype
 
-        complex_bool_expr.second_expr.accept(self)
+        yield complex_bool_expr.second_expr
         second_type = self.ctype
 
         # Both operands must be of same type
         if first_type != second_type:
-            complex_bool_expr.second_expr.first_token().error('expected '+xstr(first_type)+', got ' + xstr(second_type))
+            complex_bool_expr.second_expr.first_token().error('expected '+xstr(Token.type_name(first_type))+', got ' + xstr(Token.type_name(second_type)))
 
         # Check operator
         if first_type == Token.INT:
             if self.__checkrel_compare(complex_bool_expr.bool_rel) == False:
                 complex_bool_expr.bool_rel.error( \
-                    'cannot use ' + complex_bool_expr.bool_rel.type + ' to compare INT types')
+                    'cannot use ' + Token.NAMES[complex_bool_expr.bool_rel.type] + ' to compare INT types')
         elif first_type == Token.BOOL:
             if self.__checkrel_bool(complex_bool_expr.bool_rel) == False:
                 complex_bool_expr.bool_rel.error( \
-                    'cannot use ' + complex_bool_expr.bool_rel.type + ' to compare BOOL types')
+                    'cannot use ' + Token.NAMES[complex_bool_expr.bool_rel.type] + ' to compare BOOL types')
         else:
-            complex_bool_expr.first_expr.first_token().error('encountered uncomparable type ' + xstr(first_type))
+            complex_bool_expr.first_expr.first_token().error('encountered uncomparable type ' + xstr(Token.type_name(first_type)))
 
         if complex_bool_expr.has_bool_connector:
             # 'second_operand' is either a complex or simple bool expr, both of which
             # will set ctype to BOOL. So no need to check anything here.
-            complex_bool_expr.second_operand.accept(self)
+            yield complex_bool_expr.second_operand
 
         self.ctype = Token.BOOL
 
@@ -242,24 +247,47 @@ class TypeChecker(mypl_ast.Visitor):
 
     def visit_if_stmt(self, if_stmt):
         # IF
-        if_stmt.if_part.bool_expr.accept(self)
+        yield if_stmt.if_part.bool_expr
         # THEN
-        if_stmt.if_part.stmt_list.accept(self)
+        yield if_stmt.if_part.stmt_list
         for elseif in if_stmt.elseifs:
             # ELSE IF
-            elseif.bool_expr.accept(self)
+            yield elseif.bool_expr
             # THEN
-            elseif.stmt_list.accept(self)
+            yield elseif.stmt_list
         if if_stmt.has_else:
             # ELSE
-            if_stmt.else_stmts.accept(self)
+            yield if_stmt.else_stmts
 
     # LOOP STATEMENTS
     # ~~~~~~~~~~~~~~~
 
     def visit_while_stmt(self, while_stmt):
         # WHILE
-        while_stmt.bool_expr.accept(self)
+        yield while_stmt.bool_expr
         # DO
-        while_stmt.stmt_list.accept(self)
+        yield while_stmt.stmt_list
+
+    def visit_for_stmt(self, for_stmt):
+        # FROM, TO, STEP
+        for expr in (for_stmt.start_expr, for_stmt.end_expr, for_stmt.step_expr):
+            if expr != None:
+                yield expr
+                if self.ctype != Token.INT and self.ctype != Token.NA:
+                    for_stmt.first_token().error("expected INT for FOR statement range, got " + \
+                        xstr(Token.type_name(self.ctype)))
+
+        # the variable is assigned like in an assignment, it's always an INT
+        var_name = for_stmt.var.lexeme
+        var = self.sym.lookup(var_name)
+        if var != None:
+            if var.type != Token.INT and var.type != Token.NA:
+                for_stmt.var.error("expected " + xstr(Token.type_name(var.type)) + " for '" + \
+                    xstr(var_name) + "', got INT")
+            else:
+                var.type = Token.INT
+        else:
+            self.sym.add_variable(var_name).type = Token.INT
 
+        # DO
+        yield for_stmt.stmt_list
@@ -1,3 +1,10 @@
+import os
+import sys
+import mmap
+
+from mypl_token import Token
+import mypl_ast
+
 def xstr(x):
     if type(x) is bool:
         if x == True:
@@ -6,4 +13,66 @@ def xstr(x):
             return "false"
     if x == None:
         return '<UNDEFINED>'
-    return str(x)
\ No newline at end of file
+    return str(x)
+
+# a value as string concatenation (the right operand of a STRING +) shows it
+def cast_str(x):
+    if type(x) is bool:
+        if x == True:
+            return "true"
+        else:
+            return "false"
+    if x == None:
+        return ''
+    return str(x)
+
+# the value len() gives (-1 for a value without a length)
+def length(val):
+    if type(val) in (tuple, list):
+        return len(val)
+    elif isinstance(val, str):
+        return len(val)
+    elif hasattr(val, "__len__"):
+        return val.__len__()
+    else:
+        return -1
+
+# the value of a MyPL literal
+def literal_value(term):
+    if term.type == Token.INT:
+        return int(term.lexeme)
+    elif term.type == Token.BOOL:
+        return True if term.lexeme == "true" else False
+    elif term.type == Token.STRING:
+        return term.lexeme
+    else: # DNE
+        return None
+
+def is_literal(expr):
+    return isinstance(expr, mypl_ast.SimpleExpr) and expr.term.type != Token.ID
+
+# open a source code file for the lexer, a filename of '-' reads the program from stdin
+def open_source(filename):
+    if filename == '-':
+        return sys.stdin
+    return open(filename, 'r')
+
+# map a source code file into memory for the lexer to read in place (stdin can't be
+# mapped and is read as usual)
+def map_source(filename):
+    if filename == '-':
+        return sys.stdin
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+# the values of a for loop counting from start to end (included) by step, None if the
+# step is 0
+def counted_range(start, end, step):
+    start, end, step = int(start), int(end), int(step)
+    if step > 0:
+        return range(start, end + 1, step)
+    elif step < 0:
+        return range(start, end - 1, step)
+    return None
@@ -0,0 +1,556 @@
+#!python3
+# Bytecode compiler and virtual machine: compiles a type checked program into a flat
+# array of instructions for a stack machine, with ifs and loops turned into jumps,
+# and runs them in one loop
+
+import sys
+from array import array
+
+from mypl_util import *
+from mypl_token import *
+import mypl_ast
+
+class Op:
+    """Instruction codes. An instruction is two ints in the code array, the code and
+    an argument (0 if the instruction takes none). Op.NAMES gives the name of each.
+    """
+
+    # VALUES
+    CONST = 0           # push constants[arg]
+    LOAD = 1            # push the variable in slot arg
+    STORE = 2           # pop into the variable in slot arg
+    STORE_INDEX = 3     # pop value, pop index, slot arg [index] = value (appends if index is None)
+    APPEND = 4          # pop value, append it to slot arg
+    INDEX = 5           # pop index, push slot arg [index] (bounds checked)
+    BUILD_LIST = 6      # pop arg values, push a list of them
+
+    # ARITHMETIC (pop right, pop left, push left <op> right). Except for CONCAT and
+    # PLUS, a literal right operand isn't pushed but given as the argument, its index
+    # in the constants + 1 (0 for none)
+    ADD = 7
+    SUBTRACT = 8
+    MULTIPLY = 9
+    DIVIDE = 10
+    MODULUS = 11
+    CONCAT = 12         # left + the right as a string
+    PLUS = 13           # CONCAT if left is a string, else ADD (operand types not known)
+
+    # COMPARISONS (pop right, pop left, push left <op> right, the right operand can be
+    # the argument as for ARITHMETIC)
+    EQUAL = 14
+    NOT_EQUAL = 15
+    LESS_THAN = 16
+    GREATER_THAN = 17
+    LESS_THAN_EQUAL = 18
+    GREATER_THAN_EQUAL = 19
+
+    # BOOLEANS
+    AND = 20            # pop right, pop left, push left and right (both already evaluated)
+    OR = 21
+    NOT = 22            # push not pop
+    BOOL = 23           # push True if pop else False
+
+    # JUMPS (arg is the index of the target instruction in the code array)
+    JUMP = 24
+    JUMP_IF_FALSE = 25  # pop, jump if false
+
+    # FOR LOOPS
+    RANGE = 26          # pop step, pop end, pop start, push an iterator over the values, push start
+    FOR_ITER = 27       # the next value of the iterator on top into slot arg and skip the next
+                        # instruction (the jump out of the loop), or pop the iterator if done
+
+    # BUILT IN FUNCTIONS
+    PRINT = 28          # pop and write it
+    PRINTLN = 29        # pop and write it and a newline
+    READINT = 30        # pop prompt, push the int read (0 if not an int)
+    READSTR = 31        # pop prompt, push the string read
+    LEN = 32            # push the length of pop
+
+    INVALID = 33        # pop right, pop left, fail with unknown or invalid operator
+    HALT = 34
+
+# instruction code -> name
+Op.NAMES = {code: name for name, code in vars(Op).items() if not name.startswith('_')}
+
+ARITHMETIC = {
+    Token.PLUS: Op.ADD,
+    Token.MINUS: Op.SUBTRACT,
+    Token.MULTIPLY: Op.MULTIPLY,
+    Token.DIVIDE: Op.DIVIDE,
+    Token.MODULUS: Op.MODULUS,
+}
+
+COMPARISONS = {
+    Token.EQUAL: Op.EQUAL,
+    Token.NOT_EQUAL: Op.NOT_EQUAL,
+    Token.LESS_THAN: Op.LESS_THAN,
+    Token.GREATER_THAN: Op.GREATER_THAN,
+    Token.LESS_THAN_EQUAL: Op.LESS_THAN_EQUAL,
+    Token.GREATER_THAN_EQUAL: Op.GREATER_THAN_EQUAL,
+}
+
+class Program:
+    """A compiled program: the code array, the constants and variables its
+    instructions refer to, and the tokens to report run time errors at.
+
+    Every variable has one slot (variables never shadow each other, and the type
+    checker rejects reading one outside its environment, so the environments don't
+    need to be kept at run time).
+    """
+
+    def __init__(self):
+        self.code = array('i')
+        self.constants = []     # values of CONST
+        self.names = []         # variable name of each slot
+        self.tokens = {}        # {index of INDEX/INVALID/RANGE instruction: token to fail at}
+        self.statements = []    # (index of first instruction, token or None) of each statement
+
+def compile_program(stmt_list):
+    """ Compile a type checked program into a Program """
+    compiler = Compiler()
+    stmt_list.accept(compiler)
+    compiler.emit(Op.HALT)
+    return compiler.program
+
+def run(stmt_list):
+    """ Compile a type checked program and run it """
+    execute(compile_program(stmt_list))
+
+# COMPILER
+# ------------------------------------------------------------------------------------------
+
+class Compiler(mypl_ast.StackVisitor):
+    """Compiles a type checked AST into a Program. Expressions leave their value on
+    top of the stack, statements leave the stack as they found it (a for loop keeps
+    its iterator on the stack while its body runs).
+    """
+
+    def __init__(self):
+        self.program = Program()
+        self.slots = {} # {var_name: slot}
+        self.constants = {} # {(type, value): index in program.constants}
+
+    # HELPER FUNCTIONS
+    # ~~~~~~~~~~~~~~~~
+
+    # append an instruction, returns its index
+    def emit(self, op, arg=0):
+        code = self.program.code
+        code.append(op)
+        code.append(arg)
+        return len(code) - 2
+
+    # point the jump at index to the next instruction
+    def patch(self, index):
+        self.program.code[index + 1] = len(self.program.code)
+
+    def slot(self, var_name):
+        if var_name not in self.slots:
+            self.slots[var_name] = len(self.program.names)
+            self.program.names.append(var_name)
+        return self.slots[var_name]
+
+    def constant(self, value):
+        # (keyed by type too, 1 == True)
+        key = (type(value), value)
+        if key not in self.constants:
+            self.constants[key] = len(self.program.constants)
+            self.program.constants.append(value)
+        return self.constants[key]
+
+    # a condition for a jump, (BOOL is left out, the jump tests the value itself)
+    def __condition(self, bool_expr):
+        yield bool_expr
+        code = self.program.code
+        if code[-2] == Op.BOOL:
+            del code[-2:]
+
+    # an arithmetic or comparison instruction, with its right operand
+    def __operator(self, op, second):
+        if is_literal(second):
+            self.emit(op, self.constant(literal_value(second.term)) + 1)
+        else:
+            yield second
+            self.emit(op)
+
+    # note where a statement's code starts, and the token it starts at (for the
+    # disassembler, the first_token() of a print statement is the PRINT code)
+    def __statement(self, stmt):
+        token = stmt.first_token()
+        if isinstance(stmt, mypl_ast.PrintStmt):
+            token = stmt.expr.first_token()
+        if not isinstance(token, Token):
+            token = None
+        self.program.statements.append((len(self.program.code), token))
+
+    def visit_stmt_list(self, stmt_list):
+        for stmt in stmt_list.stmts:
+            self.__statement(stmt)
+            yield stmt
+
+    # PRINT/READ STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_print_stmt(self, print_stmt):
+        yield print_stmt.expr
+        self.emit(Op.PRINTLN if print_stmt.is_println else Op.PRINT)
+
+    def visit_read_expr(self, read_expr):
+        yield read_expr.expr
+        self.emit(Op.READINT if read_expr.is_read_int else Op.READSTR)
+
+    # LEN EXPR
+    # ~~~~~~~~
+
+    def visit_len_expr(self, len_expr):
+        yield len_expr.expr
+        self.emit(Op.LEN)
+
+    # ASSIGN STATEMENT
+    # ~~~~~~~~~~~~~~~~
+
+    def visit_assign_stmt(self, assign_stmt):
+        slot = self.slot(assign_stmt.lhs.lexeme)
+        index_expr = assign_stmt.index_expr
+
+        if index_expr is None:
+            yield assign_stmt.rhs
+            self.emit(Op.STORE, slot)
+        elif isinstance(index_expr, mypl_ast.SimpleExpr) and index_expr.term.type == Token.DNE:
+            # name[] = rhs
+            yield assign_stmt.rhs
+            self.emit(Op.APPEND, slot)
+        else:
+            yield index_expr
+            yield assign_stmt.rhs
+            self.emit(Op.STORE_INDEX, slot)
+
+    # EXPR/ID/VALUE STATEMENTS
+    # ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_expr(self, simple_expr):
+        term = simple_expr.term
+        if term.type == Token.ID:
+            self.emit(Op.LOAD, self.slot(term.lexeme))
+        else:
+            self.emit(Op.CONST, self.constant(literal_value(term)))
+
+    def visit_index_expr(self, index_expr):
+        yield index_expr.expr
+        index = self.emit(Op.INDEX, self.slot(index_expr.identifier.lexeme))
+        self.program.tokens[index] = index_expr.expr.first_token()
+
+    def visit_list_expr(self, list_expr):
+        for expr in list_expr.expressions:
+            yield expr
+        self.emit(Op.BUILD_LIST, len(list_expr.expressions))
+
+    def visit_complex_expr(self, complex_expr):
+        first = complex_expr.first_operand
+        second = complex_expr.second_operand
+        rel = complex_expr.rel.type
+        yield first
+
+        # pick the operation by the type the type checker worked out, as the
+        # Interpreter does
+        if rel == Token.PLUS and complex_expr.type == Token.STRING:
+            if is_literal(second):
+                # (cast once here)
+                self.emit(Op.ADD, self.constant(cast_str(literal_value(second.term))) + 1)
+            else:
+                yield second
+                self.emit(Op.CONCAT)
+        elif rel == Token.PLUS and complex_expr.type != Token.INT and \
+                complex_expr.type != Token.ARRAY:
+            yield second
+            self.emit(Op.PLUS)
+        elif rel in ARITHMETIC:
+            yield from self.__operator(ARITHMETIC[rel], second)
+        else:
+            yield second
+            index = self.emit(Op.INVALID)
+            self.program.tokens[index] = complex_expr.rel
+
+    # BOOLEAN EXPRESSIONS
+    # ~~~~~~~~~~~~~~~~~~~
+
+    def visit_simple_bool_expr(self, simple_bool_expr):
+        yield simple_bool_expr.expr
+        self.emit(Op.NOT if simple_bool_expr.negated else Op.BOOL)
+
+    def visit_complex_bool_expr(self, complex_bool_expr):
+        yield complex_bool_expr.first_expr
+        rel = complex_bool_expr.bool_rel.type
+
+        if rel in COMPARISONS:
+            yield from self.__operator(COMPARISONS[rel], complex_bool_expr.second_expr)
+        else:
+            yield complex_bool_expr.second_expr
+            index = self.emit(Op.INVALID)
+            self.program.tokens[index] = complex_bool_expr.bool_rel
+
+        # (both sides are always evaluated, the second can read input)
+        if complex_bool_expr.has_bool_connector:
+            yield complex_bool_expr.second_operand
+            if complex_bool_expr.bool_connector.type == Token.AND:
+                self.emit(Op.AND)
+            else:
+                self.emit(Op.OR)
+
+    # IF STATEMENTS
+    # ~~~~~~~~~~~~~
+
+    def visit_if_stmt(self, if_stmt):
+        ends = [] # jumps past the whole if statement
+
+        # IF
+        yield from self.__condition(if_stmt.if_part.bool_expr)
+        skip = self.emit(Op.JUMP_IF_FALSE)
+        # THEN
+        yield if_stmt.if_part.stmt_list
+
+        for elseif in if_stmt.elseifs:
+            ends.append(self.emit(Op.JUMP))
+            self.patch(skip)
+            # ELSE IF
+            yield from self.__condition(elseif.bool_expr)
+            skip = self.emit(Op.JUMP_IF_FALSE)
+            # THEN
+            yield elseif.stmt_list
+
+        if if_stmt.has_else and len(if_stmt.else_stmts.stmts) > 0:
+            ends.append(self.emit(Op.JUMP))
+            self.patch(skip)
+            # ELSE
+            yield if_stmt.else_stmts
+        else:
+            self.patch(skip)
+
+        for end in ends:
+            self.patch(end)
+
+    # LOOP STATEMENTS
+    # ~~~~~~~~~~~~~~~
+
+    def visit_while_stmt(self, while_stmt):
+        # WHILE
+        start = len(self.program.code)
+        yield from self.__condition(while_stmt.bool_expr)
+        end = self.emit(Op.JUMP_IF_FALSE)
+        # DO
+        yield while_stmt.stmt_list
+        self.emit(Op.JUMP, start)
+        self.patch(end)
+
+    def visit_for_stmt(self, for_stmt):
+        slot = self.slot(for_stmt.var.lexeme)
+
+        # FROM, TO, STEP
+        yield for_stmt.start_expr
+        yield for_stmt.end_expr
+        if for_stmt.step_expr != None:
+            yield for_stmt.step_expr
+        else:
+            self.emit(Op.CONST, self.constant(1))
+        index = self.emit(Op.RANGE)
+        self.program.tokens[index] = for_stmt.first_token()
+        self.emit(Op.STORE, slot)
+
+        # FOR
+        start = self.emit(Op.FOR_ITER, slot)
+        end = self.emit(Op.JUMP)
+        # DO
+        yield for_stmt.stmt_list
+        self.emit(Op.JUMP, start)
+        self.patch(end)
+
+# VIRTUAL MACHINE
+# ------------------------------------------------------------------------------------------
+
+def execute(program):
+    """ Run a Program """
+    code = program.code.tolist() # (faster to index than the array)
+    constants = program.constants
+    variables = [None] * len(program.names)
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    write = sys.stdout.write
+    pc = 0
+
+    # (locals, Op's attributes would be looked up on every comparison)
+    CONST, LOAD, STORE, STORE_INDEX, APPEND, INDEX = Op.CONST, Op.LOAD, Op.STORE, Op.STORE_INDEX, Op.APPEND, Op.INDEX
+    BUILD_LIST, ADD, SUBTRACT, MULTIPLY, DIVIDE = Op.BUILD_LIST, Op.ADD, Op.SUBTRACT, Op.MULTIPLY, Op.DIVIDE
+    MODULUS, CONCAT, PLUS, EQUAL, NOT_EQUAL = Op.MODULUS, Op.CONCAT, Op.PLUS, Op.EQUAL, Op.NOT_EQUAL
+    LESS_THAN, GREATER_THAN = Op.LESS_THAN, Op.GREATER_THAN
+    LESS_THAN_EQUAL, GREATER_THAN_EQUAL = Op.LESS_THAN_EQUAL, Op.GREATER_THAN_EQUAL
+    AND, OR, NOT, BOOL, JUMP, JUMP_IF_FALSE = Op.AND, Op.OR, Op.NOT, Op.BOOL, Op.JUMP, Op.JUMP_IF_FALSE
+    RANGE, FOR_ITER = Op.RANGE, Op.FOR_ITER
+    PRINT, PRINTLN, READINT, READSTR, LEN = Op.PRINT, Op.PRINTLN, Op.READINT, Op.READSTR, Op.LEN
+    INVALID, HALT = Op.INVALID, Op.HALT
+
+    # (the most common instructions first)
+    while True:
+        op = code[pc]
+        arg = code[pc + 1]
+        pc += 2
+        if op == LOAD:
+            push(variables[arg])
+        elif op == CONST:
+            push(constants[arg])
+        elif op == STORE:
+            variables[arg] = pop()
+        elif op == JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == FOR_ITER:
+            value = next(stack[-1], None)
+            if value is None:
+                pop()
+            else:
+                variables[arg] = value
+                pc += 2
+        elif op == ADD:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] + r
+        elif op == SUBTRACT:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] - r
+        elif op == LESS_THAN:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] < r
+        elif op == GREATER_THAN:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] > r
+        elif op == EQUAL:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] == r
+        elif op == NOT_EQUAL:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] != r
+        elif op == LESS_THAN_EQUAL:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] <= r
+        elif op == GREATER_THAN_EQUAL:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] >= r
+        elif op == MULTIPLY:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] * r
+        elif op == DIVIDE:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] / r
+        elif op == MODULUS:
+            r = constants[arg - 1] if arg else pop()
+            stack[-1] = stack[-1] % r
+        elif op == CONCAT:
+            r = pop()
+            stack[-1] = stack[-1] + cast_str(r)
+        elif op == INDEX:
+            index = int(pop())
+            array = variables[arg]
+            size = len(array)
+            if index >= size or index < 0:
+                program.tokens[pc - 2].error(
+                    'array index out of bounds! (idx: '+xstr(index)+', len: '+xstr(size)+')')
+            push(array[index])
+        elif op == PRINTLN:
+            write(xstr(pop()) + "\n")
+        elif op == PRINT:
+            write(xstr(pop()))
+        elif op == STORE_INDEX:
+            value = pop()
+            index = pop()
+            if index is None:
+                variables[arg].append(value)
+            else:
+                variables[arg][index] = value
+        elif op == APPEND:
+            variables[arg].append(pop())
+        elif op == PLUS:
+            r = pop()
+            l = stack[-1]
+            if type(l) is str:
+                stack[-1] = l + cast_str(r)
+            else:
+                stack[-1] = l + r
+        elif op == AND:
+            r = pop()
+            stack[-1] = stack[-1] and r
+        elif op == OR:
+            r = pop()
+            stack[-1] = stack[-1] or r
+        elif op == NOT:
+            stack[-1] = not stack[-1]
+        elif op == BOOL:
+            stack[-1] = True if stack[-1] else False
+        elif op == BUILD_LIST:
+            if arg == 0:
+                push([])
+            else:
+                items = stack[-arg:]
+                del stack[-arg:]
+                push(items)
+        elif op == LEN:
+            stack[-1] = length(stack[-1])
+        elif op == RANGE:
+            step = pop()
+            end = pop()
+            values = counted_range(pop(), end, step)
+            if values is None:
+                program.tokens[pc - 2].error("for loop step can't be 0")
+            push(iter(values))
+            push(values.start)
+        elif op == READINT:
+            val = input(pop())
+            try:
+                push(int(val))
+            except ValueError:
+                push(0)
+        elif op == READSTR:
+            push(input(pop()))
+        elif op == INVALID:
+            pop()
+            pop()
+            program.tokens[pc - 2].error("unknown or invalid operator")
+        elif op == HALT:
+            return
+
+# DISASSEMBLER
+# ------------------------------------------------------------------------------------------
+
+def disassemble(program, output_stream=sys.stdout):
+    """ Write the instructions of a Program, one per line, with the source line of each
+    statement and the targets of jumps (>>) marked """
+    code = program.code
+    targets = {code[i + 1] for i in range(0, len(code), 2)
+               if code[i] == Op.JUMP or code[i] == Op.JUMP_IF_FALSE}
+    statements = dict(program.statements)
+
+    for i in range(0, len(code), 2):
+        op = code[i]
+        arg = code[i + 1]
+
+        line = ''
+        if i in statements:
+            if statements[i] != None:
+                line = str(statements[i].line)
+            if i > 0:
+                output_stream.write('\n')
+
+        if op == Op.CONST:
+            detail = '(' + repr(program.constants[arg]) + ')'
+        elif op in (Op.LOAD, Op.STORE, Op.STORE_INDEX, Op.APPEND, Op.INDEX, Op.FOR_ITER):
+            detail = '(' + program.names[arg] + ')'
+        elif op in (Op.JUMP, Op.JUMP_IF_FALSE, Op.BUILD_LIST):
+            detail = ''
+        elif arg > 0:
+            detail = '(' + repr(program.constants[arg - 1]) + ')'
+        else:
+            arg = ''
+            detail = ''
+
+        output_stream.write(('%5s %3s %5d %-20s %5s %s' % (
+            line, '>>' if i in targets else '', i, Op.NAMES[op], arg, detail)).rstrip() + '\n')